@@ -1,17 +1,22 @@
 from dataclasses import dataclass
+import asyncio
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.openai import OpenAIModel
 from api.config import config
+from api.agents import registry, scheduler, telemetry
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from .tools.web_scraper import WebScraperTool, WebScraperInput, WebScraperOutput
-from .tools.google_search import GoogleSearchTool, GoogleSearchInput, GoogleSearchOutput
+from .tools.google_search import GoogleSearchTool, GoogleSearchInput, GoogleSearchOutput, SearchResult
 from .stride import Threat
 
 
 @dataclass
 class Deps:
-    topic: str
+    # Client-provided Google credentials, falling back to the server ones when missing
+    google_api_key: Optional[str] = None
+    google_cse_id: Optional[str] = None
+    # What scraped pages are searched for when the model doesn't say, i.e. the threat being mitigated
+    query: Optional[str] = None
 
 class MitigationResponse(BaseModel):
     content: str = Field(description="The mitigation strategy to apply to the threat")
@@ -19,19 +24,13 @@ class MitigationResponse(BaseModel):
 
 class MitigationAgent:
     def __init__(self, api_keys: Dict[str, str] = None):
-        self.api_keys = api_keys
-        self._init_agent()
-
-    def _init_agent(self):
-        openai_api_key = self.api_keys.get("openai_api_key", config.OPENAI_API_KEY)
-        
-        model = OpenAIModel(
-            model_name="gpt-4o",
-            api_key=openai_api_key
-        )
+        self.api_keys = api_keys or {}
+        self.agent = registry.get_agent("mitigation", self._build_agent)
 
+    @staticmethod
+    def _build_agent() -> Agent:
+        """Builds the agent and its tools once per process; the model and Google keys are injected per run."""
         agent = Agent(
-            model=model,
             system_prompt=[
                 "You are a security expert specializing in mitigation for threat identified in threat modeling exercise",
                 "Your mitigation should based on given threat category and the recommendation aspect should follow the associated security control as context to help reducing or eliminating risk",
@@ -54,15 +53,15 @@ class MitigationAgent:
                 "Use research_web_security_topic to research a web security topic.",
             ],
             result_type=MitigationResponse,
-            deps_type=str,
+            deps_type=Deps,
         )
 
-        # Initialize tools
+        # Initialize tools, shared by every run
         web_scraper = WebScraperTool()
         google_search = GoogleSearchTool()
 
         @agent.tool
-        async def search_web(ctx: RunContext, query: str, site: Optional[str] = "owasp.org", num_results: int = 5):
+        async def search_web(ctx: RunContext[Deps], query: str, site: Optional[str] = "owasp.org", num_results: int = 5):
             """
             Search the web for information related to web security.
 
@@ -80,29 +79,35 @@ class MitigationAgent:
                 site=site,
                 num_results=num_results
             )
-            return google_search.search(search_input)
+            with telemetry.span("search_web"):
+                return await google_search.asearch(search_input, ctx.deps.google_api_key, ctx.deps.google_cse_id)
 
         @agent.tool
-        async def scrape_webpage(ctx: RunContext, url: str, include_links: bool = True):
+        async def scrape_webpage(ctx: RunContext[Deps], url: str, query: Optional[str] = None, include_links: bool = True):
             """
-            Scrape a webpage and extract its content in readable markdown format.
+            Scrape a webpage and extract the passages most relevant to a query in readable markdown format.
 
             Args:
                 ctx: The run context
                 url: The URL of the webpage to scrape
+                query: What to look for in the page (defaults to the threat being mitigated)
                 include_links: Whether to preserve hyperlinks in the markdown output
 
             Returns:
-                The scraped content as markdown and metadata about the page
+                The most relevant passages as markdown with their offsets in the page, and metadata about the page
             """
             scraper_input = WebScraperInput(
                 url=url,
                 include_links=include_links
             )
-            return web_scraper.scrape(scraper_input)
+            query = query or ctx.deps.query
+            with telemetry.span("scrape_webpage"):
+                if not query:
+                    return await web_scraper.ascrape(scraper_input)
+                return await web_scraper.apassages(scraper_input, query, config.SCRAPE_MAX_PASSAGES, config.SCRAPE_PASSAGE_CHARS)
 
         @agent.tool
-        async def research_web_security_topic(ctx: RunContext, topic: str, depth: int = 2):
+        async def research_web_security_topic(ctx: RunContext[Deps], topic: str, depth: int = 2):
             """
             Perform deep research on a web security topic by searching OWASP and other security resources.
 
@@ -114,44 +119,78 @@ class MitigationAgent:
             Returns:
                 A comprehensive report on the topic
             """
-            # Search OWASP for the topic
-            owasp_results = google_search.search(GoogleSearchInput(
-                query=topic,
-                site="owasp.org",
-                num_results=5
-            ))
-
-            # Search more generally if needed
-            general_results = google_search.search(GoogleSearchInput(
-                query=f"web security {topic}",
-                num_results=5
-            ))
+            with telemetry.span("research_web_security_topic", depth=depth):
+                return await research(ctx.deps, topic, depth)
+
+        async def research(deps: Deps, topic: str, depth: int) -> Dict[str, Any]:
+            # Search OWASP and more generally in parallel
+            owasp_results, general_results = await asyncio.gather(
+                google_search.asearch(GoogleSearchInput(
+                    query=topic,
+                    site="owasp.org",
+                    num_results=5
+                ), deps.google_api_key, deps.google_cse_id),
+                google_search.asearch(GoogleSearchInput(
+                    query=f"web security {topic}",
+                    num_results=5
+                ), deps.google_api_key, deps.google_cse_id),
+            )
 
             # Collect all results
             all_results = []
             all_results.extend(owasp_results.results)
             all_results.extend(general_results.results)
 
-            # Scrape the most relevant pages based on depth
+            # Scrape the most relevant pages based on depth, concurrently and within an overall deadline
             pages_to_scrape = all_results[:depth]
+            scrape_slots = asyncio.Semaphore(config.RESEARCH_SCRAPE_CONCURRENCY)
+
+            async def scrape_page(result: SearchResult) -> Dict[str, Any]:
+                async with scrape_slots:
+                    try:
+                        # The passages about the topic rather than the start of the page, usually navigation
+                        scrape_result = await web_scraper.apassages(WebScraperInput(
+                            url=result.link,
+                            include_links=True,
+                            max_bytes=config.RESEARCH_MAX_BYTES
+                        ), topic, config.SCRAPE_MAX_PASSAGES, config.RESEARCH_PASSAGE_CHARS)
+                        return {
+                            "title": result.title,
+                            "url": result.link,
+                            "passages": [
+                                {"heading": p.heading, "content": p.text, "start": p.start, "end": p.end}
+                                for p in scrape_result.passages
+                            ]
+                        }
+                    except Exception as e:
+                        return {
+                            "title": result.title,
+                            "url": result.link,
+                            "error": str(e)
+                        }
+
+            tasks = [asyncio.create_task(scrape_page(result)) for result in pages_to_scrape]
+            done = set()
+            try:
+                if tasks:
+                    done, _ = await asyncio.wait(tasks, timeout=config.RESEARCH_DEADLINE)
+            finally:
+                # Also stops the scrapes when the research itself is cancelled
+                for task in tasks:
+                    if not task.done():
+                        task.cancel()
+
+            # Keep whatever finished in time, mark the rest as timed out
             scraped_content = []
-
-            for result in pages_to_scrape:
-                try:
-                    scrape_result = web_scraper.scrape(WebScraperInput(
-                        url=result.link,
-                        include_links=True
-                    ))
-                    scraped_content.append({
-                        "title": result.title,
-                        "url": result.link,
-                        "content": scrape_result.content[:1000] + "..." if len(scrape_result.content) > 1000 else scrape_result.content
-                    })
-                except Exception as e:
+            for result, task in zip(pages_to_scrape, tasks):
+                if task in done:
+                    scraped_content.append(task.result())
+                else:
                     scraped_content.append({
                         "title": result.title,
                         "url": result.link,
-                        "error": str(e)
+                        "error": f"Timed out after {config.RESEARCH_DEADLINE}s",
+                        "timed_out": True
                     })
 
             return {
@@ -160,7 +199,7 @@ class MitigationAgent:
                 "detailed_content": scraped_content
             }
 
-        self.agent = agent
+        return agent
 
     async def run(self, threat: Threat, context: str):
         """Run the agent with the given user input"""
@@ -176,4 +215,11 @@ class MitigationAgent:
             f"Context: {context}\n\n"
         )
 
-        return await self.agent.run(mitigation_prompt)
+        deps = Deps(
+            google_api_key=self.api_keys.get("google_api_key"),
+            google_cse_id=self.api_keys.get("google_cse_id"),
+            query=f"{threat.name} {threat.attack_vectors}",
+        )
+        # Mitigations are long write-ups; the pages tool calls feed back are counted with each request's messages
+        with telemetry.span("mitigation"):
+            return await scheduler.run_agent(self.agent, mitigation_prompt, self.api_keys, output_tokens=4000, deps=deps)
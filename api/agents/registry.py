@@ -0,0 +1,49 @@
+import time
+from typing import Callable, Dict, Optional, Tuple
+from pydantic_ai import Agent
+from pydantic_ai.models.openai import OpenAIModel
+from api.config import config
+
+MODEL_NAME = "gpt-4o"
+
+# Agents are built once per process; the model is chosen per run
+_agents: Dict[str, Agent] = {}
+# (model name, API key) -> (model, last used)
+_models: Dict[Tuple[str, str], Tuple[OpenAIModel, float]] = {}
+
+
+def get_agent(name: str, build: Callable[[], Agent]) -> Agent:
+    """Returns the process-wide agent registered under `name`, building it on first use."""
+    agent = _agents.get(name)
+    if agent is None:
+        agent = _agents[name] = build()
+    return agent
+
+
+def get_model(api_keys: Optional[Dict[str, str]] = None, model_name: str = MODEL_NAME) -> OpenAIModel:
+    """
+    Returns a pooled model client for the request's OpenAI key (or the server key).
+    All pooled models share pydantic-ai's cached HTTP client, so TLS connections to the
+    LLM endpoint are reused across requests and keys. Clients idle for longer than
+    MODEL_POOL_IDLE_TTL are dropped.
+    """
+    api_key = (api_keys or {}).get("openai_api_key", config.OPENAI_API_KEY)
+    now = time.monotonic()
+    _evict_idle(now)
+
+    key = (model_name, api_key)
+    entry = _models.get(key)
+    model = entry[0] if entry else OpenAIModel(model_name=model_name, api_key=api_key)
+    _models[key] = (model, now)
+    return model
+
+
+def _evict_idle(now: float) -> None:
+    for key, (_, last_used) in list(_models.items()):
+        if now - last_used > config.MODEL_POOL_IDLE_TTL:
+            del _models[key]
+    # Drop the least recently used clients above the size bound
+    if len(_models) > config.MODEL_POOL_MAX_SIZE:
+        by_age = sorted(_models.items(), key=lambda item: item[1][1])
+        for key, _ in by_age[:len(_models) - config.MODEL_POOL_MAX_SIZE]:
+            del _models[key]
@@ -2,8 +2,7 @@ from dataclasses import dataclass
 from typing import List, Optional, Set, Dict, Any
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.openai import OpenAIModel
-from api.config import config
+from api.agents import registry, scheduler
 
 # Define structured output models
 class Relationship(BaseModel):
@@ -34,19 +33,13 @@ class Deps:
 
 class RelationshipAgent:
     def __init__(self, api_keys: Dict[str, str] = None):
-        self.api_keys = api_keys
-        self._init_agent()
+        self.api_keys = api_keys or {}
+        self.agent = registry.get_agent("relationship", self._build_agent)
 
-    def _init_agent(self):
-        openai_api_key = self.api_keys.get("openai_api_key", config.OPENAI_API_KEY)
-        
-        model = OpenAIModel(
-            model_name="gpt-4o",
-            api_key=openai_api_key
-        )
-        
+    @staticmethod
+    def _build_agent() -> Agent:
+        """Builds the agent once per process; the model is picked per run from the API key."""
         agent = Agent(
-            model=model,
             system_prompt=[
                 "You are a specialized infrastructure and application security expert.",
                 "Your tasks are:",
@@ -94,7 +87,7 @@ class RelationshipAgent:
                 context="The system is a web application that allows users to manage their finances. It is hosted on an EC2 instance and has a public-facing internet endpoint."
             )
 
-        self.agent = agent
+        return agent
 
     async def run(self, user_input: str) -> RelationshipModelOutput:
         """
@@ -106,8 +99,35 @@ class RelationshipAgent:
         Returns:
             Structured relationships
         """
-        result = await self.agent.run(user_input)
+        result = await scheduler.run_agent(self.agent, user_input, self.api_keys)
         
         # The analyze_relationship tool will be called by the model and return a RelationshipModelOutput
         return result
+
+    async def enrich(self, user_input: str, relationships: List[Relationship]) -> RelationshipModelOutput:
+        """
+        Run the relationship analysis on input whose relationships were already parsed from its diagrams,
+        only asking the model for richer descriptions, the context, and relationships the diagrams don't show
+        
+        Args:
+            user_input: The user's description of their system or security concern
+            relationships: The relationships parsed from the diagrams, in order
+            
+        Returns:
+            Structured relationships, the parsed ones first and in the same order
+        """
+        parsed = "\n".join(
+            f"{i}. {r.source} {r.direction} {r.target}" + (f": {r.description}" if r.description else "")
+            for i, r in enumerate(relationships)
+        )
+        prompt = (
+            "The relationships below were parsed from the diagrams in the user input, in order.\n"
+            "Return them first, in the same order and with the same source, target and direction, "
+            "rewriting each description with the technical details the input gives about that flow. "
+            "Then append any relationship the text describes that the diagrams don't show.\n\n"
+            f"Relationships:\n{parsed}\n\n"
+            f"User input:\n{user_input}"
+        )
+        result = await scheduler.run_agent(self.agent, prompt, self.api_keys)
+        return result
         
\ No newline at end of file
@@ -0,0 +1,329 @@
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Mapping, Optional, Tuple, TypeVar
+import httpx
+from pydantic_ai import Agent
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.models import Model, ModelRequestParameters
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import Usage
+from api.agents import registry, telemetry
+from api.config import config
+
+try:
+    import openai
+except ImportError:  # pragma: no cover - installed with pydantic-ai[openai]
+    openai = None
+
+T = TypeVar("T")
+
+# Rough token estimate for prompts, about 4 characters per token for English text
+CHARS_PER_TOKEN = 4
+_RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Calls made while handling one client request share a flow; waiting calls are served round-robin
+# across flows, so a large threat model can't starve a small one started after it
+flow: ContextVar[str] = ContextVar("scheduler_flow", default="default")
+
+
+def start_flow() -> None:
+    """Starts a new flow for the calls made from the current task and the tasks it creates."""
+    flow.set(uuid.uuid4().hex)
+
+
+class RetryLater(Exception):
+    """Raised by a scheduled call for a transient failure (rate limited, overloaded) worth retrying."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from `retry-after-ms` or `Retry-After` (seconds or an HTTP date)."""
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_hint(error: Exception) -> Tuple[bool, Optional[float]]:
+    """Whether the error is worth retrying, and the server's Retry-After when it sent one."""
+    if isinstance(error, RetryLater):
+        return True, error.retry_after
+    if isinstance(error, ModelHTTPError):
+        if error.status_code not in _RETRYABLE_STATUS:
+            return False, None
+        # An exhausted billing quota is reported as a 429 too, but won't recover by waiting
+        if isinstance(error.body, dict) and error.body.get("code") == "insufficient_quota":
+            return False, None
+        response = getattr(error.__cause__, "response", None)
+        return True, parse_retry_after(response.headers) if response is not None else None
+    if isinstance(error, httpx.TransportError):
+        return True, None
+    if openai is not None and isinstance(error, openai.APIConnectionError):
+        return True, None
+    return False, None
+
+
+class TokenBucket:
+    """Refills `per_minute` tokens per minute, up to one minute's worth."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        # May go negative when a call used more than estimated, delaying the next ones
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class Limiter:
+    """
+    Rate limits the calls made with one API key: requests per minute, and optionally tokens per minute.
+    Waiting calls are granted in round-robin order across flows.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.granted = 0
+        self.paused_until = 0.0
+        self._queues: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {}
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def acquire(self, cost: float = 0) -> None:
+        """Waits until a request (and `cost` tokens) may be sent."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queues.setdefault(flow.get(), deque()).append((future, cost))
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._dispatcher = loop.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._queues:
+            flow_id, queue = next(iter(self._queues.items()))
+            future, cost = queue[0]
+            if not future.cancelled():
+                now = time.monotonic()
+                delay = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(cost, now) if self.tokens else 0.0,
+                )
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                self.requests.take(1)
+                if self.tokens:
+                    self.tokens.take(cost)
+                self.granted += 1
+                future.set_result(None)
+            queue.popleft()
+            # Move the flow to the back of the line
+            del self._queues[flow_id]
+            if queue:
+                self._queues[flow_id] = queue
+
+    def settle(self, estimated: float, actual: float) -> None:
+        """Corrects the token bucket once the real usage of a call is known."""
+        if self.tokens:
+            self.tokens.take(actual - estimated)
+
+    def pause(self, seconds: float) -> None:
+        """Holds every call with this key, e.g. after the provider answered 429."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "granted": self.granted,
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "flows": len(self._queues),
+        }
+
+
+class Scheduler:
+    """
+    Shared scheduler for LLM and search calls: rate limits them per provider and API key, and retries
+    transient failures with exponential backoff and jitter, honoring Retry-After.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        # provider -> (requests per minute, tokens per minute or 0)
+        self.limits = limits
+        self.retries = 0
+        self.failures = 0
+        self._limiters: Dict[Tuple[str, str], Limiter] = {}
+
+    def limiter(self, provider: str, api_key: str) -> Limiter:
+        # Keys are only kept hashed
+        key = (provider, hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16])
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = Limiter(*self.limits[provider])
+        return limiter
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # Spread the callers that were told the same Retry-After
+            return retry_after + random.uniform(0, config.SCHEDULER_BASE_DELAY)
+        return random.uniform(0, min(config.SCHEDULER_MAX_DELAY, config.SCHEDULER_BASE_DELAY * 2 ** attempt))
+
+    async def call(
+        self,
+        provider: str,
+        api_key: str,
+        fn: Callable[[], Awaitable[T]],
+        cost: float = 0,
+        usage: Optional[Callable[[T], float]] = None,
+    ) -> T:
+        """
+        Runs `fn()` once the key's limiter allows it, retrying transient failures.
+
+        Args:
+            provider: Which limits apply, e.g. "openai" or "google"
+            api_key: The key the call is made with
+            fn: Makes the call; may be called again on retry
+            cost: Estimated tokens the call will use
+            usage: Returns the tokens the call actually used, to settle the estimate
+        """
+        limiter = self.limiter(provider, api_key)
+        attempt = 0
+        while True:
+            queued = time.perf_counter()
+            await limiter.acquire(cost)
+            telemetry.add("queue_seconds", time.perf_counter() - queued)
+            try:
+                result = await fn()
+            except Exception as e:
+                retryable, retry_after = _retry_hint(e)
+                delay = self.backoff(attempt, retry_after) if retryable else 0.0
+                if not retryable or attempt >= config.SCHEDULER_MAX_RETRIES or delay > config.SCHEDULER_MAX_DELAY:
+                    self.failures += 1
+                    raise
+                if retry_after is not None:
+                    limiter.pause(delay)
+                attempt += 1
+                self.retries += 1
+                telemetry.add("retries")
+                await asyncio.sleep(delay)
+                continue
+            if usage:
+                limiter.settle(cost, usage(result))
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Retry counters since process start, plus the state of every limiter by provider."""
+        providers: Dict[str, Dict[str, int]] = {}
+        for (provider, _), limiter in self._limiters.items():
+            totals = providers.setdefault(provider, {"keys": 0, "granted": 0, "waiting": 0})
+            totals["keys"] += 1
+            totals["granted"] += limiter.granted
+            totals["waiting"] += limiter.stats()["waiting"]
+        return {"retries": self.retries, "failures": self.failures, "providers": providers}
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """Returns the process-wide scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler({
+            "openai": (config.OPENAI_RPM, config.OPENAI_TPM),
+            "google": (config.GOOGLE_SEARCH_QPM, 0),
+        })
+    return _scheduler
+
+
+def _message_chars(messages: List[ModelMessage]) -> int:
+    """Length of the text of the messages sent in a model request: prompts, tool calls and tool results."""
+    chars = 0
+    for message in messages:
+        for part in message.parts:
+            content = getattr(part, "content", None)
+            if content is None:
+                content = getattr(part, "args", None)
+            chars += len(content) if isinstance(content, str) else len(str(content or ""))
+    return chars
+
+
+class ScheduledModel(WrapperModel):
+    """
+    Sends every request of an agent run through the scheduler, so a run making several model requests
+    (tool calls) is charged one request each, and a transient failure only retries that request
+    instead of the whole run and the tool calls it already made.
+    """
+
+    def __init__(self, wrapped: Model, api_key: str, output_tokens: int = 1000):
+        super().__init__(wrapped)
+        self.api_key = api_key
+        self.output_tokens = output_tokens
+
+    async def request(
+        self,
+        messages: List[ModelMessage],
+        model_settings: Optional[ModelSettings],
+        model_request_parameters: ModelRequestParameters,
+    ) -> Tuple[ModelResponse, Usage]:
+        return await get_scheduler().call(
+            "openai",
+            self.api_key,
+            lambda: self.wrapped.request(messages, model_settings, model_request_parameters),
+            cost=_message_chars(messages) // CHARS_PER_TOKEN + self.output_tokens,
+            usage=lambda result: result[1].total_tokens or 0,
+        )
+
+
+async def run_agent(
+    agent: Agent,
+    prompt: str,
+    api_keys: Optional[Dict[str, str]] = None,
+    output_tokens: int = 1000,
+    **kwargs: Any,
+) -> Any:
+    """
+    Runs the agent with the pooled model for the request's OpenAI key, each of its model requests
+    going through the scheduler (see ScheduledModel). `output_tokens` is the expected completion size
+    of a request, used with the length of its messages to budget tokens per minute.
+    """
+    api_key = (api_keys or {}).get("openai_api_key", config.OPENAI_API_KEY)
+    model = ScheduledModel(registry.get_model(api_keys), api_key, output_tokens)
+    result = await agent.run(prompt, model=model, **kwargs)
+    usage = result.usage()
+    telemetry.add("input_tokens", usage.request_tokens or 0)
+    telemetry.add("output_tokens", usage.response_tokens or 0)
+    return result
@@ -1,12 +1,49 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional, Set, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel, Field, field_validator
 from pydantic_ai import Agent, RunContext
-from pydantic_ai.models.openai import OpenAIModel
-from api.config import config
+from api.agents import registry, scheduler, telemetry
+from api.agents.scheduler import CHARS_PER_TOKEN
 from api.agents.relationship import Relationship
+from api.config import config
 import uuid
+
+# Bump whenever the STRIDE system prompt or run prompt changes, so cached results are not reused
+PROMPT_VERSION = "1"
+# Same for the batch prompt; results of batch calls are cached under their own version
+BATCH_PROMPT_VERSION = "batch-1"
+
+SYSTEM_PROMPT = [
+    "You are a threat modeling expert using STRIDE methodology.",
+    "",
+    "Your task is to analyze the given relationship and identify highly specific technical threats using STRIDE methodology.",
+    "Generate threats that describe concrete attack scenarios with precise technical details, not just abstract categories.",
+    "",
+    "When analyzing, consider:",
+    "1. Component-specific vulnerabilities - What exact weaknesses in this component could be exploited?",
+    "2. Protocol-level attacks - What protocol-specific manipulation could occur?",
+    "3. Implementation flaws - What common coding mistakes create vulnerabilities?",
+    "4. Data flow weaknesses - How could data be intercepted, modified, or leaked?",
+    "5. Trust boundary violations - How could trust assumptions be broken?",
+    "",
+    "For each threat, provide:",
+    "- A specific name describing the exact attack method (e.g., 'Eavesdropping Access Tokens' not just 'Information Disclosure')",
+    "- Detailed attack vectors describing precise technical exploitation methods",
+    "- Implementation context and prerequisites necessary for the attack",
+    "- Concrete technical impacts specific to the relationship",
+    "",
+    "Here is the STRIDE methodology for categorization:",
+    "- Spoofing: Pretending to be someone/something else",
+    "- Tampering: Unauthorized modification of data/communications",
+    "- Repudiation: Denying having performed an action",
+    "- Information Disclosure: Exposing information to unauthorized parties",
+    "- Denial of Service: Preventing legitimate access",
+    "- Elevation of Privilege: Gaining capabilities beyond authorization",
+    "",
+    "Be highly technical, specific, and precise in your threat descriptions.",
+]
+
 # Define structured output models
 
 
@@ -60,54 +97,66 @@ class Threat(BaseModel):
 class Threats(BaseModel):
     threats: List[Threat] = Field(..., description="Collection of identified threats")
 
+class RelationshipThreats(BaseModel):
+    index: int = Field(..., description="Index of the relationship, as given in the prompt")
+    threats: List[Threat] = Field(..., description="Threats identified for this relationship")
+
+class BatchThreats(BaseModel):
+    results: List[RelationshipThreats] = Field(..., description="Threats of every relationship, one entry per relationship index")
+
 @dataclass
 class Deps:
     relationship: Relationship
 
+def _describe(index: int, relationship: Relationship) -> str:
+    return (
+        f"[{index}] Source: {relationship.source} | Target: {relationship.target} | "
+        f"Type: {relationship.direction} | Details: {relationship.description}"
+    )
+
+def plan_batches(relationships: List[Tuple[int, Relationship]], max_size: int) -> List[List[Tuple[int, Relationship]]]:
+    """
+    Group (index, relationship) pairs into batches for `StrideAgent.run_batch`. A batch holds at most
+    `max_size` relationships, and fewer when the expected output (STRIDE_TOKENS_PER_RELATIONSHIP each)
+    or the relationship lines would not fit STRIDE_BATCH_OUTPUT_TOKENS or STRIDE_BATCH_INPUT_TOKENS.
+    """
+    size = max(1, min(max_size, config.STRIDE_BATCH_OUTPUT_TOKENS // config.STRIDE_TOKENS_PER_RELATIONSHIP))
+    batches: List[List[Tuple[int, Relationship]]] = []
+    batch: List[Tuple[int, Relationship]] = []
+    tokens = 0
+    for index, relationship in relationships:
+        needed = len(_describe(index, relationship)) // CHARS_PER_TOKEN + 1
+        if batch and (len(batch) >= size or tokens + needed > config.STRIDE_BATCH_INPUT_TOKENS):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append((index, relationship))
+        tokens += needed
+    if batch:
+        batches.append(batch)
+    return batches
+
 class StrideAgent:
     def __init__(self, api_keys: Dict[str, str] = None):
-        self.api_keys = api_keys
-        self._init_agent()
+        self.api_keys = api_keys or {}
+        self.agent = registry.get_agent("stride", self._build_agent)
+        self.batch_agent = registry.get_agent("stride_batch", self._build_batch_agent)
 
-    def _init_agent(self):
-        openai_api_key = self.api_keys.get("openai_api_key", config.OPENAI_API_KEY)
-        
-        model = OpenAIModel(
-            model_name="gpt-4o",
-            api_key=openai_api_key
+    @staticmethod
+    def _build_batch_agent() -> Agent:
+        """Builds the agent analyzing several relationships per call, sharing one system prompt and context."""
+        return Agent(
+            system_prompt=SYSTEM_PROMPT + [
+                "",
+                "You may be given several relationships at once: analyze each one on its own and return its threats under its index.",
+            ],
+            result_type=BatchThreats,
         )
 
+    @staticmethod
+    def _build_agent() -> Agent:
+        """Builds the agent once per process; the model is picked per run from the API key."""
         agent = Agent(
-            model=model,
-            system_prompt=[
-                "You are a threat modeling expert using STRIDE methodology.",
-                "",
-                "Your task is to analyze the given relationship and identify highly specific technical threats using STRIDE methodology.",
-                "Generate threats that describe concrete attack scenarios with precise technical details, not just abstract categories.",
-                "",
-                "When analyzing, consider:",
-                "1. Component-specific vulnerabilities - What exact weaknesses in this component could be exploited?",
-                "2. Protocol-level attacks - What protocol-specific manipulation could occur?",
-                "3. Implementation flaws - What common coding mistakes create vulnerabilities?",
-                "4. Data flow weaknesses - How could data be intercepted, modified, or leaked?",
-                "5. Trust boundary violations - How could trust assumptions be broken?",
-                "",
-                "For each threat, provide:",
-                "- A specific name describing the exact attack method (e.g., 'Eavesdropping Access Tokens' not just 'Information Disclosure')",
-                "- Detailed attack vectors describing precise technical exploitation methods",
-                "- Implementation context and prerequisites necessary for the attack",
-                "- Concrete technical impacts specific to the relationship",
-                "",
-                "Here is the STRIDE methodology for categorization:",
-                "- Spoofing: Pretending to be someone/something else",
-                "- Tampering: Unauthorized modification of data/communications",
-                "- Repudiation: Denying having performed an action",
-                "- Information Disclosure: Exposing information to unauthorized parties",
-                "- Denial of Service: Preventing legitimate access",
-                "- Elevation of Privilege: Gaining capabilities beyond authorization",
-                "",
-                "Be highly technical, specific, and precise in your threat descriptions.",
-            ],
+            system_prompt=SYSTEM_PROMPT,
             result_type=Threats,
             deps_type=Deps,
         )
@@ -166,7 +215,7 @@ class StrideAgent:
                 likelihood=likelihood
             )
 
-        self.agent = agent
+        return agent
 
     async def run(self, relationship: Relationship, context: str) -> Threats:
         """
@@ -200,5 +249,61 @@ class StrideAgent:
         """
 
         deps = Deps(relationship=relationship)
-        result = await self.agent.run(prompt, deps=deps)
+        with telemetry.span("stride", relationships=1):
+            result = await scheduler.run_agent(
+                self.agent, prompt, self.api_keys, output_tokens=config.STRIDE_TOKENS_PER_RELATIONSHIP, deps=deps
+            )
         return result
+
+    async def run_batch(self, relationships: List[Tuple[int, Relationship]], context: str) -> Dict[int, Threats]:
+        """
+        Run the threat modeling analysis on several relationships in one call, so the system prompt
+        and the context are only sent once.
+        
+        Returns:
+            The threats of every relationship the model answered for, by index; missing indices
+            are left to the caller to retry
+        """
+        relationships_text = "\n".join(_describe(i, relationship) for i, relationship in relationships)
+        prompt = f"""
+        Analyze the security threats for each of the following relationships, considering for each one the
+        implementation details and trust assumptions of its source, what its target protects and how it validates
+        requests, and the data flows, authentication methods and protocol-specific attacks of the relationship type.
+        
+        Relationships:
+        {relationships_text}
+        
+        Additional technical context: {context}
+        
+        For each threat:
+        1. Name it after the specific attack technique, not just the category
+        2. Describe exact technical methods an attacker would use
+        3. Specify implementation assumptions or conditions necessary for the attack
+        4. Detail precise technical impacts on confidentiality, integrity, or availability
+        
+        Return one entry per relationship index, and give every threat an id unique across all relationships.
+        Aim for the level of technical specificity found in security RFCs and formal threat models.
+        """
+
+        with telemetry.span("stride", relationships=len(relationships)):
+            result = await scheduler.run_agent(
+                self.batch_agent,
+                prompt,
+                self.api_keys,
+                output_tokens=config.STRIDE_TOKENS_PER_RELATIONSHIP * len(relationships),
+                model_settings={"max_tokens": config.STRIDE_BATCH_OUTPUT_TOKENS},
+            )
+        by_index = dict(relationships)
+        found: Dict[int, Threats] = {}
+        for item in result.data.results:
+            relationship = by_index.get(item.index)
+            if relationship is None or item.index in found:
+                continue
+            # Scope each threat to its relationship. The model numbers threats the same way in every batch
+            # ("T1"...), and mitigation events and runs refer to threats by id, so each gets a fresh one
+            threats = [
+                threat.model_copy(update={"id": str(uuid.uuid4())[:8], "scope": relationship})
+                for threat in item.threats
+            ]
+            found[item.index] = Threats(threats=threats)
+        return found
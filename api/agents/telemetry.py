@@ -0,0 +1,227 @@
+"""
+Spans for the stages of an analysis (relationship extraction, STRIDE calls, mitigations and their tool
+calls). Finished spans feed the process-wide metrics served at /metrics, the summary of the run they
+belong to, and optionally OpenTelemetry traces.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from api.config import config
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+except ImportError:  # pragma: no cover - tracing is optional
+    trace = None
+
+# Amounts a span accumulates while it runs, each exported as a counter per stage
+COUNTS = ("input_tokens", "output_tokens", "retries", "queue_seconds", "cache_hits", "cache_misses", "bytes")
+# Upper bounds in seconds of the duration histogram buckets
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+LOGFIRE_ENDPOINT = "https://logfire-api.pydantic.dev"
+
+
+class Span:
+    """One timed unit of work: its stage, static attributes and the amounts added while it ran."""
+
+    def __init__(self, stage: str, attributes: Dict[str, Any]):
+        self.stage = stage
+        self.attributes = attributes
+        self.counts: Dict[str, float] = {}
+        self.status = "ok"
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def add(self, name: str, amount: float = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Process-wide totals of the finished spans, by stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations: Dict[Tuple[str, str], _Histogram] = {}
+        self.counts: Dict[Tuple[str, str], float] = {}
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.durations.setdefault((span.stage, span.status), _Histogram()).observe(span.duration)
+            for name, amount in span.counts.items():
+                self.counts[(span.stage, name)] = self.counts.get((span.stage, name), 0) + amount
+
+    def render(self, components: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+        """
+        Prometheus text exposition of the span metrics, plus one gauge per numeric value of the
+        `components` stats (e.g. cache and scheduler `stats()`), keyed by component name.
+        """
+        lines = [
+            "# HELP deeptm_stage_duration_seconds Duration of the analysis stages",
+            "# TYPE deeptm_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            durations = sorted(self.durations.items())
+            counts = sorted(self.counts.items())
+        for (stage, status), histogram in durations:
+            labels = f'stage="{stage}",status="{status}"'
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                lines.append(f'deeptm_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'deeptm_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"deeptm_stage_duration_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"deeptm_stage_duration_seconds_count{{{labels}}} {histogram.count}")
+        for name in COUNTS:
+            samples = [(stage, amount) for (stage, counted), amount in counts if counted == name]
+            if samples:
+                lines.append(f"# TYPE deeptm_stage_{name}_total counter")
+                lines.extend(f'deeptm_stage_{name}_total{{stage="{stage}"}} {amount}' for stage, amount in samples)
+        gauges: Dict[str, List[str]] = {}
+        for component, stats in (components or {}).items():
+            for name, labels, value in _gauges(stats):
+                gauges.setdefault(f"deeptm_{component}_{name}", []).append(f"{labels} {value}")
+        for metric, samples in gauges.items():
+            lines.append(f"# TYPE {metric} gauge")
+            lines.extend(metric + sample for sample in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _gauges(stats: Dict[str, Any], labels: str = "") -> Iterator[Tuple[str, str, float]]:
+    """Numeric values of a stats dict; a nested dict of dicts (e.g. per provider) becomes a label."""
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float, dict)):
+            continue
+        if not isinstance(value, dict):
+            yield key, labels, value
+        elif all(isinstance(inner, dict) for inner in value.values()):
+            label = key[:-1] if key.endswith("s") else key
+            for name, inner in value.items():
+                yield from ((f"{key}_{n}", l, v) for n, l, v in _gauges(inner, f'{{{label}="{name}"}}'))
+        else:
+            yield from ((f"{key}_{n}", l, v) for n, l, v in _gauges(value, labels))
+
+
+class RunSummary:
+    """Per-stage totals of the spans of one analysis, sent to the client when it completes."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, span: Span) -> None:
+        stage = self.stages.setdefault(span.stage, {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0})
+        stage["calls"] += 1
+        stage["errors"] += span.status != "ok"
+        stage["seconds"] += span.duration
+        stage["max_seconds"] = max(stage["max_seconds"], span.duration)
+        for name, amount in span.counts.items():
+            stage[name] = stage.get(name, 0) + amount
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "elapsed_seconds": round(time.perf_counter() - self.started, 3),
+            "stages": {
+                name: {key: round(value, 3) if isinstance(value, float) else value for key, value in stage.items()}
+                for name, stage in self.stages.items()
+            },
+        }
+
+
+metrics = Metrics()
+_span: ContextVar[Optional[Span]] = ContextVar("telemetry_span", default=None)
+_run: ContextVar[Optional[RunSummary]] = ContextVar("telemetry_run", default=None)
+_tracer = None
+_provider = None
+
+
+def start_run() -> None:
+    """Starts collecting the summary of the spans of the current task and the tasks it creates."""
+    _run.set(RunSummary())
+
+
+def run_summary() -> Optional[Dict[str, Any]]:
+    """The summary of the current run, if one was started."""
+    run = _run.get()
+    return run.summary() if run else None
+
+
+def add(name: str, amount: float = 1) -> None:
+    """Adds to a count (tokens, retries, cache hits, bytes...) of the innermost running span, if any."""
+    span = _span.get()
+    if span is not None:
+        span.add(name, amount)
+
+
+@contextmanager
+def span(stage: str, **attributes: Any) -> Iterator[Span]:
+    """Times the enclosed work as a span of `stage`; errors and cancellation are recorded as its status."""
+    current = Span(stage, attributes)
+    token = _span.set(current)
+    otel = _tracer.start_as_current_span(stage, attributes=attributes) if _tracer else nullcontext()
+    try:
+        with otel as otel_span:
+            try:
+                yield current
+            except asyncio.CancelledError:
+                current.status = "cancelled"
+                raise
+            except Exception:
+                current.status = "error"
+                raise
+            finally:
+                current.duration = time.perf_counter() - current.started
+                if otel_span is not None:
+                    otel_span.set_attributes({**current.counts, "status": current.status})
+    finally:
+        _span.reset(token)
+        metrics.record(current)
+        run = _run.get()
+        if run is not None:
+            run.record(current)
+
+
+def setup_tracing() -> bool:
+    """
+    Exports spans over OTLP/HTTP when OTEL_EXPORTER_OTLP_ENDPOINT is set, or to Logfire when only
+    LOGFIRE_API_KEY is. Returns whether tracing is enabled.
+    """
+    global _tracer, _provider
+    if trace is None or _tracer is not None:
+        return _tracer is not None
+    if config.OTEL_EXPORTER_OTLP_ENDPOINT:
+        # Headers come from OTEL_EXPORTER_OTLP_HEADERS
+        exporter = OTLPSpanExporter(endpoint=config.OTEL_EXPORTER_OTLP_ENDPOINT.rstrip("/") + "/v1/traces")
+    elif config.LOGFIRE_API_KEY:
+        exporter = OTLPSpanExporter(endpoint=f"{LOGFIRE_ENDPOINT}/v1/traces", headers={"Authorization": config.LOGFIRE_API_KEY})
+    else:
+        return False
+    _provider = TracerProvider(resource=Resource.create({"service.name": config.OTEL_SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("deep-tm")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flushes the spans not exported yet."""
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer = _provider = None
@@ -0,0 +1,23 @@
+"""
+Word tokenization shared by the text matching code: threat similarity, passage ranking and the
+local search index, so they all agree on what a word is.
+"""
+import re
+from typing import List
+
+_WORD = re.compile(r"[^\W_]+")
+STOPWORDS = frozenset({
+    "a", "against", "an", "and", "are", "as", "at", "be", "between", "by", "for", "from", "how", "in", "into",
+    "is", "it", "its", "of", "on", "or", "that", "the", "their", "this", "to", "using", "via", "what", "when",
+    "with",
+})
+
+
+def words(text: str) -> List[str]:
+    """The lowercase words of the text: runs of letters and digits."""
+    return _WORD.findall(text.lower())
+
+
+def terms(text: str) -> List[str]:
+    """The words of the text, without stopwords."""
+    return [word for word in words(text) if word not in STOPWORDS]
@@ -1,8 +1,15 @@
-import requests
+import asyncio
+import httpx
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import urllib.parse
 from api.config import config
+from api.agents import telemetry
+from api.agents.scheduler import RetryLater, get_scheduler, parse_retry_after
+from .http_client import get_async_client, host_slot, run_blocking
+from .local_search import LocalResults, get_local_index
+from .search_cache import get_search_cache
+
 
 class SearchResult(BaseModel):
     title: str = Field(..., description="Title of the search result")
@@ -27,58 +34,157 @@ class GoogleSearchTool:
     def __init__(self):
         self.api_key = config.GOOGLE_API_KEY
         self.cx = config.GOOGLE_CSE_ID
-        
-        if not self.api_key or not self.cx:
+        self.search_url = config.GOOGLE_SEARCH_URL
+        self.cache = get_search_cache()
+        self.local = get_local_index()
+
+    def _credentials(self, api_key: Optional[str], cx: Optional[str]) -> Tuple[str, str]:
+        """Per-call credentials (e.g. client-provided keys) take precedence over the server ones."""
+        api_key = api_key or self.api_key
+        cx = cx or self.cx
+        if not api_key or not cx:
             raise ValueError("Google API key or CSE ID not found. Set GOOGLE_API_KEY and GOOGLE_CSE_ID environment variables.")
+        return api_key, cx
             
-    def search(self, params: GoogleSearchInput) -> GoogleSearchOutput:
-        """Performs a Google search with the given parameters."""
-        # Construct query with site restriction if provided
+    def _search_local(self, params: GoogleSearchInput) -> Optional[LocalResults]:
+        """
+        Searches the local index first. Returns its results when enough indexed pages match every
+        query term (or Google can't be used), else None so Google is searched instead.
+        """
+        if not self.local:
+            return None
+        found = self.local.search(params.query, params.site, params.num_results)
+        hit = found.strong >= min(params.num_results, config.LOCAL_SEARCH_MIN_RESULTS)
+        self.local.record(hit)
+        return found if hit else None
+
+    def _local_output(self, found: LocalResults, query: str) -> GoogleSearchOutput:
+        results: List[SearchResult] = []
+        self._collect_page(found.items, results, len(found.items))
+        return GoogleSearchOutput(results=results, query=query)
+
+    def _local_fallback(self, params: GoogleSearchInput, query: str) -> Optional[GoogleSearchOutput]:
+        """Whatever the local index found, for when Google can't be used or found nothing."""
+        if not self.local:
+            return None
+        return self._local_output(self.local.search(params.query, params.site, params.num_results), query)
+
+    def _build_query(self, params: GoogleSearchInput) -> str:
+        """Constructs the query with site restriction if provided."""
         query = params.query
         if params.site:
             query = f"site:{params.site} {query}"
-            
-        # Build request URL
-        url = "https://www.googleapis.com/customsearch/v1"
-        query_params = {
-            "key": self.api_key,
-            "cx": self.cx,
+        return query
+
+    def _page_params(self, credentials: Tuple[str, str], query: str, start_index: int) -> dict:
+        """Builds the request parameters for one page of results."""
+        return {
+            "key": credentials[0],
+            "cx": credentials[1],
             "q": query,
-            "num": min(params.num_results, 10)  # API limit is 10 per request
+            # Always request full pages (API limit is 10 per request) so they can be cached and reused
+            "num": 10,
+            "start": start_index,
         }
+
+    def _parse_page(self, response: httpx.Response) -> Tuple[List[Dict[str, Any]], bool]:
+        """Returns the items of one page of results and whether the page may be cached."""
+        if not response.is_success:
+            return [], False
+        return response.json().get("items", []), True
+
+    def _check_rate_limit(self, response: httpx.Response) -> None:
+        """Raises RetryLater for responses worth retrying: rate limits and server errors."""
+        retry = response.status_code == 429 or response.status_code >= 500
+        if response.status_code == 403:
+            # Per-minute quota errors are 403s with a rate limit reason; daily quota errors are not retried
+            try:
+                reasons = [e.get("reason", "") for e in response.json()["error"]["errors"]]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                reasons = []
+            retry = any(reason in ("rateLimitExceeded", "userRateLimitExceeded") for reason in reasons)
+        if retry:
+            raise RetryLater(f"Google search returned {response.status_code}", parse_retry_after(response.headers))
+
+    def _collect_page(self, items: List[Dict[str, Any]], results: List[SearchResult], num_results: int) -> bool:
+        """Appends one page of API results, returns whether another page should be requested."""
+        for item in items:
+            results.append(
+                SearchResult(
+                    title=item.get("title", ""),
+                    link=item.get("link", ""),
+                    snippet=item.get("snippet", "")
+                )
+            )
+            
+            if len(results) >= num_results:
+                return False
+                
+        # No more results available
+        return len(items) >= 10
+
+    async def _afetch_page(
+        self, credentials: Tuple[str, str], params: GoogleSearchInput, query: str, start_index: int
+    ) -> List[Dict[str, Any]]:
+        """Fetches one page of results, through the cache when enabled."""
+        async def request() -> httpx.Response:
+            async with host_slot(self.search_url):
+                response = await get_async_client().get(self.search_url, params=self._page_params(credentials, query, start_index))
+            telemetry.add("bytes", len(response.content))
+            self._check_rate_limit(response)
+            return response
+
+        async def fetch() -> Tuple[List[Dict[str, Any]], bool]:
+            # Rate limited per API key and retried by the shared scheduler
+            try:
+                response = await get_scheduler().call("google", credentials[0], request)
+            except RetryLater:
+                return [], False
+            return self._parse_page(response)
+        
+        if not self.cache:
+            items, _ = await fetch()
+            return items
+        return await self.cache.get_or_fetch(self.cache.key(credentials[1], params.query, params.site, start_index), fetch)
+
+    async def asearch(
+        self, params: GoogleSearchInput, api_key: Optional[str] = None, cx: Optional[str] = None
+    ) -> GoogleSearchOutput:
+        """
+        Performs a Google search with the given parameters without blocking the event loop.
+        The local index answers instead when it has enough matching pages.
+        """
+        query = self._build_query(params)
+        # FTS5 queries run in a thread, like the scraper's index lookups, so they don't stall the loop
+        if local := await asyncio.to_thread(self._search_local, params):
+            return self._local_output(local, query)
+        try:
+            credentials = self._credentials(api_key, cx)
+        except ValueError:
+            # Without Google (e.g. air-gapped), whatever the local index found is the answer
+            if (fallback := await asyncio.to_thread(self._local_fallback, params, query)) is not None:
+                return fallback
+            raise
         
         results = []
         start_index = 1
         
         # Make multiple requests if necessary to get the requested number of results
         while len(results) < params.num_results:
-            current_params = query_params.copy()
-            current_params["start"] = start_index
-            
-            response = requests.get(url, params=current_params)
-            data = response.json()
-            
-            if "items" not in data:
-                break
-                
-            for item in data["items"]:
-                results.append(
-                    SearchResult(
-                        title=item.get("title", ""),
-                        link=item.get("link", ""),
-                        snippet=item.get("snippet", "")
-                    )
-                )
-                
-                if len(results) >= params.num_results:
-                    break
-                    
-            if len(data["items"]) < 10:  # No more results available
+            items = await self._afetch_page(credentials, params, query, start_index)
+            if not self._collect_page(items, results, params.num_results):
                 break
-                
             start_index += 10
-            
+        
+        if not results and (fallback := await asyncio.to_thread(self._local_fallback, params, query)) is not None:
+            return fallback
         return GoogleSearchOutput(
             results=results[:params.num_results],
             query=query
-        ) 
\ No newline at end of file
+        )
+
+    def search(
+        self, params: GoogleSearchInput, api_key: Optional[str] = None, cx: Optional[str] = None
+    ) -> GoogleSearchOutput:
+        """Blocking `asearch`, for scripts; must not be called from a running event loop."""
+        return run_blocking(self.asearch(params, api_key, cx))
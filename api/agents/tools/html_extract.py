@@ -0,0 +1,229 @@
+"""
+Single-parse HTML extraction: metadata and main content are pulled from one lxml tree and
+converted straight to markdown, without re-serializing the content for a second parser.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import re
+
+try:
+    import lxml.html
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:  # pragma: no cover - lxml ships with readability-lxml
+    LXML_AVAILABLE = False
+
+# Elements dropped before looking for the main content, as in WebScraperTool._extract_main_content
+UNWANTED_XPATH = "//script|//style|//nav|//header|//footer|//noscript|//template"
+# Main content candidates, tried in order; the first one found wins
+CANDIDATE_XPATHS = (
+    "(//main)[1]",
+    "(//*[re:test(@id, 'content|main', 'i')])[1]",
+    "(//*[re:test(@class, 'content|main', 'i')])[1]",
+    "(//article)[1]",
+    "(//body)[1]",
+)
+_NAMESPACES = {"re": "http://exslt.org/regular-expressions"}
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+_WHITESPACE = re.compile(r"\s+")
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCKS = {
+    "p", "div", "section", "article", "main", "aside", "figure", "figcaption", "dl", "dt", "dd",
+    "address", "details", "summary", "center",
+}
+_SKIPPED = {"script", "style", "noscript", "template", "svg", "iframe", "object", "button", "select", "input"}
+
+
+@dataclass
+class ExtractedPage:
+    """Markdown and metadata extracted from a page."""
+    markdown: str
+    title: str
+    author: Optional[str] = None
+    description: Optional[str] = None
+    site_name: Optional[str] = None
+    # Whether conversion stopped early because max_chars was reached
+    cut: bool = False
+
+
+class _Done(Exception):
+    """Raised to stop the conversion once enough markdown has been produced."""
+
+
+@dataclass
+class _MarkdownWriter:
+    include_links: bool
+    max_chars: Optional[int]
+    parts: List[str] = field(default_factory=list)
+    length: int = 0
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        self.parts.append(text)
+        self.length += len(text)
+        if self.max_chars and self.length >= self.max_chars:
+            raise _Done()
+
+    def markdown(self) -> str:
+        text = "".join(self.parts)
+        return text[:self.max_chars] if self.max_chars else text
+
+
+def _inline_text(el) -> str:
+    return _WHITESPACE.sub(" ", el.text_content()).strip()
+
+
+def _meta_content(root, attr: str, value: str) -> Optional[str]:
+    found = root.xpath(f"(//meta[@{attr}='{value}'])[1]")
+    return found[0].get("content") if found else None
+
+
+def _render_children(el, out: _MarkdownWriter, depth: int) -> None:
+    if el.text:
+        out.write(_WHITESPACE.sub(" ", el.text))
+    for child in el:
+        _render(child, out, depth)
+        if child.tail:
+            out.write(_WHITESPACE.sub(" ", child.tail))
+
+
+def _render_inline(el, depth: int, include_links: bool) -> str:
+    """Renders an element into a standalone string, used for wrappers such as links and emphasis."""
+    inner = _MarkdownWriter(include_links=include_links, max_chars=None)
+    _render_children(el, inner, depth)
+    return inner.markdown().strip()
+
+
+def _render_list(el, out: _MarkdownWriter, depth: int) -> None:
+    ordered = el.tag == "ol"
+    indent = "  " * depth
+    out.write("\n\n" if depth == 0 else "\n")
+    number = 1
+    for item in el:
+        if not isinstance(item.tag, str) or item.tag != "li":
+            continue
+        marker = f"{number}." if ordered else "-"
+        number += 1
+        out.write(f"{indent}{marker} ")
+        if item.text:
+            out.write(_WHITESPACE.sub(" ", item.text).lstrip())
+        for child in item:
+            _render(child, out, depth + 1)
+            if child.tail:
+                out.write(_WHITESPACE.sub(" ", child.tail))
+        out.write("\n")
+    out.write("\n" if depth else "\n\n")
+
+
+def _render_table(el, out: _MarkdownWriter) -> None:
+    rows = [row for row in el.iter("tr")]
+    if not rows:
+        return
+    out.write("\n\n")
+    for i, row in enumerate(rows):
+        cells = [_inline_text(cell).replace("|", "\\|") for cell in row if cell.tag in ("td", "th")]
+        out.write("| " + " | ".join(cells) + " |\n")
+        if i == 0:
+            out.write("| " + " | ".join("---" for _ in cells) + " |\n")
+    out.write("\n")
+
+
+def _render(el, out: _MarkdownWriter, depth: int = 0) -> None:
+    tag = el.tag
+    # Comments and processing instructions
+    if not isinstance(tag, str):
+        return
+    tag = tag.lower()
+    if tag in _SKIPPED:
+        return
+
+    if tag in _HEADINGS:
+        out.write(f"\n\n{'#' * _HEADINGS[tag]} {_inline_text(el)}\n\n")
+    elif tag in ("ul", "ol"):
+        _render_list(el, out, depth)
+    elif tag == "pre":
+        out.write(f"\n\n```\n{el.text_content().strip(chr(10))}\n```\n\n")
+    elif tag == "table":
+        _render_table(el, out)
+    elif tag == "br":
+        out.write("\n")
+    elif tag == "hr":
+        out.write("\n\n---\n\n")
+    elif tag == "blockquote":
+        quoted = _render_inline(el, depth, out.include_links)
+        out.write("\n\n" + "\n".join(f"> {line}" for line in quoted.splitlines()) + "\n\n")
+    elif tag == "a":
+        text = _render_inline(el, depth, out.include_links)
+        href = el.get("href")
+        if out.include_links and href and text:
+            out.write(f"[{text}]({href})")
+        else:
+            out.write(text)
+    elif tag in ("strong", "b"):
+        text = _render_inline(el, depth, out.include_links)
+        out.write(f"**{text}**" if text else "")
+    elif tag in ("em", "i"):
+        text = _render_inline(el, depth, out.include_links)
+        out.write(f"*{text}*" if text else "")
+    elif tag == "code":
+        text = el.text_content()
+        out.write(f"`{text}`" if text else "")
+    elif tag == "img":
+        src = el.get("src")
+        if src:
+            out.write(f"![{el.get('alt', '')}]({src})")
+    elif tag in _BLOCKS:
+        out.write("\n\n")
+        _render_children(el, out, depth)
+        out.write("\n\n")
+    else:
+        _render_children(el, out, depth)
+
+
+def extract(html: str, include_links: bool = True, max_chars: Optional[int] = None) -> ExtractedPage:
+    """
+    Parses the page once and extracts its metadata and main content as markdown.
+
+    Args:
+        html: The page HTML
+        include_links: Whether to keep hyperlinks in the markdown
+        max_chars: If set, stop converting once this many characters of markdown were produced
+
+    Returns:
+        The markdown (not yet whitespace-cleaned) and page metadata
+    """
+    html = _XML_DECLARATION.sub("", html, count=1)
+    try:
+        root = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return ExtractedPage(markdown="", title="[no-title]")
+
+    title_el = root.find(".//title")
+    title_text = _WHITESPACE.sub(" ", title_el.text_content()).strip() if title_el is not None else ""
+    page = ExtractedPage(
+        markdown="",
+        title=title_text or "[no-title]",
+        author=_meta_content(root, "name", "author"),
+        description=_meta_content(root, "name", "description"),
+        site_name=_meta_content(root, "property", "og:site_name"),
+    )
+
+    for element in root.xpath(UNWANTED_XPATH):
+        element.drop_tree()
+
+    main_content = root
+    for xpath in CANDIDATE_XPATHS:
+        found = root.xpath(xpath, namespaces=_NAMESPACES)
+        if found:
+            main_content = found[0]
+            break
+
+    out = _MarkdownWriter(include_links=include_links, max_chars=max_chars)
+    try:
+        _render(main_content, out)
+    except _Done:
+        page.cut = True
+    page.markdown = out.markdown()
+    return page
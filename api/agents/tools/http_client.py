@@ -0,0 +1,83 @@
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+import httpx
+from api.config import config
+
+# HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_host_slots: Dict[str, asyncio.Semaphore] = {}
+
+T = TypeVar("T")
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(config.HTTP_READ_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide async HTTP client shared by every tool call.
+    The client keeps connections alive between requests so repeated calls to the same
+    hosts (googleapis.com, owasp.org, ...) skip the TCP/TLS handshake.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        # A client is bound to the event loop it was first used on
+        _async_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE and config.HTTP_ENABLE_HTTP2,
+            timeout=_timeout(),
+            limits=_limits(),
+            follow_redirects=True,
+        )
+        _async_client_loop = loop
+        _host_slots.clear()
+    return _async_client
+
+
+@asynccontextmanager
+async def host_slot(url: str) -> AsyncIterator[None]:
+    """Limits the number of concurrent requests to a single host."""
+    host = urlparse(url).netloc.lower()
+    slots = _host_slots.get(host)
+    if slots is None:
+        slots = _host_slots[host] = asyncio.Semaphore(config.HTTP_MAX_CONNECTIONS_PER_HOST)
+    async with slots:
+        yield
+
+
+async def close_clients() -> None:
+    """Closes the shared HTTP client, e.g. on application shutdown."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def run_blocking(call: Awaitable[T]) -> T:
+    """
+    Runs an async tool call to completion on a new event loop, for the blocking wrappers used by scripts.
+    The client created for that loop is closed with it.
+    """
+    async def run() -> T:
+        try:
+            return await call
+        finally:
+            if _async_client_loop is asyncio.get_running_loop():
+                await close_clients()
+
+    return asyncio.run(run())
@@ -0,0 +1,233 @@
+"""
+Local full-text index of security references (OWASP cheat sheets, ASVS, CWE, CAPEC, ATT&CK...), searched
+before Google and serving the indexed pages to the scraper, so most research needs no quota or network.
+
+Usage:
+    python -m api.agents.tools.local_search ingest api/benchmarks/corpus          # saved pages (<!-- url --> header)
+    python -m api.agents.tools.local_search ingest --base-url https://cheatsheetseries.owasp.org/cheatsheets/ cheatsheets/
+    python -m api.agents.tools.local_search ingest references.jsonl               # {"url", "title", "content"} per line
+    python -m api.agents.tools.local_search search "jwt none algorithm" --site owasp.org
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+from pydantic import BaseModel
+from api.agents.text import terms
+from api.config import config
+
+_URL_COMMENT = re.compile(r"\s*<!--\s*(https?://\S+)\s*-->")
+_CANONICAL = re.compile(r"""<link[^>]+rel=["']canonical["'][^>]+href=["']([^"']+)["']""", re.I)
+_MARKDOWN_TITLE = re.compile(r"^#\s+(.+)$", re.M)
+# Queries this long may miss one of their words in a strong match, e.g. "web security" in "web security ssrf metadata"
+MIN_TERMS_ALL_BUT_ONE = 4
+# Weight of the title column against the content column in the BM25 ranking
+TITLE_WEIGHT = 5.0
+
+
+class LocalDocument(BaseModel):
+    url: str
+    title: str
+    content: str
+
+
+@dataclass
+class LocalResults:
+    """Results of a local search; `strong` counts the leading results matching (nearly) every query term."""
+    items: List[Dict[str, str]]
+    strong: int
+
+
+def site_of(url: str) -> str:
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def match_expression(query: str, strong: bool) -> Optional[str]:
+    """
+    FTS5 query of the words of `query`, quoted so operators and punctuation are taken literally: any of
+    them, or when `strong` every one of them, but one for queries of MIN_TERMS_ALL_BUT_ONE words or more.
+    """
+    quoted = [f'"{word}"' for word in dict.fromkeys(terms(query))]
+    if not quoted:
+        return None
+    if not strong:
+        return " OR ".join(quoted)
+    if len(quoted) < MIN_TERMS_ALL_BUT_ONE:
+        return " AND ".join(quoted)
+    return " OR ".join(f"({' AND '.join(quoted[:i] + quoted[i + 1:])})" for i in range(len(quoted)))
+
+
+class LocalIndex:
+    """
+    SQLite FTS5 index of reference pages stored as markdown, ranked with BM25. Results use the item
+    format of the Custom Search API (title, link, snippet), so they go through the same code as Google's.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5("
+            "url UNINDEXED, site UNINDEXED, title, content, ingested_at UNINDEXED, tokenize='porter unicode61')"
+        )
+
+    def add(self, document: LocalDocument) -> None:
+        """Indexes a page, replacing the previous version of the same URL."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM documents WHERE url = ?", (document.url,))
+            self._conn.execute(
+                "INSERT INTO documents (url, site, title, content, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (document.url, site_of(document.url), document.title, document.content, time.time()),
+            )
+            self._conn.execute("COMMIT")
+
+    def _match(self, expression: str, site: Optional[str], limit: int, exclude: Tuple[str, ...] = ()) -> List[Dict[str, str]]:
+        site = (site or "").lower()
+        excluded = f"AND url NOT IN ({', '.join('?' * len(exclude))})" if exclude else ""
+        rows = self._conn.execute(
+            f"""
+            SELECT url, title, snippet(documents, 3, '', '', '...', 32) FROM documents
+            WHERE documents MATCH ? AND (? = '' OR site = ? OR substr(site, -length(?) - 1) = '.' || ?) {excluded}
+            ORDER BY bm25(documents, 0, 0, {TITLE_WEIGHT}, 1.0) LIMIT ?
+            """,
+            (expression, site, site, site, site, *exclude, limit),
+        ).fetchall()
+        return [{"title": title, "link": url, "snippet": " ".join(snippet.split())} for url, title, snippet in rows]
+
+    def search(self, query: str, site: Optional[str], num_results: int) -> LocalResults:
+        """
+        The best matching pages: those containing every query term (see `match_expression`) first,
+        then those containing any of them. Pages of `site` and its subdomains only, when given.
+        """
+        every, any_term = match_expression(query, True), match_expression(query, False)
+        if every is None:
+            return LocalResults(items=[], strong=0)
+        with self._lock:
+            items = self._match(every, site, num_results)
+            strong = len(items)
+            if strong < num_results:
+                items += self._match(any_term, site, num_results - strong, tuple(item["link"] for item in items))
+        return LocalResults(items=items, strong=strong)
+
+    def document(self, url: str) -> Optional[LocalDocument]:
+        """The indexed page at this URL, if any."""
+        with self._lock:
+            row = self._conn.execute("SELECT url, title, content FROM documents WHERE url = ?", (url,)).fetchone()
+        return LocalDocument(url=row[0], title=row[1], content=row[2]) if row else None
+
+    def record(self, hit: bool) -> None:
+        """Counts a search answered locally (`hit`) or one that fell back to Google."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.fallbacks += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Searches answered locally and those that fell back to Google since process start, plus the page count."""
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            return {"hits": self.hits, "fallbacks": self.fallbacks, "documents": documents}
+
+
+_local_index: Optional[LocalIndex] = None
+
+
+def get_local_index() -> Optional[LocalIndex]:
+    """Returns the process-wide local index, or None when it is disabled or was never built."""
+    global _local_index
+    if not config.LOCAL_SEARCH_ENABLED or not os.path.exists(config.LOCAL_SEARCH_PATH):
+        return None
+    if _local_index is None:
+        _local_index = LocalIndex(config.LOCAL_SEARCH_PATH)
+    return _local_index
+
+
+def read_documents(path: Path, base_url: Optional[str] = None, root: Optional[Path] = None) -> Iterator[LocalDocument]:
+    """
+    The documents of a file: one per line of a .jsonl file, else the page itself (.html, .md, .txt).
+    A page's URL is its `<!-- url -->` header or canonical link, else `base_url` joined with its path
+    relative to the ingested directory.
+    """
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield LocalDocument(**json.loads(line))
+        return
+
+    text = path.read_text(encoding="utf-8", errors="replace")
+    match = _URL_COMMENT.match(text) or (_CANONICAL.search(text) if path.suffix in (".html", ".htm") else None)
+    relative = path.relative_to(root).as_posix() if root else path.name
+    url = match.group(1) if match else (urljoin(base_url, relative) if base_url else path.resolve().as_uri())
+
+    if path.suffix in (".html", ".htm"):
+        from .web_scraper import WebScraperInput, WebScraperTool
+        # The URL only names the domain in the metadata, which isn't kept
+        output = WebScraperTool._to_output(text, WebScraperInput(url=url if url.startswith("http") else "http://localhost/"))
+        yield LocalDocument(url=url, title=output.metadata.title or path.stem, content=output.content)
+    else:
+        title = _MARKDOWN_TITLE.search(text)
+        yield LocalDocument(url=url, title=title.group(1).strip() if title else path.stem, content=text)
+
+
+def ingest(index: LocalIndex, paths: List[str], base_url: Optional[str] = None) -> int:
+    """Indexes files and directories (recursively). Returns the number of indexed documents."""
+    count = 0
+    for name in paths:
+        root = Path(name)
+        files = sorted(p for p in root.rglob("*") if p.is_file()) if root.is_dir() else [root]
+        for path in files:
+            if path.suffix not in (".html", ".htm", ".md", ".markdown", ".txt", ".jsonl"):
+                continue
+            for document in read_documents(path, base_url, root if root.is_dir() else None):
+                index.add(document)
+                count += 1
+                print(f"indexed {document.url} ({len(document.content)} chars)")
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", default=config.LOCAL_SEARCH_PATH, help="Index file (defaults to LOCAL_SEARCH_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Index files and directories of pages")
+    ingest_parser.add_argument("paths", nargs="+")
+    ingest_parser.add_argument("--base-url", help="URL the ingested directories are served under")
+    search_parser = commands.add_parser("search", help="Search the index")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--site")
+    search_parser.add_argument("--num-results", type=int, default=5)
+    args = parser.parse_args()
+
+    index = LocalIndex(args.index)
+    if args.command == "ingest":
+        print(f"{ingest(index, args.paths, args.base_url)} documents indexed into {args.index}, {index.stats()['documents']} in total")
+    else:
+        start = time.perf_counter()
+        results = index.search(args.query, args.site, args.num_results)
+        elapsed = (time.perf_counter() - start) * 1000
+        for item in results.items:
+            print(f"{item['link']}\n  {item['title']}\n  {item['snippet']}")
+        print(f"{len(results.items)} results, {results.strong} strong, {elapsed:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
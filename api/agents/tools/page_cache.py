@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from pydantic import BaseModel, Field
+from api.agents import telemetry
+from api.config import config
+
+
+def normalize_url(url: str) -> str:
+    """Normalizes a URL so trivially different spellings share a cache entry."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    # Fragments never reach the server, so they don't change the page
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+class CachedPage(BaseModel):
+    """A scraped page as stored in the cache."""
+    content: str = Field(..., description="The cleaned markdown content.")
+    metadata: Dict = Field(..., description="The WebpageMetadata of the page as a dict.")
+    etag: Optional[str] = Field(None, description="ETag returned by the server, used for revalidation.")
+    last_modified: Optional[str] = Field(None, description="Last-Modified returned by the server, used for revalidation.")
+    fetched_at: float = Field(..., description="When the page was last fetched or revalidated (epoch seconds).")
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+    def revalidation_headers(self) -> Dict[str, str]:
+        """Conditional request headers that let the server answer 304 Not Modified."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    SQLite-backed cache of scraped pages keyed by normalized URL.
+    Entries younger than `ttl` are served without network I/O; older entries are revalidated
+    with ETag/Last-Modified. The total stored size is bounded with least-recently-used eviction.
+    """
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at)")
+
+    def _key(self, url: str, include_links: bool) -> str:
+        # Markdown differs with and without links, so they are cached separately
+        return f"{normalize_url(url)}#links={int(include_links)}"
+
+    def get(self, url: str, include_links: bool) -> Optional[CachedPage]:
+        """
+        Returns the cached page, fresh or stale. Fresh pages count as a hit, missing and stale ones
+        as a miss since the page has to be requested again.
+        """
+        key = self._key(url, include_links)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, metadata, etag, last_modified, fetched_at FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE pages SET accessed_at = ? WHERE key = ?", (time.time(), key))
+
+        if row is None:
+            self.misses += 1
+            telemetry.add("cache_misses")
+            return None
+
+        page = CachedPage(
+            content=row[0],
+            metadata=json.loads(row[1]),
+            etag=row[2],
+            last_modified=row[3],
+            fetched_at=row[4],
+        )
+        if page.is_fresh(self.ttl):
+            self.hits += 1
+            telemetry.add("cache_hits")
+        else:
+            self.misses += 1
+            telemetry.add("cache_misses")
+        return page
+
+    def mark_revalidated(self, url: str, include_links: bool) -> None:
+        """Resets the TTL of an entry the server confirmed as unchanged (304)."""
+        key = self._key(url, include_links)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+        self.revalidations += 1
+
+    def put(
+        self,
+        url: str,
+        include_links: bool,
+        content: str,
+        metadata: Dict,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        """Stores a freshly scraped page and evicts least recently used entries over the size bound."""
+        key = self._key(url, include_links)
+        metadata_json = json.dumps(metadata)
+        size = len(content.encode("utf-8")) + len(metadata_json)
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content, metadata_json, etag, last_modified, now, now, size),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM pages ORDER BY accessed_at").fetchall():
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            self.evictions += 1
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters since process start, plus the current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+        }
+
+
+_page_cache: Optional[PageCache] = None
+
+
+def get_page_cache() -> Optional[PageCache]:
+    """
+    Returns the process-wide page cache, or None when it is disabled or CACHE_DIR can't be written
+    (e.g. a read-only deployment), in which case pages are scraped without a cache.
+    """
+    global _page_cache
+    if not config.PAGE_CACHE_ENABLED:
+        return None
+    if _page_cache is None:
+        try:
+            _page_cache = PageCache(
+                path=os.path.join(config.CACHE_DIR, "pages.sqlite"),
+                ttl=config.PAGE_CACHE_TTL,
+                max_bytes=config.PAGE_CACHE_MAX_BYTES,
+            )
+        except (OSError, sqlite3.Error):
+            return None
+    return _page_cache
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+from api.config import config
+
+T = TypeVar("T")
+
+
+class ParsePool:
+    """
+    Executor for CPU-bound page parsing (HTML decoding, tree walking, markdown cleanup), so it
+    does not hold the GIL on the event loop thread while other SSE streams are being served.
+
+    At most `workers + max_queue` jobs are admitted at once; further callers wait for a slot,
+    which pushes back on the scraping tools instead of growing an unbounded executor queue.
+    """
+
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.peak_depth = 0
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                try:
+                    # spawn: forking a process that runs an event loop and worker threads is unsafe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                except (OSError, NotImplementedError):
+                    # Some sandboxes (e.g. serverless runtimes) don't support multiprocessing
+                    self.kind = "thread"
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers + self.max_queue)
+            self._slots_loop = loop
+        return self._slots
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Runs `fn(*args)` in the pool; `fn` and its arguments must be picklable for the process pool."""
+        slots = self._get_slots()
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        self.peak_depth = max(self.peak_depth, self.running + self.waiting)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and throughput counters since process start."""
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "peak_depth": self.peak_depth,
+            "completed": self.completed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_parse_pool: Optional[ParsePool] = None
+
+
+def get_parse_pool() -> ParsePool:
+    """Returns the process-wide parse pool."""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ParsePool(
+            kind=config.PARSE_EXECUTOR,
+            workers=config.PARSE_WORKERS or min(4, os.cpu_count() or 1),
+            max_queue=config.PARSE_MAX_QUEUE,
+        )
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown()
+        _parse_pool = None
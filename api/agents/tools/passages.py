@@ -0,0 +1,113 @@
+"""
+Query-relevant passages of a scraped page, so a tool returns the part of a long page that matters
+instead of all of it. The markdown is split by headings and paragraphs, and the passages are scored
+against the query with BM25, the page itself being the corpus.
+"""
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from api.agents.text import terms
+
+_HEADING = re.compile(r"#{1,6}\s+(.*)")
+# Consecutive non-blank lines
+_BLOCK = re.compile(r"(?:[^\n]*\S[^\n]*(?:\n|$))+")
+# BM25 term frequency saturation and length normalization
+K1 = 1.5
+B = 0.75
+
+
+class Passage(BaseModel):
+    """A passage of a page, with its character offsets in the page markdown."""
+    heading: Optional[str] = Field(None, description="The heading of the section the passage is in.")
+    text: str = Field(..., description="The passage markdown.")
+    start: int = Field(..., description="Offset of the first character of the passage in the page content.")
+    end: int = Field(..., description="Offset after the last character of the passage in the page content.")
+    score: float = Field(0.0, description="BM25 relevance to the query.")
+
+
+def split_passages(markdown: str, target_chars: int = 800, max_chars: int = 1500) -> List[Passage]:
+    """
+    Splits markdown into passages: paragraphs of the same section are merged up to `target_chars`,
+    and longer ones are cut at line, then word boundaries to at most `max_chars`.
+    """
+    passages: List[Passage] = []
+    heading: Optional[str] = None
+    span: Optional[Tuple[int, int]] = None
+
+    def flush() -> None:
+        nonlocal span
+        if span is not None:
+            passages.append(Passage(heading=heading, text=markdown[span[0]:span[1]], start=span[0], end=span[1]))
+            span = None
+
+    for block in _BLOCK.finditer(markdown):
+        start, end = block.start(), len(block.group().rstrip()) + block.start()
+        first_line = markdown[start:end].split("\n", 1)[0]
+        if match := _HEADING.match(first_line.strip()):
+            flush()
+            heading = match.group(1).strip("# ").strip() or None
+            start += len(first_line) + 1
+            if start >= end:
+                continue
+        while end - start > max_chars:
+            # Cut long blocks (lists, tables, code) at the last line break, else the last space, before the limit
+            cut = markdown.rfind("\n", start, start + max_chars)
+            if cut <= start:
+                cut = markdown.rfind(" ", start, start + max_chars)
+            if cut <= start:
+                cut = start + max_chars
+            flush()
+            span = (start, cut)
+            flush()
+            start = cut + 1 if markdown[cut:cut + 1].isspace() else cut
+        if span is not None and end - span[0] > target_chars:
+            flush()
+        span = (span[0] if span else start, end)
+    flush()
+    return passages
+
+
+def rank_passages(passages: List[Passage], query: str) -> List[Passage]:
+    """Scores the passages against the query with BM25 and returns them best first."""
+    query_terms = set(terms(query))
+    documents = [terms(f"{passage.heading or ''} {passage.text}") for passage in passages]
+    if not documents or not query_terms:
+        return list(passages)
+    average = sum(len(document) for document in documents) / len(documents) or 1
+    frequency: Dict[str, int] = {term: 0 for term in query_terms}
+    for document in documents:
+        for term in query_terms.intersection(document):
+            frequency[term] += 1
+    idf = {
+        term: math.log((len(documents) - count + 0.5) / (count + 0.5) + 1) for term, count in frequency.items()
+    }
+    for passage, document in zip(passages, documents):
+        score = 0.0
+        for term in query_terms:
+            tf = document.count(term)
+            if tf:
+                score += idf[term] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(document) / average))
+        passage.score = round(score, 3)
+    return sorted(passages, key=lambda passage: (-passage.score, passage.start))
+
+
+def top_passages(markdown: str, query: str, max_passages: int = 5, max_chars: int = 4000) -> List[Passage]:
+    """
+    The passages most relevant to the query, at most `max_passages` of them and `max_chars` in total,
+    in page order. When no passage matches the query, the first passages of the page are returned.
+    """
+    ranked = rank_passages(split_passages(markdown), query)
+    matching = [passage for passage in ranked if passage.score > 0] or sorted(ranked, key=lambda passage: passage.start)
+    kept, used = [], 0
+    for passage in matching:
+        if len(kept) >= max_passages:
+            break
+        if used + len(passage.text) <= max_chars:
+            kept.append(passage)
+            used += len(passage.text)
+    if not kept and matching:
+        # Even the best passage is over the budget: keep its beginning
+        best = matching[0]
+        kept = [best.model_copy(update={"text": best.text[:max_chars], "end": best.start + max_chars})]
+    return sorted(kept, key=lambda passage: passage.start)
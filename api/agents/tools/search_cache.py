@@ -0,0 +1,115 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from cachetools import TTLCache
+from api.agents import telemetry
+from api.config import config
+
+# (search engine id, normalized query, site, start index) of one page of search results
+PageKey = Tuple[str, str, str, int]
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a query so near-identical spellings share a cache entry."""
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """
+    In-memory cache of search result pages with TTL and LRU bounds.
+    Each page of results is cached on its own, so a search for more results reuses the pages
+    fetched by earlier, smaller searches. Concurrent misses for the same page share one
+    upstream call (single-flight).
+    """
+
+    def __init__(self, ttl: float, max_pages: int):
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._pages: TTLCache = TTLCache(maxsize=max_pages, ttl=ttl)
+        self._lock = threading.Lock()
+        self._inflight: Dict[PageKey, asyncio.Future] = {}
+
+    def key(self, cx: str, query: str, site: Optional[str], start_index: int) -> PageKey:
+        return (cx, normalize_query(query), (site or "").lower(), start_index)
+
+    def get(self, key: PageKey) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            items = self._pages.get(key)
+        if items is not None:
+            self.hits += 1
+            telemetry.add("cache_hits")
+        return items
+
+    def put(self, key: PageKey, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._pages[key] = items
+
+    async def get_or_fetch(
+        self,
+        key: PageKey,
+        fetch: Callable[[], Awaitable[Tuple[List[Dict[str, Any]], bool]]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the cached page, or fetches it once for every concurrent caller.
+        `fetch` returns the page items and whether they may be cached (e.g. not an API error).
+        """
+        items = self.get(key)
+        if items is not None:
+            return items
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The caller fetching the page was cancelled (e.g. its client disconnected), fetch it ourselves
+                return await self.get_or_fetch(key, fetch)
+
+        self.misses += 1
+        telemetry.add("cache_misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            items, cacheable = await fetch()
+            if cacheable:
+                self.put(key, items)
+            future.set_result(items)
+            return items
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Mark as retrieved in case no other caller was waiting
+                future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters since process start, plus the number of cached pages."""
+        with self._lock:
+            pages = len(self._pages)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "pages": pages,
+        }
+
+
+_search_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """Returns the process-wide search cache, or None when it is disabled."""
+    global _search_cache
+    if not config.SEARCH_CACHE_ENABLED:
+        return None
+    if _search_cache is None:
+        _search_cache = SearchCache(ttl=config.SEARCH_CACHE_TTL, max_pages=config.SEARCH_CACHE_MAX_PAGES)
+    return _search_cache
@@ -1,11 +1,22 @@
-from typing import Optional
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
 from urllib.parse import urlparse
+import asyncio
+import codecs
 import re
-import requests
+import httpx
 from bs4 import BeautifulSoup
 from markdownify import markdownify
 from pydantic import BaseModel, Field, HttpUrl
 from readability import Document
+from api.agents import telemetry
+from api.config import config
+from . import html_extract
+from .http_client import get_async_client, host_slot, run_blocking
+from .local_search import LocalDocument, get_local_index
+from .page_cache import CachedPage, get_page_cache
+from .parse_pool import get_parse_pool
+from .passages import Passage, top_passages
 
 
 class WebpageMetadata(BaseModel):
@@ -25,12 +36,115 @@ class WebScraperInput(BaseModel):
     include_links: bool = Field(
         default=True, description="Whether to preserve hyperlinks in the markdown output.",
     )
+    max_bytes: Optional[int] = Field(
+        default=None, description="Stop downloading after this many bytes (defaults to SCRAPER_MAX_BYTES).", ge=1,
+    )
+    max_chars: Optional[int] = Field(
+        default=None, description="Stop converting once this many characters of markdown were produced.", ge=1,
+    )
 
 
 class WebScraperOutput(BaseModel):
     """Schema for the output of the WebScraperTool."""
     content: str = Field(..., description="The scraped content in markdown format.")
     metadata: WebpageMetadata = Field(..., description="Metadata about the scraped webpage.")
+    truncated: bool = Field(False, description="Whether the content was cut off at the download size cap or at max_chars.")
+
+
+class WebScraperPassagesOutput(BaseModel):
+    """Schema for the passages of a scraped webpage that are most relevant to a query."""
+    passages: List[Passage] = Field(..., description="The most relevant passages, in page order.")
+    metadata: WebpageMetadata = Field(..., description="Metadata about the scraped webpage.")
+    total_chars: int = Field(..., description="Length of the whole page content the passages were taken from.")
+    truncated: bool = Field(False, description="Whether the page content was cut off at the download size cap.")
+
+
+# Content types the scraper knows how to turn into markdown
+ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml")
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([a-zA-Z0-9_-]+)""", re.I)
+# How much of the body to look at for a <meta charset> when the headers don't declare one
+_SNIFF_BYTES = 1024
+
+
+def _incremental_decoder(charset: Optional[str]) -> Tuple[str, codecs.IncrementalDecoder]:
+    """An incremental decoder for the charset, falling back to UTF-8 for unknown ones."""
+    try:
+        return charset, codecs.getincrementaldecoder(charset)(errors="replace")
+    except (LookupError, TypeError):
+        return "utf-8", codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+@dataclass
+class FetchedPage:
+    """A downloaded page, decoded while it was streamed."""
+    status_code: int
+    headers: httpx.Headers
+    text: str = ""
+    size: int = 0
+    charset: Optional[str] = None
+    truncated: bool = False
+
+
+@dataclass
+class _PageReader:
+    """
+    Decodes a streamed response body as it arrives, stopping at a byte cap. The charset comes from the
+    Content-Type header; without one, the first _SNIFF_BYTES are held back to look for a <meta> charset.
+    Characters split across chunks are carried over by the incremental decoder.
+    """
+    max_bytes: int
+    charset: Optional[str] = None
+    truncated: bool = False
+    size: int = 0
+    _head: bytearray = field(default_factory=bytearray)
+    _decoder: Optional[codecs.IncrementalDecoder] = None
+    _parts: List[str] = field(default_factory=list)
+
+    @classmethod
+    def for_response(cls, response: httpx.Response, max_bytes: int) -> "_PageReader":
+        """Validates the response headers before any of the body is read."""
+        content_type = response.headers.get("Content-Type", "")
+        mime_type = content_type.split(";")[0].strip().lower()
+        if mime_type and mime_type not in ALLOWED_CONTENT_TYPES:
+            raise ValueError(f"Unsupported content type: {mime_type}")
+        return cls(max_bytes=max_bytes, charset=response.charset_encoding)
+
+    def _decode(self, data: bytes, final: bool = False) -> None:
+        if self._decoder is None:
+            self._head.extend(data)
+            if not self.charset and len(self._head) < _SNIFF_BYTES and not final:
+                return
+            if not self.charset:
+                match = _META_CHARSET.search(self._head[:_SNIFF_BYTES])
+                self.charset = match.group(1).decode("ascii") if match else "utf-8"
+            self.charset, self._decoder = _incremental_decoder(self.charset)
+            data = bytes(self._head)
+            self._head.clear()
+        self._parts.append(self._decoder.decode(data, final))
+
+    def feed(self, chunk: bytes) -> bool:
+        """Decodes a chunk, returns False once bytes past the cap arrive and the download should stop."""
+        remaining = self.max_bytes - self.size
+        # A body of exactly the cap is whole; it's only cut off when more bytes follow
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+            self.truncated = True
+        self.size += len(chunk)
+        self._decode(chunk)
+        return not self.truncated
+
+    def finish(self, page: FetchedPage) -> FetchedPage:
+        self._decode(b"", final=True)
+        page.text = "".join(self._parts)
+        page.size = self.size
+        page.charset = self.charset
+        page.truncated = self.truncated
+        return page
+
+
+def convert_page(html_content: str, params: WebScraperInput) -> WebScraperOutput:
+    """Converts a downloaded page to markdown with metadata. Runs in the parse pool."""
+    return WebScraperTool._to_output(html_content, params)
 
 
 class WebScraperTool:
@@ -42,23 +156,37 @@ class WebScraperTool:
             "AppleWebKit/537.36 (KHTML, like Gecko) "
             "Chrome/91.0.4472.124 Safari/537.36"
         )
-        self.timeout = 30
-        self.max_content_length = 100_000_000
+        self.timeout = config.HTTP_READ_TIMEOUT
+        self.max_content_length = config.SCRAPER_MAX_BYTES
+        self.cache = get_page_cache()
+        self.local = get_local_index()
 
-    def _fetch_webpage(self, url: str) -> str:
-        """Fetches the webpage content with custom headers."""
-        headers = {
+    def _headers(self) -> dict:
+        """Custom headers sent with every page request."""
+        return {
             "User-Agent": self.user_agent,
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
             "Accept-Language": "en-US,en;q=0.5",
-            "Connection": "keep-alive",
         }
-        response = requests.get(url, headers=headers, timeout=self.timeout)
-        if len(response.content) > self.max_content_length:
-            raise ValueError(f"Content length exceeds maximum of {self.max_content_length} bytes")
-        return response.text
 
-    def _extract_metadata(self, soup: BeautifulSoup, doc: Document, url: str) -> WebpageMetadata:
+    async def _afetch_webpage(self, url: str, extra_headers: Optional[dict] = None, max_bytes: Optional[int] = None) -> FetchedPage:
+        """Streams the webpage content with custom headers without blocking the event loop, stopping at the byte cap."""
+        headers = {**self._headers(), **(extra_headers or {})}
+        async with host_slot(url):
+            async with get_async_client().stream("GET", url, headers=headers, timeout=self.timeout) as response:
+                page = FetchedPage(status_code=response.status_code, headers=response.headers)
+                if response.status_code == 304:
+                    return page
+                reader = _PageReader.for_response(response, max_bytes or self.max_content_length)
+                async for chunk in response.aiter_bytes():
+                    if not reader.feed(chunk):
+                        break
+        page = reader.finish(page)
+        telemetry.add("bytes", page.size)
+        return page
+
+    @staticmethod
+    def _extract_metadata(soup: BeautifulSoup, doc: Document, url: str) -> WebpageMetadata:
         """Extracts metadata from the webpage."""
         domain = urlparse(url).netloc
         
@@ -85,7 +213,8 @@ class WebScraperTool:
             
         return WebpageMetadata(**metadata)
 
-    def _clean_markdown(self, markdown: str) -> str:
+    @staticmethod
+    def _clean_markdown(markdown: str) -> str:
         """Cleans up the markdown content by removing excessive whitespace and normalizing formatting."""
         # Remove multiple blank lines
         markdown = re.sub(r"\n\s*\n\s*\n", "\n\n", markdown)
@@ -95,7 +224,8 @@ class WebScraperTool:
         markdown = markdown.strip() + "\n"
         return markdown
 
-    def _extract_main_content(self, soup: BeautifulSoup) -> str:
+    @staticmethod
+    def _extract_main_content(soup: BeautifulSoup) -> str:
         """Extracts the main content from the webpage using custom heuristics."""
         # Remove unwanted elements
         for element in soup.find_all(["script", "style", "nav", "header", "footer"]):
@@ -116,15 +246,96 @@ class WebScraperTool:
         return str(main_content) if main_content else str(soup)
 
     def scrape(self, params: WebScraperInput) -> WebScraperOutput:
-        """Scrapes webpage content and returns it as markdown with metadata."""
-        # Fetch webpage content
-        html_content = self._fetch_webpage(str(params.url))
+        """Blocking `ascrape`, for scripts; must not be called from a running event loop."""
+        return run_blocking(self.ascrape(params))
+
+    async def ascrape(self, params: WebScraperInput) -> WebScraperOutput:
+        """
+        Scrapes webpage content without blocking the event loop: the SQLite lookups of the local index
+        and the page cache run in threads, and the parsing in the parse pool.
+        """
+        url = str(params.url)
+        # Pages of the local index are served without a download
+        if self.local and (document := await asyncio.to_thread(self.local.document, url)):
+            return self._from_local(document, params)
+        cached = await asyncio.to_thread(self.cache.get, url, params.include_links) if self.cache else None
+        if cached and cached.is_fresh(self.cache.ttl):
+            return self._from_cache(cached, params)
+        
+        page = await self._afetch_webpage(url, cached.revalidation_headers() if cached else None, params.max_bytes)
+        if cached and page.status_code == 304:
+            # The server confirmed the cached page as unchanged
+            await asyncio.to_thread(self.cache.mark_revalidated, url, params.include_links)
+            return self._from_cache(cached, params)
+        # Parsing is CPU-bound, so it runs in the parse pool instead of on the event loop
+        output = await get_parse_pool().run(convert_page, page.text, params)
+        return await asyncio.to_thread(self._store, page, params, output)
+
+    async def apassages(
+        self, params: WebScraperInput, query: str, max_passages: int, max_chars: int
+    ) -> WebScraperPassagesOutput:
+        """Scrapes the webpage and keeps only the passages most relevant to the query, within `max_chars`."""
+        output = await self.ascrape(params)
+        passages = await get_parse_pool().run(top_passages, output.content, query, max_passages, max_chars)
+        return WebScraperPassagesOutput(
+            passages=passages, metadata=output.metadata, total_chars=len(output.content), truncated=output.truncated
+        )
+
+    def _from_cache(self, cached: CachedPage, params: WebScraperInput) -> WebScraperOutput:
+        content = cached.content
+        if params.max_chars and len(content) > params.max_chars:
+            return WebScraperOutput(content=content[:params.max_chars], metadata=WebpageMetadata(**cached.metadata), truncated=True)
+        return WebScraperOutput(content=content, metadata=WebpageMetadata(**cached.metadata))
+
+    def _from_local(self, document: LocalDocument, params: WebScraperInput) -> WebScraperOutput:
+        metadata = WebpageMetadata(title=document.title, domain=urlparse(document.url).netloc)
+        if params.max_chars and len(document.content) > params.max_chars:
+            return WebScraperOutput(content=document.content[:params.max_chars], metadata=metadata, truncated=True)
+        return WebScraperOutput(content=document.content, metadata=metadata)
+
+    def _store(self, page: FetchedPage, params: WebScraperInput, output: WebScraperOutput) -> WebScraperOutput:
+        """Caches a freshly converted page."""
+        output.truncated = output.truncated or page.truncated
+        # Truncated pages are incomplete, so only whole pages go to the cache
+        if self.cache and 200 <= page.status_code < 300 and not output.truncated:
+            self.cache.put(
+                str(params.url),
+                params.include_links,
+                output.content,
+                output.metadata.model_dump(),
+                etag=page.headers.get("ETag"),
+                last_modified=page.headers.get("Last-Modified"),
+            )
+        return output
+
+    @staticmethod
+    def _to_output(html_content: str, params: WebScraperInput) -> WebScraperOutput:
+        """Converts the fetched HTML into markdown with metadata, parsing it only once."""
+        if not html_extract.LXML_AVAILABLE:
+            return WebScraperTool._to_output_bs4(html_content, params)
         
+        page = html_extract.extract(html_content, include_links=params.include_links, max_chars=params.max_chars)
+        metadata = WebpageMetadata(
+            title=page.title,
+            author=page.author,
+            description=page.description,
+            site_name=page.site_name,
+            domain=urlparse(str(params.url)).netloc,
+        )
+        return WebScraperOutput(
+            content=WebScraperTool._clean_markdown(page.markdown),
+            metadata=metadata,
+            truncated=page.cut,
+        )
+
+    @staticmethod
+    def _to_output_bs4(html_content: str, params: WebScraperInput) -> WebScraperOutput:
+        """Converts the fetched HTML into markdown with BeautifulSoup and markdownify, used when lxml is missing."""
         # Parse HTML with BeautifulSoup
         soup = BeautifulSoup(html_content, "html.parser")
         
         # Extract main content using custom extraction
-        main_content = self._extract_main_content(soup)
+        main_content = WebScraperTool._extract_main_content(soup)
         
         # Convert to markdown
         markdown_options = {
@@ -140,10 +351,10 @@ class WebScraperTool:
         markdown_content = markdownify(main_content, **markdown_options)
         
         # Clean up the markdown
-        markdown_content = self._clean_markdown(markdown_content)
+        markdown_content = WebScraperTool._clean_markdown(markdown_content)
         
         # Extract metadata
-        metadata = self._extract_metadata(soup, Document(html_content), str(params.url))
+        metadata = WebScraperTool._extract_metadata(soup, Document(html_content), str(params.url))
         
         return WebScraperOutput(
             content=markdown_content,
@@ -0,0 +1,140 @@
+"""
+Benchmark of the single-parse extraction engine against the BeautifulSoup + readability + markdownify path.
+
+Usage:
+    python -m api.benchmarks.extraction --fetch          # save the reference OWASP/MITRE pages into the corpus
+    python -m api.benchmarks.extraction                  # run on the saved corpus
+    python -m api.benchmarks.extraction --synthetic 20   # run on generated pages, no network needed
+"""
+import argparse
+import os
+import random
+import time
+from typing import List, Tuple
+from api.agents.tools.http_client import run_blocking
+from api.agents.tools.web_scraper import WebScraperInput, WebScraperTool
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+
+# Pages the mitigation agent typically lands on
+REFERENCE_PAGES = [
+    "https://cheatsheetseries.owasp.org/cheatsheets/JSON_Web_Token_for_Java_Cheat_Sheet.html",
+    "https://cheatsheetseries.owasp.org/cheatsheets/Server_Side_Request_Forgery_Prevention_Cheat_Sheet.html",
+    "https://cheatsheetseries.owasp.org/cheatsheets/Transport_Layer_Security_Cheat_Sheet.html",
+    "https://cheatsheetseries.owasp.org/cheatsheets/SQL_Injection_Prevention_Cheat_Sheet.html",
+    "https://cheatsheetseries.owasp.org/cheatsheets/Authentication_Cheat_Sheet.html",
+    "https://owasp.org/www-community/attacks/csrf",
+    "https://owasp.org/Top10/A01_2021-Broken_Access_Control/",
+    "https://attack.mitre.org/techniques/T1190/",
+    "https://attack.mitre.org/techniques/T1557/",
+    "https://cwe.mitre.org/data/definitions/918.html",
+]
+
+
+def fetch_corpus(corpus: str) -> None:
+    """Saves the reference pages as raw HTML."""
+    tool = WebScraperTool()
+    os.makedirs(corpus, exist_ok=True)
+    for i, url in enumerate(REFERENCE_PAGES):
+        try:
+            page = run_blocking(tool._afetch_webpage(url))
+        except Exception as e:
+            print(f"skip {url}: {e}")
+            continue
+        path = os.path.join(corpus, f"{i:02d}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"<!-- {url} -->\n{page.text}")
+        print(f"saved {url} -> {path} ({len(page.text)} chars)")
+
+
+def synthetic_page(seed: int) -> str:
+    """Generates a cheat-sheet-like page: navigation chrome, a long article with lists, tables and code."""
+    rng = random.Random(seed)
+    words = "token signature replay validation header claim server client attacker request session key".split()
+
+    def sentence() -> str:
+        return " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+    nav = "".join(f'<li><a href="/cheatsheets/{i}.html">Cheat Sheet {i}</a></li>' for i in range(150))
+    sections = []
+    for s in range(rng.randint(10, 25)):
+        paragraphs = "".join(f"<p>{sentence()} <a href='#s{s}'>{sentence()}</a> <code>{rng.choice(words)}</code></p>" for _ in range(4))
+        items = "".join(f"<li><strong>{rng.choice(words)}</strong> {sentence()}</li>" for _ in range(5))
+        rows = "".join(f"<tr><td>{rng.choice(words)}</td><td>{sentence()}</td></tr>" for _ in range(4))
+        sections.append(
+            f"<h2 id='s{s}'>Section {s}</h2>{paragraphs}<ul>{items}</ul>"
+            f"<table><tr><th>Name</th><th>Description</th></tr>{rows}</table>"
+            f"<pre><code>if ({rng.choice(words)}) {{ verify(); }}</code></pre>"
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Synthetic Cheat Sheet</title>"
+        "<meta name='description' content='Synthetic page'><meta property='og:site_name' content='OWASP'>"
+        "<script>var analytics = 1;</script><style>body { color: black; }</style></head>"
+        f"<body><header><nav><ul>{nav}</ul></nav></header>"
+        f"<div class='md-content'><article><h1>Cheat Sheet {seed}</h1>{''.join(sections)}</article></div>"
+        "<footer>Footer</footer></body></html>"
+    )
+
+
+def load_corpus(corpus: str) -> List[Tuple[str, str]]:
+    pages = []
+    for name in sorted(os.listdir(corpus)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus, name), encoding="utf-8") as f:
+                pages.append((name, f.read()))
+    return pages
+
+
+def time_call(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(pages: List[Tuple[str, str]], repeat: int) -> None:
+    tool = WebScraperTool()
+    params = WebScraperInput(url="https://cheatsheetseries.owasp.org/bench.html", include_links=True)
+    capped = WebScraperInput(url="https://cheatsheetseries.owasp.org/bench.html", include_links=True, max_chars=1000)
+
+    print(f"{'page':<14}{'KB':>8}{'legacy ms':>12}{'single ms':>12}{'1000ch ms':>12}{'speedup':>9}{'md ratio':>10}")
+    legacy_total, single_total, capped_total = 0.0, 0.0, 0.0
+    for name, html in pages:
+        legacy = time_call(lambda: tool._to_output_bs4(html, params), repeat)
+        single = time_call(lambda: tool._to_output(html, params), repeat)
+        first = time_call(lambda: tool._to_output(html, capped), repeat)
+        ratio = len(tool._to_output(html, params).content) / max(1, len(tool._to_output_bs4(html, params).content))
+        legacy_total, single_total, capped_total = legacy_total + legacy, single_total + single, capped_total + first
+        print(f"{name:<14}{len(html) / 1024:>8.0f}{legacy * 1000:>12.1f}{single * 1000:>12.1f}{first * 1000:>12.1f}"
+              f"{legacy / single:>8.1f}x{ratio:>10.2f}")
+
+    print(f"\n{len(pages)} pages: legacy {legacy_total * 1000:.0f} ms, single-parse {single_total * 1000:.0f} ms "
+          f"({legacy_total / single_total:.1f}x), first 1000 chars {capped_total * 1000:.0f} ms "
+          f"({legacy_total / capped_total:.1f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Directory of saved .html pages")
+    parser.add_argument("--fetch", action="store_true", help="Download the reference pages into the corpus first")
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark N generated pages instead of the corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per page, the fastest one is reported")
+    args = parser.parse_args()
+
+    if args.fetch:
+        fetch_corpus(args.corpus)
+    if args.synthetic:
+        pages = [(f"synthetic-{i:02d}", synthetic_page(i)) for i in range(args.synthetic)]
+    elif os.path.isdir(args.corpus):
+        pages = load_corpus(args.corpus)
+    else:
+        pages = []
+    if not pages:
+        parser.error(f"No pages in {args.corpus}; run with --fetch or --synthetic N")
+    run(pages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
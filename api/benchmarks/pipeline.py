@@ -0,0 +1,404 @@
+"""
+End-to-end benchmark of `tm.analyze` without network access: the LLM is a pydantic-ai FunctionModel with
+a configurable latency distribution, and Google search and the scraped pages are served by a local HTTP
+stand-in, from the saved corpus (see api.benchmarks.extraction) or generated pages.
+
+Usage:
+    python -m api.benchmarks.pipeline                          # 5, 50 and 500 relationships
+    python -m api.benchmarks.pipeline --sizes 5,20 --batch-size 4 --llm-latency 400
+    python -m api.benchmarks.pipeline --record                 # save real search results (needs Google keys)
+    python -m api.benchmarks.pipeline --json results.json      # keep the results to compare runs
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from api.benchmarks.extraction import DEFAULT_CORPUS, fetch_corpus, load_corpus, synthetic_page
+from api.config import config
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - falls back to the peak RSS reported by getrusage
+    psutil = None
+
+SEARCH_FIXTURE = "search.json"
+# Queries recorded with --record, close to what the mitigation agent searches for
+RECORDED_QUERIES = [
+    "JWT signature validation", "server side request forgery prevention", "TLS certificate validation",
+    "SQL injection prevention", "session fixation", "cross site request forgery", "broken access control",
+    "OAuth token replay", "rate limiting denial of service", "audit logging repudiation",
+]
+# Rough completion sizes used to turn token counts into generation time
+TOKENS_PER_THREAT = 300
+TOKENS_PER_MITIGATION = 200
+TOKENS_PER_RELATIONSHIP = 40
+_BATCH_LINE = re.compile(r"^\s*\[(\d+)\] Source: (.*?) \| Target: (.*?) \| Type: (.*?) \| Details: (.*)$", re.M)
+_SINGLE = re.compile(r"relationship from (.*?) to (.*?)\.\s*$", re.M)
+_CATEGORIES = ["Spoofing", "Tampering", "Repudiation", "Information Disclosure", "Denial of Service", "Elevation of Privilege"]
+
+
+def diagram(size: int) -> str:
+    """A Mermaid flowchart with `size` distinct edges, wrapped in some prose."""
+    lines = [f"    C{i}[Service {i}] -->|HTTPS call {i} with bearer token| C{i + 1}[Service {i + 1}]" for i in range(size)]
+    return "Microservices exchanging JSON over HTTPS behind an API gateway.\n\n```mermaid\ngraph TD\n" + "\n".join(lines) + "\n```"
+
+
+class Latency:
+    """Log-normal time to first token around `median_ms`, plus generation time at `tokens_per_second`."""
+
+    def __init__(self, median_ms: float, sigma: float, tokens_per_second: float, seed: int):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+        self.tokens_per_second = tokens_per_second
+        self.rng = random.Random(seed)
+
+    def sample(self, output_tokens: int = 0) -> float:
+        first_token = self.rng.lognormvariate(math.log(self.median), self.sigma) if self.median > 0 else 0.0
+        return first_token + (output_tokens / self.tokens_per_second if self.tokens_per_second else 0.0)
+
+
+class MockLLM:
+    """
+    Answers for every agent of the pipeline from its result schema: relationships parsed from the diagram
+    in the prompt, `threats` threats per relationship, and mitigations that call research_web_security_topic
+    once before answering, so searches and scrapes go through the web stand-in.
+    """
+
+    def __init__(self, latency: Latency, threats: int, depth: int):
+        self.latency = latency
+        self.threats = threats
+        self.depth = depth
+        self.ids = itertools.count()
+        self.calls = 0
+
+    def _threats(self, relationship: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            {
+                "id": f"T{next(self.ids)}",
+                "category": _CATEGORIES[k % len(_CATEGORIES)],
+                "name": f"Token replay against {relationship['target']}",
+                "scope": relationship,
+                "impacts": "Unauthorized access to the target service",
+                "threat": "An attacker replays a captured bearer token",
+                "attack_vectors": "Token theft from logs, man-in-the-middle on internal hops",
+                "prerequisites": "Tokens without audience or expiry checks",
+                "severity": "High",
+                "likelihood": "Medium",
+            }
+            for k in range(self.threats)
+        ]
+
+    async def respond(self, messages, info):
+        from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart, ToolReturnPart
+        from api.services import mermaid
+
+        self.calls += 1
+        prompt = "\n".join(
+            part.content for message in messages for part in getattr(message, "parts", [])
+            if getattr(part, "part_kind", "") == "user-prompt" and isinstance(part.content, str)
+        )
+        result_tool = info.result_tools[0] if info.result_tools else None
+        fields = set((result_tool.parameters_json_schema.get("properties") or {}) if result_tool else ())
+
+        if "relationships" in fields:
+            parsed = mermaid.parse(prompt)
+            relationships = [r.model_dump() for r in parsed.relationships]
+            args, tokens = {"relationships": relationships, "context": mermaid.describe(parsed)}, TOKENS_PER_RELATIONSHIP * len(relationships)
+        elif "results" in fields:
+            results = [
+                {"index": int(index), "threats": self._threats({"source": source, "target": target, "direction": direction, "description": details})}
+                for index, source, target, direction, details in _BATCH_LINE.findall(prompt)
+            ]
+            args, tokens = {"results": results}, TOKENS_PER_THREAT * self.threats * len(results)
+        elif "threats" in fields:
+            match = _SINGLE.search(prompt)
+            source, target = match.groups() if match else ("source", "target")
+            args = {"threats": self._threats({"source": source, "target": target, "direction": "→", "description": None})}
+            tokens = TOKENS_PER_THREAT * self.threats
+        elif "content" in fields:
+            researched = any(isinstance(part, ToolReturnPart) for message in messages for part in getattr(message, "parts", []))
+            if not researched and any(tool.name == "research_web_security_topic" for tool in info.function_tools):
+                await asyncio.sleep(self.latency.sample())
+                topic = prompt.splitlines()[2] if len(prompt.splitlines()) > 2 else "token replay"
+                return ModelResponse(parts=[ToolCallPart(
+                    "research_web_security_topic", {"topic": topic, "depth": self.depth}, tool_call_id=f"call-{self.calls}"
+                )])
+            args, tokens = {"content": "Validate token audience and expiry; bind tokens to mTLS.", "sources": ["https://owasp.org"]}, TOKENS_PER_MITIGATION
+        else:
+            await asyncio.sleep(self.latency.sample())
+            return ModelResponse(parts=[TextPart("ok")])
+
+        await asyncio.sleep(self.latency.sample(tokens))
+        return ModelResponse(parts=[ToolCallPart(result_tool.name, args, tool_call_id=f"call-{self.calls}")])
+
+
+class WebStandIn:
+    """
+    Local HTTP server standing in for the Custom Search API and the pages it links to. Searches replay the
+    recorded results (round-robin) or list generated ones; every link points back to a page of this server.
+    """
+
+    def __init__(self, pages: List[str], recorded: List[List[Dict[str, str]]], latency: Latency):
+        self.pages = pages
+        self.recorded = recorded
+        self.latency = latency
+        self.port = 0
+        self.requests = 0
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _items(self, query: str, start: int) -> List[Dict[str, str]]:
+        seed = int(hashlib.sha256(query.encode("utf-8")).hexdigest()[:8], 16)
+        if self.recorded:
+            items = self.recorded[seed % len(self.recorded)]
+        else:
+            items = [{"title": f"Cheat sheet {i}", "snippet": f"How to defend against {query}"} for i in range(10)]
+        return [
+            {**item, "link": f"{self.base_url}/pages/{(seed + start + i) % len(self.pages)}"}
+            for i, item in enumerate(items[:10])
+        ]
+
+    def app(self):
+        from starlette.applications import Starlette
+        from starlette.responses import HTMLResponse, JSONResponse
+        from starlette.routing import Route
+
+        async def search(request):
+            self.requests += 1
+            await asyncio.sleep(self.latency.sample())
+            start = int(request.query_params.get("start", "1"))
+            return JSONResponse({"items": self._items(request.query_params.get("q", ""), start)})
+
+        async def page(request):
+            self.requests += 1
+            await asyncio.sleep(self.latency.sample())
+            return HTMLResponse(self.pages[int(request.path_params["index"]) % len(self.pages)])
+
+        return Starlette(routes=[Route("/customsearch/v1", search), Route("/pages/{index:int}", page)])
+
+    def start(self) -> None:
+        """Serves from a thread with its own event loop, so the benchmarked loop only runs the pipeline."""
+        import socket
+        import uvicorn
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(self.app(), host="127.0.0.1", port=self.port, log_level="warning", lifespan="off"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+
+class LoopMonitor:
+    """Samples event loop lag (how late a periodic wake-up runs) and resident memory while a run goes on."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self.peak_rss = 0
+        self._task: Optional[asyncio.Task] = None
+        self._process = psutil.Process() if psutil else None
+
+    async def _sample(self) -> None:
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - before - self.interval))
+            if self._process:
+                self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+
+    def __enter__(self) -> "LoopMonitor":
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._task.cancel()
+        if not self._process:
+            # Peak of the whole process so far, in KB on Linux and bytes on macOS
+            self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+    def lag(self, quantile: float) -> float:
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+async def run_once(size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    from api.services import tm
+
+    request = tm.ThreatModelRequest(
+        user_input=diagram(size),
+        relationship_mode=args.relationship_mode,
+        stride_concurrency=args.stride_concurrency,
+        mitigation_concurrency=args.mitigation_concurrency,
+        stride_batch_size=args.batch_size,
+        use_cache=args.cache,
+    )
+    events, threats, first_threat, complete = 0, 0, None, None
+    start = time.perf_counter()
+    with LoopMonitor() as monitor:
+        async for frame in tm.analyze(request):
+            for line in frame.splitlines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                for event in event["events"] if event["type"] == "batch" else [event]:
+                    events += 1
+                    if event["type"] == "threat_identified":
+                        threats += 1
+                        first_threat = first_threat or time.perf_counter() - start
+                    elif event["type"] == "process_complete":
+                        complete = event
+                    elif event["type"] == "error":
+                        raise RuntimeError(event["message"])
+    wall = time.perf_counter() - start
+    return {
+        "relationships": size,
+        "threats": threats,
+        "first_threat_s": round(first_threat or 0.0, 3),
+        "wall_s": round(wall, 3),
+        "events": events,
+        "events_per_s": round(events / wall, 1),
+        "peak_rss_mb": round(monitor.peak_rss / 2 ** 20, 1),
+        "loop_lag_p99_ms": round(monitor.lag(0.99) * 1000, 2),
+        "loop_lag_max_ms": round(max(monitor.lags, default=0.0) * 1000, 2),
+        "stages": (complete or {}).get("metrics", {}).get("stages", {}),
+    }
+
+
+def configure(args: argparse.Namespace, web: WebStandIn) -> None:
+    """Points the tools at the stand-in and keeps every run independent of the previous ones."""
+    config.CACHE_DIR = tempfile.mkdtemp(prefix="deeptm-bench-")
+    config.OPENAI_API_KEY = config.OPENAI_API_KEY or "bench"
+    config.GOOGLE_API_KEY, config.GOOGLE_CSE_ID = "bench", "bench"
+    config.GOOGLE_SEARCH_URL = f"{web.base_url}/customsearch/v1"
+    # Every search and page goes to the stand-in
+    config.LOCAL_SEARCH_ENABLED = False
+    if not args.cache:
+        config.PAGE_CACHE_ENABLED = config.SEARCH_CACHE_ENABLED = config.STRIDE_CACHE_ENABLED = False
+        config.MITIGATION_KB_ENABLED = False
+    if not args.rate_limits:
+        config.OPENAI_RPM = config.OPENAI_TPM = config.GOOGLE_SEARCH_QPM = 1e9
+
+
+async def run(args: argparse.Namespace, web: WebStandIn) -> List[Dict[str, Any]]:
+    from contextlib import ExitStack
+    from pydantic_ai.models.function import FunctionModel
+    from api.agents import registry
+    from api.agents.scheduler import ScheduledModel
+    from api.agents.mitgation import MitigationAgent
+    from api.agents.relationship import RelationshipAgent
+    from api.agents.stride import StrideAgent
+
+    llm = MockLLM(Latency(args.llm_latency, args.llm_sigma, args.llm_tokens_per_second, args.seed), args.threats, args.depth)
+    # Builds the process-wide agents so their model can be overridden
+    RelationshipAgent(), StrideAgent(), MitigationAgent()
+    results = []
+    with ExitStack() as stack:
+        for agent in registry._agents.values():
+            # Overrides win over the model given to run, so the stand-in is scheduled like the real one
+            model = ScheduledModel(FunctionModel(llm.respond), config.OPENAI_API_KEY)
+            stack.enter_context(agent.override(model=model))
+        for size in args.sizes:
+            result = await run_once(size, args)
+            results.append(result)
+            print(
+                f"{result['relationships']:>13}{result['threats']:>9}{result['first_threat_s']:>15.2f}{result['wall_s']:>9.2f}"
+                f"{result['events_per_s']:>10.0f}{result['peak_rss_mb']:>13.0f}{result['loop_lag_p99_ms']:>12.1f}{result['loop_lag_max_ms']:>12.1f}",
+                flush=True,
+            )
+            print("    " + ", ".join(f"{name} {stage['calls']}x {stage['seconds']:.1f}s" for name, stage in result["stages"].items()))
+    return results
+
+
+def record(corpus: str) -> None:
+    """Saves real Custom Search results for the reference queries, next to the page corpus."""
+    from api.agents.tools.google_search import GoogleSearchInput, GoogleSearchTool
+
+    tool = GoogleSearchTool()
+    recorded = []
+    for query in RECORDED_QUERIES:
+        try:
+            output = tool.search(GoogleSearchInput(query=query, num_results=10))
+        except Exception as e:
+            print(f"skip {query!r}: {e}")
+            continue
+        recorded.append([result.model_dump() for result in output.results])
+        print(f"recorded {query!r} ({len(output.results)} results)")
+    os.makedirs(corpus, exist_ok=True)
+    with open(os.path.join(corpus, SEARCH_FIXTURE), "w", encoding="utf-8") as f:
+        json.dump(recorded, f, indent=1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5,50,500", type=lambda s: [int(n) for n in s.split(",")], help="Relationship counts to run")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Saved pages and search results served by the stand-in")
+    parser.add_argument("--record", action="store_true", help="Save the reference pages and real search results into the corpus first")
+    parser.add_argument("--llm-latency", type=float, default=800, help="Median time to first token of LLM calls, in ms")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="Spread (log-normal sigma) of the time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80, help="Generation speed of LLM completions, 0 for instant")
+    parser.add_argument("--web-latency", type=float, default=150, help="Median latency of search and page requests, in ms")
+    parser.add_argument("--threats", type=int, default=3, help="Threats returned per relationship")
+    parser.add_argument("--depth", type=int, default=2, help="Pages scraped per research_web_security_topic call")
+    parser.add_argument("--relationship-mode", default="hybrid", choices=["llm", "fast", "hybrid"])
+    parser.add_argument("--stride-concurrency", type=int, default=None)
+    parser.add_argument("--mitigation-concurrency", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None, help="Relationships per STRIDE call")
+    parser.add_argument("--cache", action="store_true", help="Keep the page, search and STRIDE caches and the mitigation knowledge base enabled")
+    parser.add_argument("--rate-limits", action="store_true", help="Apply the configured OpenAI and Google rate limits")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    if args.record:
+        fetch_corpus(args.corpus)
+        record(args.corpus)
+    pages = [html for _, html in load_corpus(args.corpus)] if os.path.isdir(args.corpus) else []
+    pages = pages or [synthetic_page(i) for i in range(20)]
+    recorded = []
+    if os.path.exists(os.path.join(args.corpus, SEARCH_FIXTURE)):
+        with open(os.path.join(args.corpus, SEARCH_FIXTURE), encoding="utf-8") as f:
+            recorded = [items for items in json.load(f) if items]
+
+    web = WebStandIn(pages, recorded, Latency(args.web_latency, 0.5, 0, args.seed + 1))
+    web.start()
+    try:
+        configure(args, web)
+        print(f"{len(pages)} pages, {len(recorded) or 'no'} recorded searches; LLM {args.llm_latency:.0f} ms "
+              f"+ {args.llm_tokens_per_second:.0f} tok/s, web {args.web_latency:.0f} ms\n")
+        print(f"{'relationships':>13}{'threats':>9}{'first threat s':>15}{'wall s':>9}{'events/s':>10}{'peak RSS MB':>13}{'lag p99 ms':>12}{'lag max ms':>12}")
+        results = asyncio.run(run(args, web))
+    finally:
+        web.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "json"}, "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,123 @@ class Config(BaseSettings):
     OPENAI_API_KEY: str = os.environ.get("OPENAI_API_KEY", "")
     GOOGLE_API_KEY: str = os.environ.get("GOOGLE_API_KEY", "")
     GOOGLE_CSE_ID: str = os.environ.get("GOOGLE_CSE_ID", "")
+    # Custom Search JSON API endpoint, e.g. a local stand-in for offline benchmarks
+    GOOGLE_SEARCH_URL: str = os.environ.get("GOOGLE_SEARCH_URL", "https://www.googleapis.com/customsearch/v1")
     LOGFIRE_API_KEY: str = os.environ.get("LOGFIRE_API_KEY", "")
-    
+
+    # OpenTelemetry trace export of the pipeline spans (OTLP/HTTP); used instead of Logfire when set
+    OTEL_EXPORTER_OTLP_ENDPOINT: str = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+    OTEL_SERVICE_NAME: str = os.environ.get("OTEL_SERVICE_NAME", "deep-tm")
+
+    # Max STRIDE calls in flight for a single request / across the whole process
+    STRIDE_MAX_CONCURRENCY: int = int(os.environ.get("STRIDE_MAX_CONCURRENCY", "4"))
+    STRIDE_GLOBAL_CONCURRENCY: int = int(os.environ.get("STRIDE_GLOBAL_CONCURRENCY", "16"))
+    # Size of the per-request mitigation worker pool fed by the STRIDE stage
+    MITIGATION_MAX_CONCURRENCY: int = int(os.environ.get("MITIGATION_MAX_CONCURRENCY", "4"))
+    # Min estimated similarity (0-1) of the name and attack vectors of two threats of the same category
+    # for them to share one mitigation research
+    MITIGATION_CLUSTER_THRESHOLD: float = float(os.environ.get("MITIGATION_CLUSTER_THRESHOLD", "0.6"))
+
+    # Context compaction: contexts of at least CONTEXT_COMPACT_MIN_TOKENS are cut into a summary of at most
+    # CONTEXT_SUMMARY_TOKENS plus at most CONTEXT_COMPONENT_TOKENS about each component of the prompt's relationships
+    CONTEXT_COMPACT_MIN_TOKENS: int = int(os.environ.get("CONTEXT_COMPACT_MIN_TOKENS", "600"))
+    CONTEXT_SUMMARY_TOKENS: int = int(os.environ.get("CONTEXT_SUMMARY_TOKENS", "250"))
+    CONTEXT_COMPONENT_TOKENS: int = int(os.environ.get("CONTEXT_COMPONENT_TOKENS", "200"))
+
+    # Relationships packed into one STRIDE call (1 disables batching), bounded by the token budgets below:
+    # expected output tokens per relationship, and max output and relationship-list input tokens per call
+    STRIDE_BATCH_SIZE: int = int(os.environ.get("STRIDE_BATCH_SIZE", "1"))
+    STRIDE_TOKENS_PER_RELATIONSHIP: int = int(os.environ.get("STRIDE_TOKENS_PER_RELATIONSHIP", "1500"))
+    STRIDE_BATCH_OUTPUT_TOKENS: int = int(os.environ.get("STRIDE_BATCH_OUTPUT_TOKENS", "12000"))
+    STRIDE_BATCH_INPUT_TOKENS: int = int(os.environ.get("STRIDE_BATCH_INPUT_TOKENS", "6000"))
+
+    # Rate limits applied per API key by the call scheduler (requests and tokens per minute, search queries per minute)
+    OPENAI_RPM: float = float(os.environ.get("OPENAI_RPM", "500"))
+    OPENAI_TPM: float = float(os.environ.get("OPENAI_TPM", "30000"))
+    GOOGLE_SEARCH_QPM: float = float(os.environ.get("GOOGLE_SEARCH_QPM", "100"))
+    # Retries of rate-limited or failed calls: max attempts after the first, base and max backoff in seconds
+    SCHEDULER_MAX_RETRIES: int = int(os.environ.get("SCHEDULER_MAX_RETRIES", "4"))
+    SCHEDULER_BASE_DELAY: float = float(os.environ.get("SCHEDULER_BASE_DELAY", "1"))
+    SCHEDULER_MAX_DELAY: float = float(os.environ.get("SCHEDULER_MAX_DELAY", "30"))
+
+    # Pooled LLM model clients, one per API key: idle time in seconds before eviction, and max pool size
+    MODEL_POOL_IDLE_TTL: float = float(os.environ.get("MODEL_POOL_IDLE_TTL", "900"))
+    MODEL_POOL_MAX_SIZE: int = int(os.environ.get("MODEL_POOL_MAX_SIZE", "256"))
+
+    # Shared HTTP client used by the search and scraper tools
+    HTTP_CONNECT_TIMEOUT: float = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT: float = float(os.environ.get("HTTP_READ_TIMEOUT", "15"))
+    HTTP_MAX_CONNECTIONS: int = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "30"))
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", "6"))
+    HTTP_ENABLE_HTTP2: bool = os.environ.get("HTTP_ENABLE_HTTP2", "true").lower() == "true"
+
+    # research_web_security_topic: pages scraped at once per call, and overall scrape deadline in seconds
+    RESEARCH_SCRAPE_CONCURRENCY: int = int(os.environ.get("RESEARCH_SCRAPE_CONCURRENCY", "3"))
+    RESEARCH_DEADLINE: float = float(os.environ.get("RESEARCH_DEADLINE", "10"))
+    # research_web_security_topic only keeps the passages of each page most relevant to the topic, within
+    # RESEARCH_PASSAGE_CHARS chars, so it downloads less of each page
+    RESEARCH_MAX_BYTES: int = int(os.environ.get("RESEARCH_MAX_BYTES", str(256 * 1024)))
+    RESEARCH_PASSAGE_CHARS: int = int(os.environ.get("RESEARCH_PASSAGE_CHARS", "1000"))
+
+    # scrape_webpage returns the passages most relevant to the threat (or the query the model gives):
+    # at most SCRAPE_MAX_PASSAGES of them and SCRAPE_PASSAGE_CHARS chars in total
+    SCRAPE_MAX_PASSAGES: int = int(os.environ.get("SCRAPE_MAX_PASSAGES", "5"))
+    SCRAPE_PASSAGE_CHARS: int = int(os.environ.get("SCRAPE_PASSAGE_CHARS", "4000"))
+
+    # Download cap for a scraped page; the download stops as soon as it is reached
+    SCRAPER_MAX_BYTES: int = int(os.environ.get("SCRAPER_MAX_BYTES", str(2 * 1024 * 1024)))
+
+    # Local full-text index of security references, built with `python -m api.agents.tools.local_search ingest`.
+    # Searches go to Google only when fewer than LOCAL_SEARCH_MIN_RESULTS indexed pages contain (nearly) every query term
+    LOCAL_SEARCH_ENABLED: bool = os.environ.get("LOCAL_SEARCH_ENABLED", "true").lower() == "true"
+    LOCAL_SEARCH_PATH: str = os.environ.get("LOCAL_SEARCH_PATH", "data/security_index.sqlite")
+    LOCAL_SEARCH_MIN_RESULTS: int = int(os.environ.get("LOCAL_SEARCH_MIN_RESULTS", "3"))
+
+    # Executor for CPU-bound page parsing: "process" (default) or "thread"; 0 workers means min(4, CPU count)
+    PARSE_EXECUTOR: str = os.environ.get("PARSE_EXECUTOR", "process")
+    PARSE_WORKERS: int = int(os.environ.get("PARSE_WORKERS", "0"))
+    # Parse jobs allowed to queue behind busy workers before scrapers have to wait
+    PARSE_MAX_QUEUE: int = int(os.environ.get("PARSE_MAX_QUEUE", "16"))
+
+    # Local directory for on-disk caches
+    CACHE_DIR: str = os.environ.get("CACHE_DIR", ".cache")
+
+    # Scraped page cache: freshness in seconds before revalidation, and total size bound
+    PAGE_CACHE_ENABLED: bool = os.environ.get("PAGE_CACHE_ENABLED", "true").lower() == "true"
+    PAGE_CACHE_TTL: float = float(os.environ.get("PAGE_CACHE_TTL", str(24 * 3600)))
+    PAGE_CACHE_MAX_BYTES: int = int(os.environ.get("PAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+    # Google search result cache: freshness in seconds, and max number of cached result pages
+    SEARCH_CACHE_ENABLED: bool = os.environ.get("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+    SEARCH_CACHE_TTL: float = float(os.environ.get("SEARCH_CACHE_TTL", str(6 * 3600)))
+    SEARCH_CACHE_MAX_PAGES: int = int(os.environ.get("SEARCH_CACHE_MAX_PAGES", "2048"))
+
+    # STRIDE result cache per relationship: max age in seconds, and max number of cached relationships
+    STRIDE_CACHE_ENABLED: bool = os.environ.get("STRIDE_CACHE_ENABLED", "true").lower() == "true"
+    STRIDE_CACHE_TTL: float = float(os.environ.get("STRIDE_CACHE_TTL", str(7 * 24 * 3600)))
+    STRIDE_CACHE_MAX_ENTRIES: int = int(os.environ.get("STRIDE_CACHE_MAX_ENTRIES", "10000"))
+
+    # Mitigations reused across runs for similar threats: min Jaccard index (0-1) of the name and attack vector
+    # words of two threats of the same category, max age in seconds, and max number of stored mitigations
+    MITIGATION_KB_ENABLED: bool = os.environ.get("MITIGATION_KB_ENABLED", "true").lower() == "true"
+    MITIGATION_KB_THRESHOLD: float = float(os.environ.get("MITIGATION_KB_THRESHOLD", "0.75"))
+    MITIGATION_KB_TTL: float = float(os.environ.get("MITIGATION_KB_TTL", str(30 * 24 * 3600)))
+    MITIGATION_KB_MAX_ENTRIES: int = int(os.environ.get("MITIGATION_KB_MAX_ENTRIES", "5000"))
+
+    # Completed runs kept for incremental re-analysis: max age in seconds, and max number of runs
+    RUNS_TTL: float = float(os.environ.get("RUNS_TTL", str(30 * 24 * 3600)))
+    RUNS_MAX_ENTRIES: int = int(os.environ.get("RUNS_MAX_ENTRIES", "1000"))
+
+    # Background jobs: how long their event logs are kept in seconds, and keep-alive interval of idle streams
+    JOBS_TTL: float = float(os.environ.get("JOBS_TTL", str(24 * 3600)))
+    JOBS_KEEPALIVE: float = float(os.environ.get("JOBS_KEEPALIVE", "15"))
+    # How often (seconds) a streaming request checks whether its client disconnected while no event is ready
+    DISCONNECT_POLL_INTERVAL: float = float(os.environ.get("DISCONNECT_POLL_INTERVAL", "1"))
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
-config = Config()
\ No newline at end of file
+config = Config()
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, Request
-from fastapi.responses import StreamingResponse
+import asyncio
+from fastapi import FastAPI, APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
@@ -10,13 +11,31 @@ print(f"Current working directory: {os.getcwd()}")
 print(f"Python path: {sys.path}")
 
 # Try absolute imports with explicit paths
-from api.services import tm
+from api.config import config
+from api.services import jobs, mitigation_kb, runs, stride_cache, tm
+from api.services.events import until_disconnected
+from api.agents import scheduler, telemetry
+from api.agents.tools import http_client, local_search, page_cache, parse_pool, search_cache
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Export pipeline spans when an OTLP endpoint or a Logfire key is configured
+    telemetry.setup_tracing()
+    yield
+    if (manager := jobs.get_job_manager()) is not None:
+        manager.shutdown()
+    telemetry.shutdown_tracing()
+    # Release pooled connections held by the search and scraper tools
+    await http_client.close_clients()
+    parse_pool.shutdown_parse_pool()
 
 # Define the app
 app = FastAPI(
     title="API for deep-tm",
     description="API for deep-tm",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -31,15 +50,102 @@ app.add_middleware(
 router = APIRouter(prefix="/api", tags=["Core API"])
 
 @router.post("/stream/stride")
-async def stream_stride_threats(request: tm.ThreatModelRequest):
+async def stream_stride_threats(request: tm.ThreatModelRequest, http_request: Request):
     """
     Streaming endpoint for the relationship extraction and STRIDE threat generation process.
+    The analysis is cancelled when the client disconnects.
     """
     print(f"Received request: {request}")
     return StreamingResponse(
-        tm.analyze(request),
+        until_disconnected(tm.analyze(request), http_request.is_disconnected, config.DISCONNECT_POLL_INTERVAL),
         media_type="text/event-stream"
     )
+
+@router.post("/stream/stride/incremental")
+async def stream_stride_threats_incremental(request: tm.IncrementalThreatModelRequest, http_request: Request):
+    """
+    Streaming endpoint that re-analyzes only the relationships changed since a previous run.
+    """
+    return StreamingResponse(
+        until_disconnected(tm.analyze_incremental(request), http_request.is_disconnected, config.DISCONNECT_POLL_INTERVAL),
+        media_type="text/event-stream"
+    )
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    """
+    Returns a previous run, with its relationships, threats and mitigations.
+    """
+    store = runs.get_run_store()
+    if store is None:
+        raise HTTPException(status_code=503, detail="Run store unavailable")
+    run = await asyncio.to_thread(store.get, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+def job_manager() -> jobs.JobManager:
+    """The job manager, or a 503 when its event log can't be opened."""
+    manager = jobs.get_job_manager()
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Background jobs unavailable")
+    return manager
+
+@router.post("/jobs")
+async def create_job(request: tm.ThreatModelRequest):
+    """
+    Starts a threat model analysis in the background, returning its job id.
+    The analysis keeps running if the client disconnects from the event stream.
+    """
+    job_id = job_manager().start(lambda: tm.analyze(request.model_copy(update={'coalesce_ms': 0, 'pace_ms': 0})))
+    return {"job_id": job_id}
+
+@router.post("/jobs/incremental")
+async def create_incremental_job(request: tm.IncrementalThreatModelRequest):
+    """
+    Starts an incremental re-analysis in the background, returning its job id.
+    """
+    job_id = job_manager().start(lambda: tm.analyze_incremental(request.model_copy(update={'coalesce_ms': 0, 'pace_ms': 0})))
+    return {"job_id": job_id}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Returns the status of a job and the number of events it produced so far.
+    """
+    job = job_manager().log.job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancels a running job. What it found so far stays in its event log and run.
+    """
+    manager = job_manager()
+    if manager.log.job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job is not running")
+    return {"job_id": job_id, "status": jobs.CANCELLED}
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request, last_event_id: int = 0):
+    """
+    Streams the events of a job from the beginning, or after the Last-Event-ID header
+    (or last_event_id query parameter) when resuming.
+    """
+    if job_manager().log.job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(
+        job_manager().stream(job_id, last_event_id),
+        media_type="text/event-stream"
+    )
+
 # Include router
 app.include_router(router)
 
@@ -48,6 +154,24 @@ app.include_router(router)
 def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: duration, tokens, retries, cache hits and bytes fetched per pipeline stage,
+    plus the state of the caches, the local search index, the parse pool and the call scheduler.
+    """
+    components = {
+        "page_cache": page_cache.get_page_cache(),
+        "search_cache": search_cache.get_search_cache(),
+        "local_search": local_search.get_local_index(),
+        "stride_cache": stride_cache.get_stride_cache(),
+        "mitigation_kb": mitigation_kb.get_mitigation_kb(),
+        "parse_pool": parse_pool.get_parse_pool(),
+        "scheduler": scheduler.get_scheduler(),
+    }
+    stats = {name: component.stats() for name, component in components.items() if component is not None}
+    return PlainTextResponse(telemetry.metrics.render(stats), media_type="text/plain; version=0.0.4")
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,122 @@
+"""
+Compaction of the design context pasted into every STRIDE and mitigation prompt. The context is split
+into sentences once per run: sentences naming components go to the slice of each component they name,
+the others make up a global summary. A prompt then gets the summary plus the slices of the components
+of its relationships, both capped in tokens, so its size no longer grows with the whole document.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List
+from api.agents.relationship import Relationship
+from api.agents.scheduler import CHARS_PER_TOKEN
+from api.config import config
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+# Words making a sentence without component names worth keeping in the summary
+_SECURITY_TERMS = re.compile(
+    r"\b(auth\w*|token\w*|session\w*|password\w*|secret\w*|credential\w*|key\w*|encrypt\w*|tls|ssl|https|"
+    r"certificate\w*|pii|personal|sensitive|privacy|gdpr|hipaa|pci|compliance|admin\w*|role\w*|permission\w*|"
+    r"privilege\w*|public|internet|external|third[- ]party|untrusted|trust\w*|boundary|firewall|vpn|"
+    r"network|log\w*|audit\w*|upload\w*|payment\w*|user\w*|tenant\w*)\b",
+    re.IGNORECASE,
+)
+
+
+def _tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+def _component_pattern(name: str) -> re.Pattern:
+    words = re.findall(r"\w+", name)
+    return re.compile(r"\b" + r"[\s_-]+".join(map(re.escape, words)) + r"s?\b", re.IGNORECASE)
+
+
+def _within(sentences: Iterable[str], budget: int) -> List[str]:
+    """The sentences, in order, that fit in `budget` tokens; longer ones are skipped."""
+    kept, used = [], 0
+    for sentence in sentences:
+        if used + _tokens(sentence) <= budget:
+            kept.append(sentence)
+            used += _tokens(sentence)
+    return kept
+
+
+@dataclass
+class CompactContext:
+    """
+    The context of one run, as a summary plus sentence slices per component. Counts the tokens every
+    prompt got, to report what the compaction saved.
+    """
+    original: str
+    summary: str
+    slices: Dict[str, List[str]] = field(default_factory=dict)
+    compacted: bool = False
+    calls: int = 0
+    tokens_sent: int = 0
+
+    def for_relationships(self, relationships: Iterable[Relationship]) -> str:
+        """The context of the given relationships."""
+        if not self.compacted:
+            return self.original
+        sentences: List[str] = []
+        for relationship in relationships:
+            for component in (relationship.source, relationship.target):
+                sentences += [s for s in self.slices.get(component.strip().lower(), []) if s not in sentences]
+        return " ".join(([self.summary] if self.summary else []) + sentences)
+
+    def prompt(self, relationships: Iterable[Relationship]) -> str:
+        """The context of the given relationships, counted as sent in a prompt."""
+        text = self.for_relationships(relationships)
+        self.calls += 1
+        self.tokens_sent += _tokens(text)
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        """Token counts of the original context and of what the prompts got instead."""
+        original = _tokens(self.original)
+        return {
+            "compacted": self.compacted,
+            "original_tokens": original,
+            "summary_tokens": _tokens(self.summary),
+            "prompts": self.calls,
+            "tokens_sent": self.tokens_sent,
+            "tokens_saved": original * self.calls - self.tokens_sent,
+        }
+
+
+def compact_context(context: str, relationships: List[Relationship], enabled: bool = True) -> CompactContext:
+    """
+    Builds the compact context of a run. Contexts under CONTEXT_COMPACT_MIN_TOKENS are kept whole.
+    The summary holds the sentences naming no component, those with security terms first, up to
+    CONTEXT_SUMMARY_TOKENS; each component slice holds up to CONTEXT_COMPONENT_TOKENS.
+    """
+    if not enabled or _tokens(context) < config.CONTEXT_COMPACT_MIN_TOKENS:
+        return CompactContext(original=context, summary=context)
+
+    components = {}
+    for relationship in relationships:
+        for name in (relationship.source, relationship.target):
+            if name.strip() and re.search(r"\w", name):
+                components.setdefault(name.strip().lower(), _component_pattern(name))
+
+    # Repeated sentences (boilerplate, generated text) are only kept once
+    sentences = list(dict.fromkeys(s.strip() for s in _SENTENCE.split(context) if s.strip()))
+    slices: Dict[str, List[str]] = {name: [] for name in components}
+    general = []
+    for position, sentence in enumerate(sentences):
+        named = [name for name, pattern in components.items() if pattern.search(sentence)]
+        for name in named:
+            slices[name].append(sentence)
+        if not named:
+            general.append((position, sentence))
+
+    # Most relevant sentences first, then back in document order
+    ranked = sorted(general, key=lambda item: (-len(_SECURITY_TERMS.findall(item[1])), item[0]))
+    chosen = set(_within((sentence for _, sentence in ranked), config.CONTEXT_SUMMARY_TOKENS))
+    summary = " ".join(sentence for _, sentence in general if sentence in chosen)
+    return CompactContext(
+        original=context,
+        summary=summary,
+        slices={name: _within(found, config.CONTEXT_COMPONENT_TOKENS) for name, found in slices.items()},
+        compacted=True,
+    )
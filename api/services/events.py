@@ -0,0 +1,98 @@
+from typing import AsyncGenerator, Awaitable, Callable, Dict, Any, List, Optional
+import json
+import asyncio
+
+
+def sse(event: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    """Format a single event as a server-sent events frame, with its id when resumable"""
+    if event_id is not None:
+        return f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+    return f"data: {json.dumps(event)}\n\n"
+
+
+async def stream_events(
+    events: asyncio.Queue,
+    coalesce_ms: int = 0,
+    pace_ms: int = 0,
+    observe: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> AsyncGenerator[str, None]:
+    """
+    Flush events from the queue as SSE frames as soon as they arrive, until a `None` sentinel is received.
+
+    Args:
+        events: Queue of event dicts produced by the pipeline
+        coalesce_ms: If set, batch every event arriving within this window after the first one
+            into a single `batch` frame
+        pace_ms: If set, minimum delay between frames, for clients that want to slow the stream down
+        observe: If set, called with every event before it is sent, e.g. to record the run
+    """
+    loop = asyncio.get_running_loop()
+    finished = False
+    while not finished:
+        event = await events.get()
+        if event is None:
+            return
+        batch: List[Dict[str, Any]] = [event]
+
+        if coalesce_ms:
+            deadline = loop.time() + coalesce_ms / 1000
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(events.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:
+                    finished = True
+                    break
+                batch.append(event)
+
+        if observe:
+            for item in batch:
+                observe(item)
+        yield sse(batch[0]) if len(batch) == 1 else sse({'type': 'batch', 'events': batch})
+
+        if pace_ms:
+            await asyncio.sleep(pace_ms / 1000)
+
+
+async def until_disconnected(
+    frames: AsyncGenerator[str, None],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    interval: float,
+) -> AsyncGenerator[str, None]:
+    """
+    Relay frames until the client disconnects, checking every `interval` seconds while no frame is ready.
+    The frames are produced in a task of their own, which is cancelled (closing the generator and
+    everything it started) as soon as the client is gone, instead of when the next write fails.
+    """
+    ready: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def produce() -> None:
+        try:
+            async for frame in frames:
+                await ready.put(frame)
+        except Exception as e:
+            # Handed over to be raised by the relay
+            await ready.put(e)
+            return
+        finally:
+            await frames.aclose()
+        await ready.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            try:
+                frame = await asyncio.wait_for(ready.get(), interval)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                continue
+            if frame is None:
+                return
+            if isinstance(frame, Exception):
+                raise frame
+            yield frame
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional, Tuple
+from api.config import config
+from api.services.events import sse
+
+# Job statuses; "interrupted" jobs were running when their process stopped, "cancelled" ones were stopped by a client
+RUNNING, COMPLETE, FAILED, INTERRUPTED, CANCELLED = "running", "complete", "failed", "interrupted", "cancelled"
+
+
+def frame_events(frame: str) -> List[Dict[str, Any]]:
+    """Decodes the events of an SSE frame produced by `sse`, unwrapping batches."""
+    events = []
+    for line in frame.splitlines():
+        if line.startswith("data: "):
+            event = json.loads(line[len("data: "):])
+            events.extend(event['events'] if event.get('type') == 'batch' else [event])
+    return events
+
+
+class EventLog:
+    """
+    SQLite-backed log of the events of background jobs. Jobs older than `ttl` are dropped
+    together with their events.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+            """
+        )
+        # Jobs left running by a previous process can't make progress any more
+        self._conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (INTERRUPTED, RUNNING))
+
+    def create(self, job_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT INTO jobs VALUES (?, ?, ?, ?)", (job_id, RUNNING, now, now))
+            expired = [row[0] for row in self._conn.execute("SELECT id FROM jobs WHERE created_at <= ?", (now - self.ttl,))]
+            for expired_id in expired:
+                self._conn.execute("DELETE FROM events WHERE job_id = ?", (expired_id,))
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (expired_id,))
+
+    def append(self, job_id: str, seq: int, event: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("INSERT INTO events VALUES (?, ?, ?)", (job_id, seq, json.dumps(event)))
+
+    def set_status(self, job_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id))
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, created_at, updated_at, (SELECT COUNT(*) FROM events WHERE job_id = jobs.id) FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": job_id, "status": row[0], "created_at": row[1], "updated_at": row[2], "events": row[3]}
+
+    def read(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(data)) for seq, data in rows]
+
+
+class _LiveJob:
+    """In-process state of a running job, used to wake up the streams tailing it."""
+
+    def __init__(self):
+        self.seq = 0
+        self.done = False
+        self.cancelled = False
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class JobManager:
+    """
+    Runs threat model analyses as background tasks that outlive the HTTP request that started them.
+    Every event is appended to the event log, so clients can reconnect and resume from the last event
+    they received instead of starting the analysis again. Jobs run in the process that created them.
+    """
+
+    def __init__(self, log: EventLog):
+        self.log = log
+        self._live: Dict[str, _LiveJob] = {}
+
+    def start(self, analysis: Callable[[], AsyncGenerator[str, None]]) -> str:
+        """Starts the analysis in the background and returns the job id."""
+        job_id = uuid.uuid4().hex
+        self.log.create(job_id)
+        live = self._live[job_id] = _LiveJob()
+        live.task = asyncio.create_task(self._run(job_id, live, analysis()))
+        return job_id
+
+    async def _append(self, job_id: str, live: _LiveJob, event: Dict[str, Any]) -> None:
+        # Written in a thread to keep SQLite off the loop; streams only see the event once it is logged
+        await asyncio.to_thread(self.log.append, job_id, live.seq + 1, event)
+        live.seq += 1
+        async with live.changed:
+            live.changed.notify_all()
+
+    async def _run(self, job_id: str, live: _LiveJob, frames: AsyncGenerator[str, None]) -> None:
+        status = FAILED
+        try:
+            async for frame in frames:
+                for event in frame_events(frame):
+                    await self._append(job_id, live, event)
+                    if event['type'] == 'process_complete':
+                        status = COMPLETE
+        except asyncio.CancelledError:
+            status = CANCELLED if live.cancelled else INTERRUPTED
+            if live.cancelled:
+                await self._append(job_id, live, {'type': 'error', 'message': 'Job cancelled'})
+            raise
+        except Exception as e:
+            await self._append(job_id, live, {'type': 'error', 'message': f'Job failed: {str(e)}'})
+        finally:
+            await frames.aclose()
+            await asyncio.to_thread(self.log.set_status, job_id, status)
+            live.done = True
+            async with live.changed:
+                live.changed.notify_all()
+            self._live.pop(job_id, None)
+
+    async def stream(self, job_id: str, last_event_id: int = 0) -> AsyncGenerator[str, None]:
+        """
+        Replays the logged events after `last_event_id`, then follows the job live until it finishes.
+        Every frame carries its event id, which browsers send back as Last-Event-ID when reconnecting.
+        """
+        last = last_event_id
+        while True:
+            # Looked up before reading: a job gone from `_live` by then had logged all its events
+            live = self._live.get(job_id)
+            for seq, event in await asyncio.to_thread(self.log.read, job_id, last):
+                yield sse(event, event_id=seq)
+                last = seq
+            if live is None or (live.done and live.seq <= last):
+                return
+            idle = False
+            async with live.changed:
+                try:
+                    await asyncio.wait_for(
+                        live.changed.wait_for(lambda: live.seq > last or live.done), config.JOBS_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    idle = True
+            if idle:
+                # Comment frame, keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+    def cancel(self, job_id: str) -> bool:
+        """Stops a running job and the calls it has in flight. Returns False if it isn't running here."""
+        live = self._live.get(job_id)
+        if live is None or live.task is None or live.task.done():
+            return False
+        live.cancelled = True
+        live.task.cancel()
+        return True
+
+    def shutdown(self) -> None:
+        """Cancels the running jobs, e.g. when the server stops."""
+        for live in list(self._live.values()):
+            if live.task and not live.task.done():
+                live.task.cancel()
+
+
+_job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> Optional[JobManager]:
+    """
+    Returns the process-wide job manager, or None when its event log can't be opened because
+    CACHE_DIR can't be written; analyses can then only be streamed directly.
+    """
+    global _job_manager
+    if _job_manager is None:
+        try:
+            log = EventLog(path=os.path.join(config.CACHE_DIR, "jobs.sqlite"), ttl=config.JOBS_TTL)
+        except (OSError, sqlite3.Error):
+            return None
+        _job_manager = JobManager(log)
+    return _job_manager
@@ -0,0 +1,254 @@
+"""
+Deterministic parser for Mermaid flowcharts and sequence diagrams, turning their edges into
+`Relationship` objects without an LLM call.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from api.agents.relationship import Relationship
+
+_FENCE = re.compile(r"```[ \t]*mermaid[^\n]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+_FLOWCHART_HEADER = re.compile(r"^\s*(graph|flowchart)\b[^\n;]*;?", re.IGNORECASE)
+_SEQUENCE_HEADER = re.compile(r"^\s*sequenceDiagram\b", re.IGNORECASE)
+_COMMENT = re.compile(r"%%.*$")
+_BREAK = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+# Flowchart syntax
+_NODE_ID = re.compile(r"\s*([\w.:@/]+(?:-(?![-.>=])[\w.:@/]+)*)")
+# (opener, closer) pairs, longest openers first
+_SHAPES = (
+    ("(((", ")))"), ("([", "])"), ("[[", "]]"), ("[(", ")]"), ("((", "))"), ("{{", "}}"),
+    ("[/", "/]"), ("[\\", "\\]"), ("[", "]"), ("(", ")"), ("{", "}"), (">", "]"),
+)
+_CLASS_SUFFIX = re.compile(r":::[\w-]+")
+_AMPERSAND = re.compile(r"\s*&")
+_LINK = re.compile(r"\s*(?P<op>[<ox]?(?:-{2,}|-\.+-|={2,}|~{3,})[>ox]?)(?:\s*\|(?P<label>[^|]*)\|)?")
+# `A -- text --> B`, `A -. text .-> B` and `A == text ==> B`
+_TEXT_LINK = re.compile(r"\s*(?P<open><?(?:--|==|-\.))\s+(?P<label>.+?)\s*(?P<op>-{2,}[>ox]?|={2,}[>ox]?|\.+-[>ox]?)(?=[\s\w\"])")
+_FLOWCHART_SKIP = re.compile(r"^(subgraph|end|classDef|class|style|linkStyle|click|direction|accTitle|accDescr)\b")
+
+# Sequence diagram syntax
+_PARTICIPANT = re.compile(r"^(?:create\s+)?(?:participant|actor)\s+(?P<id>\S+)(?:\s+as\s+(?P<alias>.+))?$", re.IGNORECASE)
+_MESSAGE = re.compile(
+    r"^(?P<source>[^:<>]+?)\s*(?P<op><<-{1,2}>>|-{1,2}>>|-{1,2}>|-{1,2}[x)])\s*[+-]?\s*(?P<target>[^:]+?)\s*(?::\s*(?P<text>.*))?$"
+)
+
+
+@dataclass
+class ParsedDiagrams:
+    """Relationships found in the diagrams of an input, plus the input text around them."""
+    relationships: List[Relationship] = field(default_factory=list)
+    components: List[str] = field(default_factory=list)
+    prose: str = ""
+    diagrams: int = 0
+    # Statements that could not be understood and were ignored
+    skipped: int = 0
+
+
+class _Edges:
+    """Collects edges, merging repeated (source, target, direction) edges into one relationship."""
+
+    def __init__(self):
+        self.order: List[Tuple[str, str, str]] = []
+        self.labels: Dict[Tuple[str, str, str], List[str]] = {}
+
+    def add(self, source: str, target: str, direction: str, label: Optional[str]) -> None:
+        key = (source, target, direction)
+        if key not in self.labels:
+            self.order.append(key)
+            self.labels[key] = []
+        if label and label not in self.labels[key]:
+            self.labels[key].append(label)
+
+
+def _clean_label(label: str) -> str:
+    label = _BREAK.sub(" ", label).strip()
+    if len(label) >= 2 and label[0] == label[-1] and label[0] in "\"'`":
+        label = label[1:-1]
+    return _WHITESPACE.sub(" ", label).strip()
+
+
+def _direction(op: str) -> str:
+    head = op[-1] in ">ox"
+    tail = op[0] in "<ox" and len(op) > 1 and op[1] in "-.=~"
+    if head and tail:
+        return "↔"
+    return "→" if head else "—"
+
+
+def _split_statements(line: str) -> List[str]:
+    """Splits a line on `;` outside of quotes and node brackets."""
+    statements, depth, quoted, start = [], 0, False, 0
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char in "[({":
+            depth += 1
+        elif char in "])}":
+            depth = max(0, depth - 1)
+        elif char == ";" and depth == 0:
+            statements.append(line[start:i])
+            start = i + 1
+    statements.append(line[start:])
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def _parse_node(statement: str, pos: int, labels: Dict[str, str]) -> Tuple[str, int]:
+    match = _NODE_ID.match(statement, pos)
+    if not match:
+        raise ValueError(f"expected a node at {pos}")
+    node_id, pos = match.group(1), match.end()
+    for opener, closer in _SHAPES:
+        if statement.startswith(opener, pos):
+            start = pos + len(opener)
+            if statement.startswith('"', start):
+                end_quote = statement.find('"', start + 1)
+                end = statement.find(closer, end_quote + 1) if end_quote != -1 else -1
+            else:
+                end = statement.find(closer, start)
+            if end == -1:
+                raise ValueError(f"unclosed {opener} at {pos}")
+            labels.setdefault(node_id, _clean_label(statement[start:end]))
+            pos = end + len(closer)
+            break
+    suffix = _CLASS_SUFFIX.match(statement, pos)
+    if suffix:
+        pos = suffix.end()
+    return node_id, pos
+
+
+def _parse_group(statement: str, pos: int, labels: Dict[str, str]) -> Tuple[List[str], int]:
+    """Parses `A` or `A & B & C`."""
+    nodes = []
+    while True:
+        node_id, pos = _parse_node(statement, pos, labels)
+        nodes.append(node_id)
+        match = _AMPERSAND.match(statement, pos)
+        if not match:
+            return nodes, pos
+        pos = match.end()
+
+
+def _parse_flowchart_statement(statement: str, labels: Dict[str, str], edges: List[Tuple[str, str, str, Optional[str]]]) -> None:
+    sources, pos = _parse_group(statement, 0, labels)
+    while pos < len(statement.rstrip()):
+        match = _TEXT_LINK.match(statement, pos) or _LINK.match(statement, pos)
+        if not match:
+            raise ValueError(f"expected a link at {pos}")
+        op = match.group("op")
+        if match.re is _TEXT_LINK and match.group("open").startswith("<"):
+            op = "<" + op
+        label = match.group("label")
+        targets, pos = _parse_group(statement, match.end(), labels)
+        for source in sources:
+            for target in targets:
+                edges.append((source, target, _direction(op), _clean_label(label) if label else None))
+        sources = targets
+
+
+def _parse_flowchart(lines: List[str], parsed: ParsedDiagrams, out: _Edges) -> None:
+    labels: Dict[str, str] = {}
+    edges: List[Tuple[str, str, str, Optional[str]]] = []
+    nodes: List[str] = []
+    for line in lines:
+        for statement in _split_statements(line):
+            if _FLOWCHART_SKIP.match(statement):
+                continue
+            before = len(edges)
+            try:
+                _parse_flowchart_statement(statement, labels, edges)
+            except ValueError:
+                parsed.skipped += 1
+                continue
+            for source, target, _, _ in edges[before:]:
+                nodes.extend((source, target))
+
+    def name(node_id: str) -> str:
+        return labels.get(node_id) or node_id
+
+    for source, target, direction, label in edges:
+        out.add(name(source), name(target), direction, label)
+    known = set(parsed.components)
+    for node_id in list(labels) + nodes:
+        if name(node_id) not in known:
+            known.add(name(node_id))
+            parsed.components.append(name(node_id))
+
+
+def _parse_sequence(lines: List[str], parsed: ParsedDiagrams, out: _Edges) -> None:
+    aliases: Dict[str, str] = {}
+    for line in lines:
+        statement = line.strip()
+        if not statement:
+            continue
+        participant = _PARTICIPANT.match(statement)
+        if participant:
+            name = _clean_label(participant.group("alias") or participant.group("id"))
+            aliases[participant.group("id")] = name
+            if name not in parsed.components:
+                parsed.components.append(name)
+            continue
+        message = _MESSAGE.match(statement)
+        # Notes, loops, alt/opt/par blocks, activations and the like don't carry edges
+        if not message or message.group("source").split()[0].lower() in ("note", "loop", "alt", "else", "opt", "par", "and", "rect", "critical", "break", "box", "title"):
+            continue
+        source = aliases.get(message.group("source").strip(), message.group("source").strip())
+        target = aliases.get(message.group("target").strip(), message.group("target").strip())
+        for name in (source, target):
+            if name not in parsed.components:
+                parsed.components.append(name)
+        direction = "↔" if message.group("op").startswith("<<") else "→"
+        out.add(source, target, direction, _clean_label(message.group("text") or "") or None)
+
+
+def find_diagrams(text: str) -> Tuple[List[str], str]:
+    """
+    Returns the Mermaid sources found in the text (fenced ```mermaid blocks, or the whole text when
+    it is a bare diagram), and the text left around them.
+    """
+    diagrams = _FENCE.findall(text)
+    if diagrams:
+        return diagrams, _FENCE.sub("", text).strip()
+    if _FLOWCHART_HEADER.match(text) or _SEQUENCE_HEADER.match(text):
+        return [text], ""
+    return [], text.strip()
+
+
+def parse(text: str) -> ParsedDiagrams:
+    """
+    Extracts relationships from every Mermaid flowchart and sequence diagram in the text.
+    Node labels are used as component names when present; edge labels and messages become
+    the relationship description. Repeated edges between the same components are merged.
+    """
+    diagrams, prose = find_diagrams(text)
+    parsed = ParsedDiagrams(prose=prose)
+    out = _Edges()
+    for diagram in diagrams:
+        lines = [_COMMENT.sub("", line) for line in diagram.splitlines()]
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            continue
+        header = _FLOWCHART_HEADER.match(lines[0])
+        if header:
+            parsed.diagrams += 1
+            _parse_flowchart([lines[0][header.end():]] + lines[1:], parsed, out)
+        elif _SEQUENCE_HEADER.match(lines[0]):
+            parsed.diagrams += 1
+            _parse_sequence(lines[1:], parsed, out)
+
+    parsed.relationships = [
+        Relationship(source=source, target=target, direction=direction, description="; ".join(out.labels[key]) or None)
+        for key in out.order
+        for source, target, direction in [key]
+    ]
+    return parsed
+
+
+def describe(parsed: ParsedDiagrams) -> str:
+    """Context for STRIDE built from the input alone: the text around the diagrams, or the component list."""
+    if parsed.prose:
+        return parsed.prose
+    return f"System made of {len(parsed.components)} components: {', '.join(parsed.components)}."
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel, Field
+from api.agents import telemetry
+from api.agents.stride import Threat
+from api.config import config
+from api.services.similarity import LSHIndex, MinHasher, jaccard, shingles, threat_category
+
+
+class KnownMitigation(BaseModel):
+    """A stored mitigation matching a threat, adapted to the threat's relationship."""
+    id: int
+    content: str
+    sources: List[str] = Field(default_factory=list)
+    similarity: float
+    threat_name: str
+
+
+# Component names too generic to rename: they also appear in mitigations as plain words ("an API gateway")
+_GENERIC_NAMES = {
+    "api", "app", "application", "backend", "browser", "cache", "client", "database", "db", "frontend",
+    "gateway", "internet", "network", "queue", "server", "service", "storage", "system", "user", "users", "web",
+}
+
+
+def _adapt(content: str, stored: Tuple[str, str], current: Tuple[str, str]) -> str:
+    """
+    Renames the components of the relationship the mitigation was researched for to the current ones,
+    in one pass. The text is kept as is when the components are swapped, as renaming would mix them up,
+    and generic names are never renamed.
+    """
+    mapping = {
+        old: new for old, new in zip(stored, current)
+        if old and new and old != new and old.strip().lower() not in _GENERIC_NAMES
+    }
+    if not mapping or set(mapping) & set(mapping.values()):
+        return content
+    names = "|".join(re.escape(old) for old in sorted(mapping, key=len, reverse=True))
+    return re.sub(rf"(?<!\w)(?:{names})(?!\w)", lambda match: mapping[match.group(0)], content)
+
+
+def scope_of(api_keys: Optional[Dict[str, str]]) -> str:
+    """
+    Knowledge base scope of a request: a hash of the client's OpenAI key, so mitigations (and the component
+    names in them) are only reused for the same client. Requests using the server keys share one scope.
+    """
+    api_key = (api_keys or {}).get("openai_api_key")
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32] if api_key else ""
+
+
+def _index_key(scope: str, category: str) -> str:
+    return f"{scope}:{category}"
+
+
+class MitigationKnowledgeBase:
+    """
+    SQLite-backed store of researched mitigations, looked up by threat similarity across runs: threats of
+    the same STRIDE category whose name and attack vectors overlap by at least `threshold` (Jaccard index of
+    their word shingles) reuse the stored mitigation instead of researching it again. Candidates come from
+    an in-memory LSH index of MinHash signatures, loaded from the database when the store opens.
+    Entries older than `ttl` are dropped and the number of entries is bounded with least-recently-used eviction.
+    Every entry belongs to a scope (see `scope_of`) and is only reused within it.
+    """
+
+    def __init__(self, path: str, threshold: float, ttl: float, max_entries: int):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._hasher = MinHasher()
+        self._index = LSHIndex()
+        # id -> (scope:category index key, signature, shingles) of the indexed entries
+        self._entries: Dict[int, Tuple[str, Tuple[int, ...], Set[str]]] = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mitigations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                category TEXT NOT NULL,
+                threat_name TEXT NOT NULL,
+                source TEXT NOT NULL,
+                target TEXT NOT NULL,
+                shingles TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                content TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                scope TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        # Stores created before scopes existed: their entries go to the server scope
+        if "scope" not in [row[1] for row in self._conn.execute("PRAGMA table_info(mitigations)")]:
+            self._conn.execute("ALTER TABLE mitigations ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mitigations_accessed_at ON mitigations (accessed_at)")
+        with self._lock:
+            self._evict(time.time())
+            for row in self._conn.execute("SELECT id, scope, category, signature, shingles FROM mitigations"):
+                self._index_entry(row[0], _index_key(row[1], row[2]), tuple(json.loads(row[3])), set(json.loads(row[4])))
+
+    def _index_entry(self, entry_id: int, key: str, signature: Tuple[int, ...], words: Set[str]) -> None:
+        self._entries[entry_id] = (key, signature, words)
+        self._index.add(entry_id, key, signature)
+
+    def _unindex(self, entry_ids: List[int]) -> None:
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                self._index.remove(entry_id, entry[0], entry[1])
+
+    def get(self, threat: Threat, scope: str = "") -> Optional[KnownMitigation]:
+        """
+        Returns the stored mitigation of the most similar known threat of the scope, or None when none is
+        similar enough.
+        """
+        words = shingles(threat)
+        match = None
+        if words:
+            key = _index_key(scope, threat_category(threat))
+            signature = self._hasher.signature(words)
+            now = time.time()
+            with self._lock:
+                best_id, best_similarity = None, self.threshold
+                for entry_id in self._index.candidates(key, signature):
+                    score = jaccard(words, self._entries[entry_id][2])
+                    if score >= best_similarity:
+                        best_id, best_similarity = entry_id, score
+                if best_id is not None:
+                    row = self._conn.execute(
+                        "SELECT threat_name, source, target, content, sources FROM mitigations WHERE id = ? AND created_at > ?",
+                        (best_id, now - self.ttl),
+                    ).fetchone()
+                    if row is None:
+                        # Expired or evicted by another process since it was indexed
+                        self._unindex([best_id])
+                    else:
+                        self._conn.execute("UPDATE mitigations SET accessed_at = ? WHERE id = ?", (now, best_id))
+                        match = KnownMitigation(
+                            id=best_id,
+                            content=_adapt(row[3], (row[1], row[2]), (threat.scope.source, threat.scope.target)),
+                            sources=json.loads(row[4]),
+                            similarity=round(best_similarity, 3),
+                            threat_name=row[0],
+                        )
+        if match is None:
+            self.misses += 1
+            telemetry.add("cache_misses")
+        else:
+            self.hits += 1
+            telemetry.add("cache_hits")
+        return match
+
+    def put(self, threat: Threat, content: str, sources: List[str], scope: str = "") -> None:
+        """
+        Stores the mitigation researched for a threat in the scope and evicts least recently used entries
+        over the bound.
+        """
+        words = shingles(threat)
+        if not words:
+            return
+        category = threat_category(threat)
+        signature = self._hasher.signature(words)
+        now = time.time()
+        with self._lock:
+            entry_id = self._conn.execute(
+                "INSERT INTO mitigations (category, threat_name, source, target, shingles, signature, content, sources, created_at, accessed_at, scope) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    category, threat.name, threat.scope.source, threat.scope.target, json.dumps(sorted(words)),
+                    json.dumps(signature), content, json.dumps(sources), now, now, scope,
+                ),
+            ).lastrowid
+            self._index_entry(entry_id, _index_key(scope, category), signature, words)
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        expired = [row[0] for row in self._conn.execute("SELECT id FROM mitigations WHERE created_at <= ?", (now - self.ttl,))]
+        count = self._conn.execute("SELECT COUNT(*) FROM mitigations").fetchone()[0]
+        over = max(0, count - len(expired) - self.max_entries)
+        lru = [
+            row[0] for row in self._conn.execute(
+                "SELECT id FROM mitigations WHERE created_at > ? ORDER BY accessed_at LIMIT ?", (now - self.ttl, over)
+            )
+        ] if over else []
+        evicted = expired + lru
+        if evicted:
+            self._conn.executemany("DELETE FROM mitigations WHERE id = ?", [(entry_id,) for entry_id in evicted])
+            self._unindex(evicted)
+        self.evictions += len(evicted)
+
+    def scoped(self, api_keys: Optional[Dict[str, str]]) -> "ScopedKnowledgeBase":
+        """The view of the knowledge base for a request's API keys."""
+        return ScopedKnowledgeBase(self, scope_of(api_keys))
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters since process start, plus the number of stored mitigations."""
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+
+@dataclass
+class ScopedKnowledgeBase:
+    """The entries of one scope of the knowledge base."""
+    kb: MitigationKnowledgeBase
+    scope: str
+
+    def get(self, threat: Threat) -> Optional[KnownMitigation]:
+        return self.kb.get(threat, self.scope)
+
+    def put(self, threat: Threat, content: str, sources: List[str]) -> None:
+        self.kb.put(threat, content, sources, self.scope)
+
+
+_mitigation_kb: Optional[MitigationKnowledgeBase] = None
+
+
+def get_mitigation_kb() -> Optional[MitigationKnowledgeBase]:
+    """
+    Returns the process-wide mitigation knowledge base, or None when it is disabled or CACHE_DIR can't
+    be written, in which case every mitigation is researched.
+    """
+    global _mitigation_kb
+    if not config.MITIGATION_KB_ENABLED:
+        return None
+    if _mitigation_kb is None:
+        try:
+            _mitigation_kb = MitigationKnowledgeBase(
+                path=os.path.join(config.CACHE_DIR, "mitigations.sqlite"),
+                threshold=config.MITIGATION_KB_THRESHOLD,
+                ttl=config.MITIGATION_KB_TTL,
+                max_entries=config.MITIGATION_KB_MAX_ENTRIES,
+            )
+        except (OSError, sqlite3.Error):
+            return None
+    return _mitigation_kb
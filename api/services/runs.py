@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from api.agents.relationship import Relationship
+from api.agents.stride import Threat
+from api.config import config
+
+
+class RunThreat(BaseModel):
+    """A threat of a run, with the relationship it came from and its mitigation once researched."""
+    index: int = Field(..., description="Index of the relationship this threat came from")
+    threat: Threat
+    mitigation: Optional[Dict[str, Any]] = Field(None, description="The mitigation event payload (content and sources)")
+
+
+class ThreatModelRun(BaseModel):
+    """A threat model run, kept so later edits of the same design can be re-analyzed incrementally."""
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = Field(default_factory=time.time)
+    context: str = ""
+    relationships: List[Relationship] = Field(default_factory=list)
+    threats: List[RunThreat] = Field(default_factory=list)
+    failed: List[int] = Field(default_factory=list, description="Indices of relationships whose STRIDE analysis failed or never finished")
+    complete: bool = Field(True, description="False when the run was stopped before the end, e.g. by a client disconnect")
+
+
+class RunRecorder:
+    """Builds a run from the events streamed to the client."""
+
+    def __init__(self, relationships: List[Relationship], context: str):
+        self.run = ThreatModelRun(relationships=relationships, context=context)
+
+    def observe(self, event: Dict[str, Any]) -> None:
+        if event['type'] in ('threat_identified', 'threat_unchanged'):
+            self.run.threats.append(
+                RunThreat(index=event['index'], threat=event['threat'], mitigation=event.get('mitigation'))
+            )
+        elif event['type'] == 'relationship_error':
+            self.run.failed.append(event['index'])
+        elif event['type'] == 'mitigation_complete':
+            for item in self.run.threats:
+                if item.threat.id == event['threat_id'] and item.mitigation is None:
+                    item.mitigation = event['mitigation']
+                    break
+
+    def interrupt(self) -> None:
+        """
+        Marks the run as stopped early. Relationships that produced no threat yet are counted as
+        failed, so an incremental run from this one analyzes them again.
+        """
+        self.run.complete = False
+        seen = {item.index for item in self.run.threats} | set(self.run.failed)
+        self.run.failed += [i for i in range(len(self.run.relationships)) if i not in seen]
+
+
+def _edge_key(relationship: Relationship) -> Tuple[str, str, str]:
+    return (
+        " ".join(relationship.source.lower().split()),
+        " ".join(relationship.target.lower().split()),
+        relationship.direction.strip(),
+    )
+
+
+class RelationshipDiff(BaseModel):
+    """How the relationships of a new run map onto the ones of a previous run."""
+    added: List[int] = Field(default_factory=list, description="New indices of edges that did not exist before")
+    removed: List[int] = Field(default_factory=list, description="Old indices of edges that no longer exist")
+    changed: List[Tuple[int, int]] = Field(default_factory=list, description="(old, new) indices of edges whose description changed")
+    unchanged: List[Tuple[int, int]] = Field(default_factory=list, description="(old, new) indices of identical edges")
+
+
+def diff_relationships(old: List[Relationship], new: List[Relationship]) -> RelationshipDiff:
+    """
+    Matches edges by source, target and direction (case and whitespace insensitive);
+    a matched edge whose description differs counts as changed.
+    """
+    remaining: Dict[Tuple[str, str, str], List[int]] = {}
+    for i, relationship in enumerate(old):
+        remaining.setdefault(_edge_key(relationship), []).append(i)
+
+    diff = RelationshipDiff()
+    for j, relationship in enumerate(new):
+        candidates = remaining.get(_edge_key(relationship))
+        if not candidates:
+            diff.added.append(j)
+            continue
+        # Prefer an old edge with the same description among duplicates
+        i = next((i for i in candidates if old[i].description == relationship.description), candidates[0])
+        candidates.remove(i)
+        if old[i].description == relationship.description:
+            diff.unchanged.append((i, j))
+        else:
+            diff.changed.append((i, j))
+    diff.removed = sorted(i for indices in remaining.values() for i in indices)
+    return diff
+
+
+class RunStore:
+    """
+    SQLite-backed store of runs. Runs older than `ttl` are dropped and the number
+    of runs is bounded, dropping the oldest first.
+    """
+
+    def __init__(self, path: str, ttl: float, max_runs: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at)")
+
+    def get(self, run_id: str) -> Optional[ThreatModelRun]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM runs WHERE id = ? AND created_at > ?", (run_id, time.time() - self.ttl)
+            ).fetchone()
+        return ThreatModelRun.model_validate_json(row[0]) if row else None
+
+    def save(self, run: ThreatModelRun) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs VALUES (?, ?, ?)", (run.id, run.model_dump_json(), run.created_at)
+            )
+            self._conn.execute("DELETE FROM runs WHERE created_at <= ?", (time.time() - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM runs WHERE id NOT IN (SELECT id FROM runs ORDER BY created_at DESC LIMIT ?)",
+                (self.max_runs,),
+            )
+
+
+_run_store: Optional[RunStore] = None
+
+
+def get_run_store() -> Optional[RunStore]:
+    """
+    Returns the process-wide run store, or None when CACHE_DIR can't be written, in which case
+    runs are not kept and can't be resumed.
+    """
+    global _run_store
+    if _run_store is None:
+        try:
+            _run_store = RunStore(
+                path=os.path.join(config.CACHE_DIR, "runs.sqlite"),
+                ttl=config.RUNS_TTL,
+                max_runs=config.RUNS_MAX_ENTRIES,
+            )
+        except (OSError, sqlite3.Error):
+            return None
+    return _run_store
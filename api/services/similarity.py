@@ -0,0 +1,145 @@
+"""
+Near-duplicate detection for threats, so mitigation research runs once per group of threats that only
+differ by the relationship they were found on (e.g. "TLS downgrade / MITM" on every HTTPS edge).
+Threats are compared with MinHash signatures of their normalized name and attack vectors, indexed with
+locality-sensitive hashing; only threats of the same STRIDE category are grouped.
+"""
+import hashlib
+import random
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+from api.agents.stride import Threat
+from api.agents.text import terms, words
+
+# Mersenne prime used by the (a * x + b) mod p hash family
+_PRIME = (1 << 61) - 1
+
+
+def shingles(threat: Threat) -> Set[str]:
+    """
+    Word unigrams and bigrams of the threat name and attack vectors, without stopwords and without the
+    words naming the components of its relationship, so the same attack on two edges looks the same.
+    """
+    components = set(words(f"{threat.scope.source} {threat.scope.target}"))
+    kept = [
+        word for word in terms(f"{threat.name} {threat.attack_vectors}")
+        if word not in components and not word.isdigit()
+    ]
+    return set(kept) | {f"{a} {b}" for a, b in zip(kept, kept[1:])}
+
+
+def threat_category(threat: Threat) -> str:
+    return threat.category.value if hasattr(threat.category, "value") else str(threat.category)
+
+
+def jaccard(first: Set[str], second: Set[str]) -> float:
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+
+class MinHasher:
+    """MinHash signatures of `permutations` values; their agreement estimates the Jaccard index of two sets."""
+
+    def __init__(self, permutations: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.permutations = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(permutations)]
+
+    def signature(self, items: Set[str]) -> Tuple[int, ...]:
+        hashes = [int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big") for item in items]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self.permutations)
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimated Jaccard index of the sets two signatures were computed from."""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+class LSHIndex:
+    """
+    Locality-sensitive hashing of MinHash signatures: signatures are split into `bands`, and items of the
+    same category sharing any band are candidates for a similarity check.
+    """
+
+    def __init__(self, permutations: int = 64, bands: int = 16):
+        if permutations % bands:
+            raise ValueError("permutations must be a multiple of bands")
+        self.bands = bands
+        self.rows = permutations // bands
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[Hashable]] = {}
+
+    def _keys(self, category: str, signature: Tuple[int, ...]) -> List[Tuple[str, int, Tuple[int, ...]]]:
+        return [(category, band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, item: Hashable, category: str, signature: Tuple[int, ...]) -> None:
+        for key in self._keys(category, signature):
+            self._buckets.setdefault(key, set()).add(item)
+
+    def remove(self, item: Hashable, category: str, signature: Tuple[int, ...]) -> None:
+        for key in self._keys(category, signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(item)
+                if not bucket:
+                    del self._buckets[key]
+
+    def candidates(self, category: str, signature: Tuple[int, ...]) -> Set[Hashable]:
+        found: Set[Hashable] = set()
+        for key in self._keys(category, signature):
+            found |= self._buckets.get(key, set())
+        return found
+
+
+@dataclass(eq=False)
+class Cluster:
+    """Threats sharing one mitigation, researched for the first of them."""
+    representative: Threat
+    signature: Tuple[int, ...]
+    members: List[Threat] = field(default_factory=list)
+    mitigation: Optional[Dict[str, Any]] = None
+
+
+class ThreatClusters:
+    """
+    Groups threats as they arrive. A threat joins the most similar cluster of its category when the
+    estimated similarity with the cluster's representative reaches `threshold`, else it starts a new one.
+    """
+
+    def __init__(self, threshold: float, permutations: int = 64, bands: int = 16):
+        self.threshold = threshold
+        self.hasher = MinHasher(permutations)
+        self.index = LSHIndex(permutations, bands)
+        self.clusters: List[Cluster] = []
+
+    def add(self, threat: Threat) -> Cluster:
+        """Assigns the threat to a cluster and returns it; the threat is the representative of a new cluster."""
+        words = shingles(threat)
+        if not words:
+            cluster = Cluster(representative=threat, signature=(), members=[threat])
+            self.clusters.append(cluster)
+            return cluster
+
+        signature = self.hasher.signature(words)
+        category = threat_category(threat)
+        best, best_similarity = None, self.threshold
+        for candidate in self.index.candidates(category, signature):
+            score = similarity(signature, candidate.signature)
+            if score >= best_similarity:
+                best, best_similarity = candidate, score
+        if best is not None:
+            best.members.append(threat)
+            return best
+
+        cluster = Cluster(representative=threat, signature=signature, members=[threat])
+        self.clusters.append(cluster)
+        self.index.add(cluster, category, signature)
+        return cluster
+
+    def discard(self, cluster: Cluster) -> None:
+        """Stops matching new threats against the cluster, e.g. when its research failed."""
+        if cluster.signature:
+            self.index.remove(cluster, threat_category(cluster.representative), cluster.signature)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "threats": sum(len(cluster.members) for cluster in self.clusters),
+            "clusters": len(self.clusters),
+        }
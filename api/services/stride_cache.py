@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+from api.agents import telemetry
+from api.agents.relationship import Relationship
+from api.agents.stride import Threats
+from api.config import config
+
+
+def cache_key(relationship: Relationship, context: str, model_name: str, prompt_version: str) -> str:
+    """
+    Content address of a STRIDE result: the STRIDE prompt is built only from the relationship
+    fields and the context, so equal inputs with the same model and prompt give the same threats.
+    """
+    payload = json.dumps(
+        {
+            "relationship": relationship.model_dump(mode="json"),
+            "context": context,
+            "model": model_name,
+            "prompt_version": prompt_version,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class StrideCache:
+    """
+    SQLite-backed cache of the threats identified for one relationship, keyed by `cache_key`.
+    Entries older than `ttl` are ignored and the number of entries is bounded with
+    least-recently-used eviction.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS threats (
+                key TEXT PRIMARY KEY,
+                threats TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS threats_accessed_at ON threats (accessed_at)")
+
+    def get(self, key: str) -> Optional[Threats]:
+        """Returns the cached threats, or None when missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT threats FROM threats WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE threats SET accessed_at = ? WHERE key = ?", (now, key))
+        if row is None:
+            self.misses += 1
+            telemetry.add("cache_misses")
+            return None
+        self.hits += 1
+        telemetry.add("cache_hits")
+        return Threats.model_validate_json(row[0])
+
+    def put(self, key: str, threats: Threats) -> None:
+        """Stores the threats of a relationship and evicts least recently used entries over the bound."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO threats VALUES (?, ?, ?, ?)", (key, threats.model_dump_json(), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        expired = self._conn.execute("DELETE FROM threats WHERE created_at <= ?", (now - self.ttl,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM threats").fetchone()[0]
+        over = max(0, count - self.max_entries)
+        if over:
+            self._conn.execute(
+                "DELETE FROM threats WHERE key IN (SELECT key FROM threats ORDER BY accessed_at LIMIT ?)", (over,)
+            )
+        self.evictions += expired + over
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters since process start, plus the number of cached relationships."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM threats").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+
+_stride_cache: Optional[StrideCache] = None
+
+
+def get_stride_cache() -> Optional[StrideCache]:
+    """
+    Returns the process-wide STRIDE result cache, or None when it is disabled or CACHE_DIR can't be
+    written, in which case every relationship is analyzed.
+    """
+    global _stride_cache
+    if not config.STRIDE_CACHE_ENABLED:
+        return None
+    if _stride_cache is None:
+        try:
+            _stride_cache = StrideCache(
+                path=os.path.join(config.CACHE_DIR, "stride.sqlite"),
+                ttl=config.STRIDE_CACHE_TTL,
+                max_entries=config.STRIDE_CACHE_MAX_ENTRIES,
+            )
+        except (OSError, sqlite3.Error):
+            return None
+    return _stride_cache
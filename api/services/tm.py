@@ -1,11 +1,21 @@
 from api.agents.input import InputAgent, Relationship
 from api.agents.mitgation import MitigationAgent
-from api.agents.relationship import RelationshipAgent
-from api.agents.stride import StrideAgent
-from api.agents.stride import Threat
-from pydantic import BaseModel, Field
+from api.agents.relationship import RelationshipAgent, RelationshipModelOutput
+from api.agents import registry, scheduler, telemetry
+from api.agents.stride import BATCH_PROMPT_VERSION, PROMPT_VERSION, StrideAgent, plan_batches
+from api.agents.stride import Threat, Threats
+from api.config import config
+from api.services import mermaid
+from api.services.context import CompactContext, compact_context
+from api.services.events import sse, stream_events
+from api.services.mitigation_kb import ScopedKnowledgeBase, get_mitigation_kb
+from api.services.runs import RunRecorder, ThreatModelRun, diff_relationships, get_run_store
+from api.services.similarity import Cluster, ThreatClusters
+from api.services.stride_cache import StrideCache, cache_key, get_stride_cache
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from pydantic_ai.exceptions import UnexpectedModelBehavior, UsageLimitExceeded
 from datetime import datetime
-from typing import AsyncGenerator, List, Dict, Any, Optional
+from typing import AsyncGenerator, List, Dict, Any, Literal, Optional, Sequence, Tuple
 import json
 import asyncio
 
@@ -33,6 +43,31 @@ class StrideRequest(BaseModel):
 class ThreatModelRequest(BaseModel):
     user_input: str
     api_keys: Optional[Dict[str, str]] = Field(default_factory=dict)
+    stride_concurrency: Optional[int] = Field(None, ge=1, description="Max STRIDE calls in flight for this request (capped by STRIDE_MAX_CONCURRENCY)")
+    mitigation_concurrency: Optional[int] = Field(None, ge=1, description="Max mitigation workers for this request (capped by MITIGATION_MAX_CONCURRENCY)")
+    coalesce_ms: int = Field(0, ge=0, le=1000, description="Batch events arriving within this window into one SSE frame (0 disables)")
+    pace_ms: int = Field(0, ge=0, le=1000, description="Minimum delay between SSE frames, for clients that want a slower stream (0 disables)")
+    stride_batch_size: Optional[int] = Field(None, ge=1, description="Max relationships analyzed per STRIDE call, further bounded by the token budget (defaults to STRIDE_BATCH_SIZE, 1 disables batching)")
+    use_cache: bool = Field(True, description="Reuse cached STRIDE threats for relationships analyzed before with the same context")
+    compact_context: bool = Field(True, description="Give each STRIDE and mitigation prompt a summary of the context plus the parts about its components instead of the whole context")
+    cluster_threats: bool = Field(True, description="Research one mitigation per group of near-duplicate threats and share it with the whole group")
+    use_knowledge_base: bool = Field(True, description="Reuse mitigations researched in earlier runs for similar threats, and store the new ones")
+    relationship_mode: Literal["llm", "fast", "hybrid"] = Field(
+        "hybrid",
+        description="How relationships are extracted: 'llm' sends the whole input to the model, 'fast' only parses "
+                    "Mermaid diagrams locally, 'hybrid' parses them and lets the model enrich descriptions and context. "
+                    "Inputs without diagrams always use the model",
+    )
+
+class IncrementalThreatModelRequest(ThreatModelRequest):
+    previous_run_id: Optional[str] = Field(None, description="Id of the run to diff against, as returned in process_complete")
+    previous_run: Optional[ThreatModelRun] = Field(None, description="The previous run itself, when it is not stored on this server")
+
+    @model_validator(mode="after")
+    def check_previous(self):
+        if not self.previous_run_id and self.previous_run is None:
+            raise ValueError("previous_run_id or previous_run is required")
+        return self
 
 def pydantic_to_json(obj):
     if hasattr(obj, 'model_dump'):
@@ -41,111 +76,546 @@ def pydantic_to_json(obj):
         return obj.dict()
     return obj
 
+# Process-wide cap on STRIDE calls in flight, shared by every concurrent request.
+# A semaphore is bound to the event loop it is first used on, so it is recreated for a new loop
+_stride_slots: Optional[asyncio.Semaphore] = None
+_stride_slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _process_stride_slots() -> asyncio.Semaphore:
+    global _stride_slots, _stride_slots_loop
+    loop = asyncio.get_running_loop()
+    if _stride_slots is None or _stride_slots_loop is not loop:
+        _stride_slots = asyncio.Semaphore(config.STRIDE_GLOBAL_CONCURRENCY)
+        _stride_slots_loop = loop
+    return _stride_slots
+
+def _cache_key(relationship: Relationship, context: str, prompt_version: str = PROMPT_VERSION) -> str:
+    return cache_key(relationship, context, registry.MODEL_NAME, prompt_version)
+
+def _cached_threats(cache: StrideCache, relationship: Relationship, context: CompactContext) -> Optional[Threats]:
+    """The cached threats of a relationship, from a single-relationship call or else from a batch call."""
+    relationship_context = context.for_relationships([relationship])
+    found = cache.get(_cache_key(relationship, relationship_context))
+    if found is None:
+        found = cache.get(_cache_key(relationship, relationship_context, BATCH_PROMPT_VERSION))
+    return found
+
+async def _emit_threats(
+    index: int,
+    found: Threats,
+    cached: bool,
+    events: asyncio.Queue,
+    threats: asyncio.Queue,
+) -> List[Threat]:
+    """
+    Stream each threat tagged with the relationship index it came from, then hand it to mitigation
+    """
+    for threat in found.threats:
+        await events.put({'type': 'threat_identified', 'index': index, 'threat': pydantic_to_json(threat), 'cached': cached})
+        await threats.put(threat)
+    return list(found.threats)
+
+async def _analyze_relationship(
+    stride_agent: StrideAgent,
+    index: int,
+    relationship: Relationship,
+    context: CompactContext,
+    request_slots: asyncio.Semaphore,
+    events: asyncio.Queue,
+    threats: asyncio.Queue,
+    cache: Optional[StrideCache] = None,
+    announce: bool = True,
+) -> List[Threat]:
+    """
+    Run STRIDE on a single relationship once a per-request and a per-process slot are free,
+    pushing its events to the queue and each threat to the mitigation queue.
+    Failures are reported on this relationship only.
+    """
+    async with request_slots, _process_stride_slots():
+        # Notify client which relationship we're analyzing
+        if announce:
+            await events.put({'type': 'analyzing_relationship', 'index': index, 'relationship': pydantic_to_json(relationship)})
+        
+        try:
+            result = await stride_agent.run(relationship, context.prompt([relationship]))
+        except Exception as e:
+            await events.put({'type': 'relationship_error', 'index': index, 'error': str(e)})
+            return []
+    
+    if cache:
+        await asyncio.to_thread(cache.put, _cache_key(relationship, context.for_relationships([relationship])), result.data)
+    return await _emit_threats(index, result.data, False, events, threats)
+
+async def _analyze_batch(
+    stride_agent: StrideAgent,
+    batch: List[Tuple[int, Relationship]],
+    context: CompactContext,
+    request_slots: asyncio.Semaphore,
+    events: asyncio.Queue,
+    threats: asyncio.Queue,
+    cache: Optional[StrideCache] = None,
+    announce: bool = True,
+) -> List[Threat]:
+    """
+    Run STRIDE on a batch of relationships in a single call holding one slot. Relationships the model
+    skipped, or all of them when its output was cut off or invalid, are split in two halves and retried,
+    down to single-relationship calls. Other failures are reported on every relationship of the batch.
+    """
+    if len(batch) == 1:
+        index, relationship = batch[0]
+        return await _analyze_relationship(stride_agent, index, relationship, context, request_slots, events, threats, cache, announce)
+    
+    async with request_slots, _process_stride_slots():
+        if announce:
+            for index, relationship in batch:
+                await events.put({'type': 'analyzing_relationship', 'index': index, 'relationship': pydantic_to_json(relationship)})
+        
+        try:
+            found = await stride_agent.run_batch(batch, context.prompt([relationship for _, relationship in batch]))
+        except (UnexpectedModelBehavior, UsageLimitExceeded, ValidationError):
+            # Too much output for one call, or malformed: smaller batches may fit
+            found = {}
+        except Exception as e:
+            for index, _ in batch:
+                await events.put({'type': 'relationship_error', 'index': index, 'error': str(e)})
+            return []
+    
+    results = []
+    for index, relationship in batch:
+        if index in found:
+            if cache:
+                key = _cache_key(relationship, context.for_relationships([relationship]), BATCH_PROMPT_VERSION)
+                await asyncio.to_thread(cache.put, key, found[index])
+            results += await _emit_threats(index, found[index], False, events, threats)
+    
+    missing = [(index, relationship) for index, relationship in batch if index not in found]
+    if missing:
+        half = (len(missing) + 1) // 2
+        retried = await asyncio.gather(*(
+            _analyze_batch(stride_agent, part, context, request_slots, events, threats, cache, announce=False)
+            for part in (missing[:half], missing[half:]) if part
+        ))
+        results += [threat for part in retried for threat in part]
+    return results
+
+async def _run_stride_stage(
+    stride_agent: StrideAgent,
+    relationships: List[Tuple[int, Relationship]],
+    context: CompactContext,
+    concurrency: int,
+    events: asyncio.Queue,
+    threats: asyncio.Queue,
+    cache: Optional[StrideCache] = None,
+    batch_size: int = 1,
+) -> List[Threat]:
+    """
+    Fan STRIDE out across the (index, relationship) pairs with bounded concurrency, `batch_size`
+    relationships per call at most. Relationships found in the cache are streamed right away
+    without taking a slot.
+    """
+    request_slots = asyncio.Semaphore(concurrency)
+    all_threats: List[Threat] = []
+    pending = []
+    with telemetry.span("stride_cache", relationships=len(relationships)):
+        for index, relationship in relationships:
+            # SQLite lookups run in a thread so they don't hold up the other streams on the loop
+            found = await asyncio.to_thread(_cached_threats, cache, relationship, context) if cache else None
+            if found is None:
+                pending.append((index, relationship))
+            else:
+                all_threats += await _emit_threats(index, found, True, events, threats)
+    
+    results = await asyncio.gather(*(
+        _analyze_batch(stride_agent, batch, context, request_slots, events, threats, cache)
+        for batch in plan_batches(pending, batch_size)
+    ))
+    return all_threats + [threat for threats in results for threat in threats]
+
+async def _research_mitigation(
+    mitigation_agent: MitigationAgent,
+    threat: Threat,
+    context: CompactContext,
+    events: asyncio.Queue,
+    kb: Optional[ScopedKnowledgeBase] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Research the mitigation for a single threat and push its events to the queue.
+    With `kb`, the mitigation of a similar known threat is reused when there is one, and new ones are stored.
+    Returns the mitigation, or None when the research failed
+    """
+    known = None
+    if kb is not None:
+        try:
+            with telemetry.span("mitigation_kb"):
+                known = await asyncio.to_thread(kb.get, threat)
+        except Exception:
+            # The knowledge base is only a shortcut: research the mitigation instead
+            known = None
+        if known is not None:
+            mitigation = {'content': known.content, 'sources': known.sources}
+            await events.put({
+                'type': 'mitigation_complete', 'threat_id': threat.id, 'mitigation': mitigation,
+                'reused': {'threat_name': known.threat_name, 'similarity': known.similarity},
+            })
+            return mitigation
+    
+    # Notify client which threat we're researching mitigations for
+    await events.put({'type': 'mitigation_started', 'threat_id': threat.id, 'message': f'Researching mitigation for: {threat.name}'})
+    
+    try:
+        # Call the mitigation agent with the threat and context
+        mitigation_result = await mitigation_agent.run(threat, context.prompt([threat.scope]))
+        
+        # Extract mitigation content and sources from the result
+        content = "No specific mitigation found."
+        sources = []
+        
+        if hasattr(mitigation_result, 'data'):
+            data = mitigation_result.data
+            if hasattr(data, 'content'):
+                content = data.content
+            if hasattr(data, 'sources'):
+                sources = data.sources
+            if kb is not None:
+                try:
+                    await asyncio.to_thread(kb.put, threat, content, sources)
+                except Exception:
+                    # Not being able to store it doesn't make the research fail
+                    pass
+        
+        # Send structured format with nested mitigation object to match client expectations
+        mitigation = {'content': content, 'sources': sources}
+        await events.put({'type': 'mitigation_complete', 'threat_id': threat.id, 'mitigation': mitigation})
+        return mitigation
+        
+    except Exception as e:
+        await events.put({'type': 'mitigation_error', 'threat_id': threat.id, 'error': str(e)})
+        return None
+
+def _shared_mitigation(threat: Threat, cluster: Cluster) -> Dict[str, Any]:
+    return {'type': 'mitigation_complete', 'threat_id': threat.id, 'mitigation': cluster.mitigation, 'shared_from': cluster.representative.id}
+
+async def _mitigation_worker(
+    mitigation_agent: MitigationAgent,
+    context: CompactContext,
+    threats: asyncio.Queue,
+    events: asyncio.Queue,
+    clusters: Optional[ThreatClusters] = None,
+    kb: Optional[ScopedKnowledgeBase] = None,
+) -> None:
+    """
+    Research mitigations for queued threats until a `None` sentinel is received.
+    With `clusters`, only the first threat of each group of near-duplicates is researched, and its
+    mitigation is sent for every other threat of the group as well
+    """
+    while (threat := await threats.get()) is not None:
+        if clusters is None:
+            await _research_mitigation(mitigation_agent, threat, context, events, kb)
+            continue
+        
+        cluster = clusters.add(threat)
+        if cluster.representative is not threat:
+            # Sent now if the research is done, else by the worker researching it once it is
+            if cluster.mitigation is not None:
+                await events.put(_shared_mitigation(threat, cluster))
+            continue
+        
+        mitigation = await _research_mitigation(mitigation_agent, threat, context, events, kb)
+        waiting = cluster.members[1:]
+        if mitigation is not None:
+            cluster.mitigation = mitigation
+            for member in waiting:
+                await events.put(_shared_mitigation(member, cluster))
+        else:
+            # Threats that came in while it failed are researched on their own; later ones start a new cluster
+            clusters.discard(cluster)
+            for member in waiting:
+                await _research_mitigation(mitigation_agent, member, context, events, kb)
+
+async def _run_pipeline(
+    stride_agent: StrideAgent,
+    mitigation_agent: MitigationAgent,
+    relationships: List[Tuple[int, Relationship]],
+    context: CompactContext,
+    stride_concurrency: int,
+    mitigation_concurrency: int,
+    events: asyncio.Queue,
+    cache: Optional[StrideCache] = None,
+    carried: Sequence[Threat] = (),
+    batch_size: int = 1,
+    cluster_threats: bool = False,
+    kb: Optional[ScopedKnowledgeBase] = None,
+) -> List[Threat]:
+    """
+    Run STRIDE and mitigation research as a streaming pipeline: every threat goes to a bounded
+    mitigation worker pool as soon as it is identified, so both stages overlap.
+    `carried` threats skip STRIDE and only get their mitigation researched.
+    With `cluster_threats`, near-duplicate threats share the mitigation researched for the first of them.
+    With `kb`, mitigations of similar threats from earlier runs are reused.
+    Events are pushed to the queue as dicts, followed by a `None` sentinel once everything has finished.
+    """
+    threats: asyncio.Queue = asyncio.Queue()
+    for threat in carried:
+        threats.put_nowait(threat)
+    clusters = ThreatClusters(config.MITIGATION_CLUSTER_THRESHOLD) if cluster_threats else None
+    workers = [
+        asyncio.create_task(_mitigation_worker(mitigation_agent, context, threats, events, clusters, kb))
+        for _ in range(mitigation_concurrency)
+    ]
+    try:
+        all_threats = await _run_stride_stage(stride_agent, relationships, context, stride_concurrency, events, threats, cache, batch_size)
+        await events.put({'type': 'status', 'message': f'Threat identification complete, finishing mitigation research for {len(all_threats) + len(carried)} threats...'})
+        
+        for _ in workers:
+            await threats.put(None)
+        await asyncio.gather(*workers)
+        return all_threats
+    finally:
+        for worker in workers:
+            if not worker.done():
+                worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await events.put(None)
+
+def _api_keys_error(request: ThreatModelRequest) -> Optional[str]:
+    """Returns why the client-provided API keys can't be used, if they can't"""
+    if request.api_keys and not request.api_keys.get('openai_api_key'):
+        return 'OpenAI API key is required'
+    return None
+
+def _merge_enriched(parsed: List[Relationship], enriched: List[Relationship]) -> List[Relationship]:
+    """
+    Keep the parsed edges as the source of truth for structure, taking the model's description of
+    each one when it returned the same edge, then append the edges only the model found
+    """
+    def key(r: Relationship):
+        return (r.source.strip().lower(), r.target.strip().lower())
+    
+    descriptions = {key(r): r.description for r in enriched if r.description}
+    parsed_keys = {key(r) for r in parsed}
+    merged = [r.model_copy(update={'description': descriptions.get(key(r), r.description)}) for r in parsed]
+    return merged + [r for r in enriched if key(r) not in parsed_keys]
+
+async def _extract_relationships(request: ThreatModelRequest) -> Optional[RelationshipModelOutput]:
+    """Extract relationships and context from the user input using RelationshipAgent with API keys"""
+    with telemetry.span("relationships", mode=request.relationship_mode):
+        return await _extract(request)
+
+async def _extract(request: ThreatModelRequest) -> Optional[RelationshipModelOutput]:
+    relationship_agent = RelationshipAgent(api_keys=request.api_keys)
+    
+    # Relationships drawn as Mermaid diagrams are parsed locally, without an LLM call
+    if request.relationship_mode != 'llm':
+        parsed = mermaid.parse(request.user_input)
+        if parsed.relationships:
+            fast = RelationshipModelOutput(relationships=parsed.relationships, context=mermaid.describe(parsed))
+            if request.relationship_mode == 'fast':
+                return fast
+            try:
+                enriched = (await relationship_agent.enrich(request.user_input, parsed.relationships)).data
+            except Exception:
+                # The parsed relationships are enough to go on with
+                return fast
+            return RelationshipModelOutput(
+                relationships=_merge_enriched(parsed.relationships, enriched.relationships),
+                context=enriched.context or fast.context,
+            )
+    
+    relationship_result = await relationship_agent.run(request.user_input)
+    
+    if not hasattr(relationship_result, 'data') or not hasattr(relationship_result.data, 'relationships'):
+        return None
+    return relationship_result.data
+
+async def _stream_pipeline(
+    request: ThreatModelRequest,
+    relationships: List[Tuple[int, Relationship]],
+    context: CompactContext,
+    recorder: RunRecorder,
+    carried: Sequence[Threat] = (),
+) -> AsyncGenerator[str, None]:
+    """
+    Analyze relationships with STRIDE concurrently, streaming threats in completion order,
+    and research mitigation for each threat as soon as it is identified, passing API keys.
+    Every streamed event is recorded into the run.
+    """
+    stride_agent = StrideAgent(api_keys=request.api_keys)
+    mitigation_agent = MitigationAgent(api_keys=request.api_keys)
+    stride_concurrency = min(request.stride_concurrency or config.STRIDE_MAX_CONCURRENCY, config.STRIDE_MAX_CONCURRENCY)
+    mitigation_concurrency = min(request.mitigation_concurrency or config.MITIGATION_MAX_CONCURRENCY, config.MITIGATION_MAX_CONCURRENCY)
+    cache = get_stride_cache() if request.use_cache else None
+    # Scoped to the client's API key, so one client's mitigations are never served to another
+    kb = get_mitigation_kb() if request.use_knowledge_base else None
+    kb = kb.scoped(request.api_keys) if kb else None
+    batch_size = request.stride_batch_size or config.STRIDE_BATCH_SIZE
+    
+    events: asyncio.Queue = asyncio.Queue()
+    pipeline = asyncio.create_task(
+        _run_pipeline(stride_agent, mitigation_agent, relationships, context, stride_concurrency, mitigation_concurrency, events, cache, carried, batch_size, request.cluster_threats, kb)
+    )
+    try:
+        async for frame in stream_events(events, request.coalesce_ms, request.pace_ms, recorder.observe):
+            yield frame
+        await pipeline
+    finally:
+        if not pipeline.done():
+            # The client went away: stop the LLM calls, searches and scrapes still in flight
+            pipeline.cancel()
+            await asyncio.gather(pipeline, return_exceptions=True)
+
+async def _save_run(run: ThreatModelRun) -> None:
+    """Saves the run in a thread, as serializing a large run would hold up the other streams on the loop."""
+    store = get_run_store()
+    if store is not None:
+        await asyncio.to_thread(store.save, run)
+
+async def _record_run(recorder: RunRecorder, frames: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+    """
+    Relays the pipeline frames and saves the run once they are done. A run stopped early (the stream
+    was closed or cancelled, or failed) is saved as interrupted, so it can be resumed incrementally.
+    """
+    try:
+        async for frame in frames:
+            yield frame
+    except BaseException:
+        recorder.interrupt()
+        await _save_run(recorder.run)
+        raise
+    finally:
+        await frames.aclose()
+    await _save_run(recorder.run)
+
 async def analyze(request: ThreatModelRequest) -> AsyncGenerator[str, None]:
     """
     Streaming endpoint that orchestrates the relationship extraction and STRIDE threat generation
     with real-time updates as each threat is identified.
     """
     # Add initial debugging info to help trace execution
-    yield f"data: {json.dumps({'type': 'debug', 'message': 'Stream started'})}\n\n"
+    yield sse({'type': 'debug', 'message': 'Stream started'})
+    # LLM and search calls of this request are queued fairly against the other requests
+    scheduler.start_flow()
+    telemetry.start_run()
     
     try:
         # Check for required API keys if provided
         if request.api_keys:
-            if not request.api_keys.get('openai_api_key'):
-                yield f"data: {json.dumps({'type': 'error', 'message': 'OpenAI API key is required'})}\n\n"
+            if error := _api_keys_error(request):
+                yield sse({'type': 'error', 'message': error})
                 return
             
             # Log that we're using client-provided keys
-            yield f"data: {json.dumps({'type': 'debug', 'message': 'Using client-provided API keys'})}\n\n"
+            yield sse({'type': 'debug', 'message': 'Using client-provided API keys'})
         
         # Step 1: Extract relationships using RelationshipAgent with API keys
-        yield f"data: {json.dumps({'type': 'status', 'message': 'Extracting relationships from diagram and description...'})}\n\n"
+        yield sse({'type': 'status', 'message': 'Extracting relationships from diagram and description...'})
         
-        relationship_agent = RelationshipAgent(api_keys=request.api_keys)
-        relationship_result = await relationship_agent.run(request.user_input)
-        
-        if not hasattr(relationship_result, 'data') or not hasattr(relationship_result.data, 'relationships'):
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Failed to extract relationships'})}\n\n"
+        extracted = await _extract_relationships(request)
+        if extracted is None:
+            yield sse({'type': 'error', 'message': 'Failed to extract relationships'})
             return
             
-        relationships = relationship_result.data.relationships
-        context = relationship_result.data.context
+        relationships = extracted.relationships
+        context = extracted.context
         
-        # Step 2: Send the extracted relationships
-        yield f"data: {json.dumps({'type': 'relationships', 'data': [pydantic_to_json(r) for r in relationships]})}\n\n"
+        # Step 2: Send the extracted relationships, with the run id to resume from if the stream is cut
+        recorder = RunRecorder(relationships, context)
+        yield sse({'type': 'relationships', 'data': [pydantic_to_json(r) for r in relationships], 'run_id': recorder.run.id})
         
         # Use context from request if provided, otherwise use context from relationship result
-        yield f"data: {json.dumps({'type': 'debug', 'message': f'Using context: {context}'})}\n\n"
+        yield sse({'type': 'debug', 'message': f'Using context: {context}'})
         
-        # Step 3: Analyze each relationship with STRIDE, passing API keys
-        stride_agent = StrideAgent(api_keys=request.api_keys)
-        all_threats = []
+        # Step 3 & 4: Identify threats and research their mitigations as a pipeline
+        yield sse({'type': 'status', 'message': f'Identifying threats for {len(relationships)} relationships and researching mitigations...'})
         
-        for i, relationship in enumerate(relationships):
-            # Notify client which relationship we're analyzing
-            yield f"data: {json.dumps({'type': 'analyzing_relationship', 'index': i, 'relationship': pydantic_to_json(relationship)})}\n\n"
-            
-            try:
-                # Process relationship and generate threats
-                result = await stride_agent.run(relationship, context)
-                
-                # For each threat in the result, stream it out
-                for threat in result.data.threats:
-                    # Add the threat to our overall collection
-                    all_threats.append(threat)
-                    
-                    # Stream this individual threat
-                    yield f"data: {json.dumps({'type': 'threat_identified', 'threat': pydantic_to_json(threat)})}\n\n"
-                    
-                    # Add a tiny delay to make the streaming visible to users
-                    await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                yield f"data: {json.dumps({'type': 'relationship_error', 'index': i, 'error': str(e)})}\n\n"
-        
-        # Step 4: Research for mitigation for each threat, passing API keys
-        yield f"data: {json.dumps({'type': 'status', 'message': f'Starting mitigation research for {len(all_threats)} threats...'})}\n\n"
-        
-        mitigation_agent = MitigationAgent(api_keys=request.api_keys)
-        for i, threat in enumerate(all_threats):
-            # Notify client which threat we're researching mitigations for
-            yield f"data: {json.dumps({'type': 'mitigation_started', 'threat_id': threat.id, 'message': f'Researching mitigation for: {threat.name}'})}\n\n"
-            
-            try:
-                # Call the mitigation agent with the threat and context
-                mitigation_result = await mitigation_agent.run(threat, context)
-                
-                # Extract mitigation content and sources from the result
-                content = "No specific mitigation found."
-                sources = []
-                
-                if hasattr(mitigation_result, 'data'):
-                    data = mitigation_result.data
-                    if hasattr(data, 'content'):
-                        content = data.content
-                    if hasattr(data, 'sources'):
-                        sources = data.sources
-                
-                # Send structured format with nested mitigation object to match client expectations
-                yield f"data: {json.dumps({
-                    'type': 'mitigation_complete', 
-                    'threat_id': threat.id, 
-                    'mitigation': {
-                        'content': content, 
-                        'sources': sources
-                    }
-                })}\n\n"
-                
-                # Small delay between mitigations
-                await asyncio.sleep(0.2)
-                
-            except Exception as e:
-                yield f"data: {json.dumps({'type': 'mitigation_error', 'threat_id': threat.id, 'error': str(e)})}\n\n"
+        # Each prompt gets the part of the context about its own components
+        compact = compact_context(context, relationships, request.compact_context)
+        # Keep the run so later edits of the design can be re-analyzed incrementally
+        async for frame in _record_run(recorder, _stream_pipeline(request, list(enumerate(relationships)), compact, recorder)):
+            yield frame
         
         # Step 5: Signal completion and return summary
-        yield f"data: {json.dumps({'type': 'process_complete', 'message': 'Threat modeling and mitigation research complete', 'total_threats': len(all_threats)})}\n\n"
+        yield sse({'type': 'process_complete', 'message': 'Threat modeling and mitigation research complete', 'total_threats': len(recorder.run.threats), 'run_id': recorder.run.id, 'metrics': telemetry.run_summary(), 'context': compact.stats()})
     
     except Exception as e:
         # Catch any top-level exceptions and report them
-        yield f"data: {json.dumps({'type': 'error', 'message': f'Stream processing error: {str(e)}'})}\n\n"
\ No newline at end of file
+        yield sse({'type': 'error', 'message': f'Stream processing error: {str(e)}'})
+
+async def analyze_incremental(request: IncrementalThreatModelRequest) -> AsyncGenerator[str, None]:
+    """
+    Streaming endpoint that re-analyzes an edited design against a previous run: STRIDE and
+    mitigation research only run for added and changed relationships, threats of unchanged
+    relationships are carried over, and threats of removed or changed relationships are retracted.
+    """
+    yield sse({'type': 'debug', 'message': 'Stream started'})
+    # LLM and search calls of this request are queued fairly against the other requests
+    scheduler.start_flow()
+    telemetry.start_run()
+    
+    try:
+        store = get_run_store()
+        previous = request.previous_run or (await asyncio.to_thread(store.get, request.previous_run_id) if store else None)
+        if previous is None:
+            yield sse({'type': 'error', 'message': f'Previous run not found: {request.previous_run_id}'})
+            return
+        
+        if request.api_keys:
+            if error := _api_keys_error(request):
+                yield sse({'type': 'error', 'message': error})
+                return
+            yield sse({'type': 'debug', 'message': 'Using client-provided API keys'})
+        
+        yield sse({'type': 'status', 'message': 'Extracting relationships from diagram and description...'})
+        
+        extracted = await _extract_relationships(request)
+        if extracted is None:
+            yield sse({'type': 'error', 'message': 'Failed to extract relationships'})
+            return
+        
+        relationships = extracted.relationships
+        context = extracted.context
+        diff = diff_relationships(previous.relationships, relationships)
+        # Edges whose analysis failed or was cut short last time have no threats to carry over, so they are retried
+        failed = set(previous.failed)
+        retried = [new for old, new in diff.unchanged if old in failed]
+        diff.unchanged = [(old, new) for old, new in diff.unchanged if old not in failed]
+        
+        recorder = RunRecorder(relationships, context)
+        yield sse({'type': 'relationships', 'data': [pydantic_to_json(r) for r in relationships], 'run_id': recorder.run.id})
+        yield sse({
+            'type': 'relationship_diff',
+            'added': diff.added,
+            'removed': diff.removed,
+            'changed': [new for _, new in diff.changed],
+            'unchanged': [new for _, new in diff.unchanged],
+        })
+        yield sse({'type': 'debug', 'message': f'Using context: {context}'})
+        
+        # Retract the threats of edges that are gone or will be re-analyzed
+        retracted = set(diff.removed) | {old for old, _ in diff.changed}
+        for item in previous.threats:
+            if item.index in retracted:
+                yield sse({'type': 'threat_removed', 'index': item.index, 'threat_id': item.threat.id})
+        
+        # Carry over the threats of unchanged edges under their new index;
+        # those whose mitigation was never completed get it researched again
+        new_index = dict(diff.unchanged)
+        carried = []
+        for item in previous.threats:
+            if item.index in new_index:
+                event = {'type': 'threat_unchanged', 'index': new_index[item.index], 'threat': pydantic_to_json(item.threat), 'mitigation': item.mitigation}
+                recorder.observe(event)
+                yield sse(event)
+                if item.mitigation is None:
+                    carried.append(item.threat)
+        
+        delta = sorted(diff.added + [new for _, new in diff.changed] + retried)
+        yield sse({'type': 'status', 'message': f'Identifying threats for {len(delta)} added, changed, previously failed or unfinished relationships out of {len(relationships)}...'})
+        
+        compact = compact_context(context, relationships, request.compact_context)
+        async for frame in _record_run(recorder, _stream_pipeline(request, [(i, relationships[i]) for i in delta], compact, recorder, carried)):
+            yield frame
+        
+        yield sse({'type': 'process_complete', 'message': 'Incremental threat modeling and mitigation research complete', 'total_threats': len(recorder.run.threats), 'run_id': recorder.run.id, 'metrics': telemetry.run_summary(), 'context': compact.stats()})
+    
+    except Exception as e:
+        yield sse({'type': 'error', 'message': f'Stream processing error: {str(e)}'})
\ No newline at end of file
@@ -1,6 +1,6 @@
 "use client"
 import { create } from "zustand";
-import { StreamResponse, isInitialResultsResponse, isMitigationStartedResponse, isMitigationCompleteResponse, isProcessCompleteResponse, isErrorResponse, isDebugResponse, isRelationshipsResponse, isAnalyzingRelationshipResponse, isThreatIdentifiedResponse, isStatusResponse } from "@/types/stream";
+import { StreamResponse, isInitialResultsResponse, isMitigationStartedResponse, isMitigationCompleteResponse, isProcessCompleteResponse, isErrorResponse, isDebugResponse, isRelationshipsResponse, isAnalyzingRelationshipResponse, isThreatIdentifiedResponse, isStatusResponse, isBatchResponse } from "@/types/stream";
 import { config } from "@/config";
 
 export interface Keys {
@@ -154,69 +154,73 @@ export const useAppStore = create<AppStore>((set, get) => ({
         for (const message of messages) {
           if (message.startsWith('data: ')) {
             try {
-              const data = JSON.parse(message.substring(6)) as StreamResponse; // Remove 'data: ' prefix
-              console.log("SSE Message:", data);
+              const parsed = JSON.parse(message.substring(6)) as StreamResponse; // Remove 'data: ' prefix
+              // Unwrap frames the server coalesced into a batch
+              const events = isBatchResponse(parsed) ? parsed.events : [parsed];
+              for (const data of events) {
+                console.log("SSE Message:", data);
               
-              // Process the data based on its type using type guards
-              if (isDebugResponse(data)) {
-                console.log("Debug:", data.message);
-              }
-              else if (isStatusResponse(data)) {
-                set({ progressMessage: data.message });
-              }
-              else if (isRelationshipsResponse(data)) {
-                // Handle extracted relationships
-                console.log("Relationships:", data.data);
-                set({ 
-                  progressMessage: `Found ${data.data.length} relationships to analyze...`
-                });
-              }
-              else if (isAnalyzingRelationshipResponse(data)) {
-                // Update progress when analyzing a relationship
-                set({ 
-                  progressMessage: `Analyzing relationship ${data.index + 1}: ${data.relationship.source} ${data.relationship.direction} ${data.relationship.target}`
-                });
-              }
-              else if (isThreatIdentifiedResponse(data)) {
-                // Add the new threat to our collection
-                const threat = {
-                  ...data.threat,
-                  researchStatus: 'pending' as const  // Change from 'complete' to 'pending'
-                };
-                allThreats.push(threat);
-                set({ threats: [...allThreats] });
-              }
-              else if (isInitialResultsResponse(data)) {
-                set({ 
-                  system_overview: data.data.system_overview,
-                  threats: data.data.threat_scenarios.map((threat) => ({
-                    ...threat,
-                    researchStatus: 'pending'
-                  })),
-                  progressMessage: "Initial threat modeling complete. Starting detailed research..."
-                });
-              }
-              else if (isMitigationStartedResponse(data)) {
-                set({ progressMessage: data.message });
-                get().updateThreatResearchStatus(data.threat_id, 'researching');
-              }
-              else if (isMitigationCompleteResponse(data)) {
-                console.log("Mitigation complete:", data);
-                get().updateThreatMitigation(data.threat_id, data.mitigation.content, data.mitigation.sources);
-                get().updateThreatResearchStatus(data.threat_id, 'complete');
-              }
-              else if (isProcessCompleteResponse(data)) {
-                set({ 
-                  isProcessing: false,
-                  progressMessage: data.message + " - " + data.total_threats
-                });
-              }
-              else if (isErrorResponse(data)) {
-                console.error("Server error:", data.message);
-                set({ 
-                  progressMessage: `Error: ${data.message}`,
-                  isProcessing: false
-                });
+                // Process the data based on its type using type guards
+                if (isDebugResponse(data)) {
+                  console.log("Debug:", data.message);
+                }
+                else if (isStatusResponse(data)) {
+                  set({ progressMessage: data.message });
+                }
+                else if (isRelationshipsResponse(data)) {
+                  // Handle extracted relationships
+                  console.log("Relationships:", data.data);
+                  set({ 
+                    progressMessage: `Found ${data.data.length} relationships to analyze...`
+                  });
+                }
+                else if (isAnalyzingRelationshipResponse(data)) {
+                  // Update progress when analyzing a relationship
+                  set({ 
+                    progressMessage: `Analyzing relationship ${data.index + 1}: ${data.relationship.source} ${data.relationship.direction} ${data.relationship.target}`
+                  });
+                }
+                else if (isThreatIdentifiedResponse(data)) {
+                  // Add the new threat to our collection
+                  const threat = {
+                    ...data.threat,
+                    researchStatus: 'pending' as const  // Change from 'complete' to 'pending'
+                  };
+                  allThreats.push(threat);
+                  set({ threats: [...allThreats] });
+                }
+                else if (isInitialResultsResponse(data)) {
+                  set({ 
+                    system_overview: data.data.system_overview,
+                    threats: data.data.threat_scenarios.map((threat) => ({
+                      ...threat,
+                      researchStatus: 'pending'
+                    })),
+                    progressMessage: "Initial threat modeling complete. Starting detailed research..."
+                  });
+                }
+                else if (isMitigationStartedResponse(data)) {
+                  set({ progressMessage: data.message });
+                  get().updateThreatResearchStatus(data.threat_id, 'researching');
+                }
+                else if (isMitigationCompleteResponse(data)) {
+                  console.log("Mitigation complete:", data);
+                  get().updateThreatMitigation(data.threat_id, data.mitigation.content, data.mitigation.sources);
+                  get().updateThreatResearchStatus(data.threat_id, 'complete');
+                }
+                else if (isProcessCompleteResponse(data)) {
+                  set({ 
+                    isProcessing: false,
+                    progressMessage: data.message + " - " + data.total_threats
+                  });
+                }
+                else if (isErrorResponse(data)) {
+                  console.error("Server error:", data.message);
+                  set({ 
+                    progressMessage: `Error: ${data.message}`,
+                    isProcessing: false
+                  });
+                }
               }
             } catch (e) {
               console.error("Error parsing SSE message:", e, message);
@@ -0,0 +1,59 @@
+from api.agents.relationship import Relationship
+from api.config import config
+from api.services import context as compaction
+from api.services.context import compact_context
+
+RELATIONSHIPS = [
+    Relationship(source="Web App", target="API", direction="→"),
+    Relationship(source="API", target="Billing DB", direction="→"),
+]
+
+
+def design(repeats):
+    sentences = []
+    for i in range(repeats):
+        sentences += [
+            f"The Web App renders page {i} for customers.",
+            f"The API validates request {i} before routing it.",
+            f"The Billing DB stores invoice table {i}.",
+            f"Office plants are watered on day {i}.",
+            f"Admin users must authenticate with a session token for report {i}.",
+        ]
+    return " ".join(sentences)
+
+
+def test_short_contexts_are_kept_whole():
+    text = design(1)
+    compact = compact_context(text, RELATIONSHIPS)
+    assert not compact.compacted
+    assert compact.prompt(RELATIONSHIPS[:1]) == text
+
+
+def test_compaction_stays_within_the_budgets(monkeypatch):
+    monkeypatch.setattr(config, "CONTEXT_COMPACT_MIN_TOKENS", 100)
+    monkeypatch.setattr(config, "CONTEXT_SUMMARY_TOKENS", 60)
+    monkeypatch.setattr(config, "CONTEXT_COMPONENT_TOKENS", 40)
+    text = design(40)
+    compact = compact_context(text, RELATIONSHIPS)
+
+    assert compact.compacted
+    assert compaction._tokens(compact.summary) <= 60
+    for name in ("web app", "api", "billing db"):
+        assert compact.slices[name]
+        assert sum(compaction._tokens(s) for s in compact.slices[name]) <= 40
+    # Sentences with security terms are picked first, the others only fill what is left
+    assert compact.summary.count("Admin users must authenticate") == 3
+    assert compact.summary.count("plants") <= 1
+
+    prompt = compact.prompt(RELATIONSHIPS[:1])
+    assert "Web App renders page 0" in prompt and "API validates request 0" in prompt
+    assert "Billing DB" not in prompt
+    stats = compact.stats()
+    assert stats["prompts"] == 1 and stats["tokens_sent"] < stats["original_tokens"] // 4
+    assert stats["tokens_saved"] == stats["original_tokens"] - stats["tokens_sent"]
+
+
+def test_disabled_compaction_keeps_the_context(monkeypatch):
+    monkeypatch.setattr(config, "CONTEXT_COMPACT_MIN_TOKENS", 10)
+    text = design(40)
+    assert compact_context(text, RELATIONSHIPS, enabled=False).prompt(RELATIONSHIPS) == text
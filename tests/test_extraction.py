@@ -0,0 +1,39 @@
+import http.server
+import threading
+import pytest
+from api.benchmarks import extraction
+from api.config import config
+
+PAGE = "<html><head><title>SSRF</title></head><body><main><h1>SSRF</h1><p>Allow-list outbound hosts.</p></main></body></html>"
+
+
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = PAGE.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def page_server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_fetch_corpus_saves_the_reference_pages(tmp_path, monkeypatch, page_server):
+    monkeypatch.setattr(config, "PAGE_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "LOCAL_SEARCH_ENABLED", False)
+    monkeypatch.setattr(extraction, "REFERENCE_PAGES", [f"{page_server}/ssrf.html"])
+    extraction.fetch_corpus(str(tmp_path))
+
+    saved = (tmp_path / "00.html").read_text(encoding="utf-8")
+    assert saved == f"<!-- {page_server}/ssrf.html -->\n{PAGE}"
+    assert extraction.load_corpus(str(tmp_path))[0][1].endswith(PAGE)
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from types import SimpleNamespace
+from api.agents.relationship import Relationship
+from api.agents.stride import Threat, Threats
+from api.services import tm
+from api.services.runs import RunThreat, ThreatModelRun
+
+
+def threat(relationship, threat_id):
+    return Threat(
+        id=threat_id, category="Spoofing", name=f"{relationship.source} spoofed", scope=relationship, impacts="i",
+        threat="t", attack_vectors="a", prerequisites="p", severity="High", likelihood="Low",
+    )
+
+
+class StubStride:
+    analyzed = []
+
+    def __init__(self, api_keys=None):
+        pass
+
+    async def run(self, relationship, context):
+        StubStride.analyzed.append((relationship.source, relationship.target))
+        return SimpleNamespace(data=Threats(threats=[threat(relationship, f"new-{relationship.source}")]))
+
+
+class StubMitigation:
+    def __init__(self, api_keys=None):
+        pass
+
+    async def run(self, threat, context):
+        return SimpleNamespace(data=SimpleNamespace(content=f"fix {threat.id}", sources=[]))
+
+
+def test_incremental_run_only_analyzes_the_edited_edges(monkeypatch):
+    monkeypatch.setattr(tm, "StrideAgent", StubStride)
+    monkeypatch.setattr(tm, "MitigationAgent", StubMitigation)
+    monkeypatch.setattr(tm, "get_run_store", lambda: None)
+    StubStride.analyzed = []
+
+    old = [
+        Relationship(source="A", target="B", direction="→", description="login"),
+        Relationship(source="B", target="C", direction="→", description="query"),
+        Relationship(source="C", target="D", direction="→", description="backup"),
+    ]
+    previous = ThreatModelRun(
+        relationships=old,
+        threats=[RunThreat(index=i, threat=threat(r, f"old-{r.source}"), mitigation={"content": "fix", "sources": []}) for i, r in enumerate(old)],
+    )
+    # A→B is kept, B→C gets a new label, C→D is dropped and D→E is new
+    request = tm.IncrementalThreatModelRequest(
+        user_input="graph LR\nA -->|login| B\nB -->|query and update| C\nD -->|export| E",
+        previous_run=previous, relationship_mode="fast", use_cache=False, use_knowledge_base=False, cluster_threats=False,
+    )
+
+    async def collect():
+        return [json.loads(frame[len("data: "):]) async for frame in tm.analyze_incremental(request)]
+
+    events = asyncio.run(collect())
+    by_type = {}
+    for event in events:
+        by_type.setdefault(event["type"], []).append(event)
+
+    diff = by_type["relationship_diff"][0]
+    assert (diff["added"], diff["removed"], diff["changed"], diff["unchanged"]) == ([2], [2], [1], [0])
+    assert sorted(e["threat_id"] for e in by_type["threat_removed"]) == ["old-B", "old-C"]
+    [unchanged] = by_type["threat_unchanged"]
+    assert (unchanged["index"], unchanged["threat"]["id"], unchanged["mitigation"]) == (0, "old-A", {"content": "fix", "sources": []})
+    assert sorted(StubStride.analyzed) == [("B", "C"), ("D", "E")]
+    assert sorted(e["threat"]["id"] for e in by_type["threat_identified"]) == ["new-B", "new-D"]
+    assert by_type["process_complete"][0]["total_threats"] == 3
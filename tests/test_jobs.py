@@ -0,0 +1,31 @@
+import asyncio
+from api.config import config
+from api.services import jobs
+from api.services.events import sse
+from api.services.jobs import EventLog, JobManager, frame_events
+
+
+def test_stream_gets_the_events_logged_while_the_job_finished(tmp_path):
+    async def analysis():
+        yield sse({'type': 'status', 'message': 'started'})
+        await asyncio.sleep(0.01)
+        yield sse({'type': 'process_complete', 'message': 'done'})
+
+    async def run():
+        manager = JobManager(EventLog(str(tmp_path / "jobs.sqlite"), ttl=3600))
+        job_id = manager.start(analysis)
+        events = []
+        async for frame in manager.stream(job_id):
+            events += frame_events(frame)
+            # The job logs its last event and leaves `_live` while the client handles this one
+            await asyncio.sleep(0.05)
+        return events
+
+    assert [event['type'] for event in asyncio.run(run())] == ['status', 'process_complete']
+
+
+def test_unwritable_cache_dir_disables_jobs(tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "file" / "cache"))
+    monkeypatch.setattr(jobs, "_job_manager", None)
+    assert jobs.get_job_manager() is None
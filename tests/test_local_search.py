@@ -0,0 +1,28 @@
+from api.agents.tools.local_search import LocalDocument, LocalIndex
+
+
+def make_index(tmp_path):
+    index = LocalIndex(str(tmp_path / "index.sqlite"))
+    for url in ("https://owasp.org/ssrf", "https://cheatsheetseries.owasp.org/ssrf", "https://evilowasp.org/ssrf", "https://docs.web.dev/ssrf"):
+        index.add(LocalDocument(url=url, title="SSRF", content="Server side request forgery prevention"))
+    return index
+
+
+def test_site_matches_the_domain_and_its_subdomains(tmp_path):
+    index = make_index(tmp_path)
+    links = {item["link"] for item in index.search("request forgery", "owasp.org", 10).items}
+    assert links == {"https://owasp.org/ssrf", "https://cheatsheetseries.owasp.org/ssrf"}
+
+
+def test_site_is_matched_literally(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search("request forgery", "w_b.dev", 10).items == []
+    assert index.search("request forgery", "%.dev", 10).items == []
+
+
+def test_record_counts_hits_and_fallbacks(tmp_path):
+    index = make_index(tmp_path)
+    index.record(True)
+    index.record(False)
+    index.record(False)
+    assert index.stats() == {"hits": 1, "fallbacks": 2, "documents": 4}
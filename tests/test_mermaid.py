@@ -0,0 +1,48 @@
+from api.services import mermaid
+
+
+def edges(text):
+    return [(r.source, r.target, r.direction, r.description) for r in mermaid.parse(text).relationships]
+
+
+def test_ampersand_groups_expand_to_every_pair():
+    assert edges("graph LR\nA & B --> C & D") == [
+        ("A", "C", "→", None), ("A", "D", "→", None), ("B", "C", "→", None), ("B", "D", "→", None),
+    ]
+
+
+def test_text_links():
+    text = "flowchart TD\nA -- sends token --> B\nB -. audit log .-> C\nC == sync ==> D"
+    assert edges(text) == [
+        ("A", "B", "→", "sends token"), ("B", "C", "→", "audit log"), ("C", "D", "→", "sync"),
+    ]
+
+
+def test_quoted_labels_class_suffixes_and_semicolons():
+    text = 'graph LR\nweb["Web App (SPA)"]:::frontend --> api[API];api -->|"reads; writes"| db[(Users DB)]'
+    parsed = mermaid.parse(text)
+    assert edges(text) == [
+        ("Web App (SPA)", "API", "→", None), ("API", "Users DB", "→", "reads; writes"),
+    ]
+    assert parsed.components == ["Web App (SPA)", "API", "Users DB"]
+
+
+def test_sequence_diagram_aliases():
+    text = "sequenceDiagram\nparticipant U as User\nactor A as Auth Service\nU->>A: login\nA-->>U: token\nNote over U,A: TLS"
+    parsed = mermaid.parse(text)
+    assert edges(text) == [("User", "Auth Service", "→", "login"), ("Auth Service", "User", "→", "token")]
+    assert parsed.components == ["User", "Auth Service"]
+
+
+def test_repeated_edges_are_merged():
+    text = "graph LR\nA -->|read| B\nA -->|write| B\nA -->|read| B\nB <--> A"
+    assert edges(text) == [("A", "B", "→", "read; write"), ("B", "A", "↔", None)]
+
+
+def test_bad_statements_are_counted_as_skipped():
+    text = "```mermaid\ngraph LR\nA --> B\nC[unclosed --> D\nE --> ???\nsubgraph cloud\nend\n```\nSome prose."
+    parsed = mermaid.parse(text)
+    assert edges(text) == [("A", "B", "→", None)]
+    assert parsed.skipped == 2
+    assert parsed.diagrams == 1
+    assert parsed.prose == "Some prose."
@@ -0,0 +1,77 @@
+from api.agents.stride import Threat
+from api.config import config
+from api.services import mitigation_kb
+from api.services.mitigation_kb import MitigationKnowledgeBase, _adapt
+
+
+def make_threat(name, attack_vectors, category="Tampering", source="Orders Service", target="Billing Service"):
+    return Threat(
+        id="t1", name=name, category=category, threat="t", impacts="i", severity="High", likelihood="High",
+        attack_vectors=attack_vectors, prerequisites="p",
+        scope={"source": source, "target": target, "direction": "->", "description": "d"},
+    )
+
+
+def test_adapt_renames_components_in_one_pass():
+    content = "Sign requests from Orders Service and verify them in Billing Service."
+    adapted = _adapt(content, ("Orders Service", "Billing Service"), ("Cart", "Ledger"))
+    assert adapted == "Sign requests from Cart and verify them in Ledger."
+
+
+def test_adapt_takes_names_literally():
+    content = r"Restrict CORP\svc to the orders queue."
+    assert _adapt(content, (r"CORP\svc", "Orders DB"), (r"CORP\new\1", "Orders DB")) == r"Restrict CORP\new\1 to the orders queue."
+
+
+def test_adapt_keeps_swapped_components():
+    content = "Restrict Orders Service to Billing Service calls."
+    assert _adapt(content, ("Orders Service", "Billing Service"), ("Billing Service", "Orders Service")) == content
+
+
+def test_adapt_keeps_generic_names():
+    content = "Use an API gateway in front of the API."
+    assert _adapt(content, ("Web", "API"), ("Mobile App", "Payments Service")) == content
+
+
+def test_adapt_only_matches_whole_names():
+    content = "Orders Services and Orders Service differ."
+    assert _adapt(content, ("Orders Service", "X Store"), ("Cart", "Y Store")) == "Orders Services and Cart differ."
+
+
+def test_similar_threat_reuses_stored_mitigation(tmp_path):
+    kb = MitigationKnowledgeBase(str(tmp_path / "kb.sqlite"), threshold=0.75, ttl=3600, max_entries=10)
+    kb.put(make_threat("JWT signature bypass with alg none", "Attacker forges token with alg none header"),
+           "Orders Service must reject alg none.", ["https://owasp.org"])
+
+    found = kb.get(make_threat("JWT signature bypass with alg none", "Attacker forges token with alg none header",
+                               source="Cart", target="Ledger"))
+    assert found is not None
+    assert found.content == "Cart must reject alg none."
+    assert found.similarity == 1.0
+
+
+def test_dissimilar_or_other_category_threats_are_researched(tmp_path):
+    kb = MitigationKnowledgeBase(str(tmp_path / "kb.sqlite"), threshold=0.75, ttl=3600, max_entries=10)
+    kb.put(make_threat("JWT signature bypass with alg none", "Attacker forges token with alg none header"), "c", [])
+
+    assert kb.get(make_threat("JWT signature bypass", "Attacker replays a stolen refresh token")) is None
+    assert kb.get(make_threat("JWT signature bypass with alg none", "Attacker forges token with alg none header",
+                              category="Spoofing")) is None
+
+
+def test_mitigations_are_only_reused_within_their_scope(tmp_path):
+    kb = MitigationKnowledgeBase(str(tmp_path / "kb.sqlite"), threshold=0.75, ttl=3600, max_entries=10)
+    threat = make_threat("JWT signature bypass with alg none", "Attacker forges token with alg none header")
+    kb.scoped({"openai_api_key": "sk-first"}).put(threat, "c", [])
+
+    assert kb.scoped({"openai_api_key": "sk-first"}).get(threat) is not None
+    assert kb.scoped({"openai_api_key": "sk-second"}).get(threat) is None
+    assert kb.scoped(None).get(threat) is None
+
+
+def test_unwritable_cache_dir_disables_the_knowledge_base(tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "file" / "cache"))
+    monkeypatch.setattr(config, "MITIGATION_KB_ENABLED", True)
+    monkeypatch.setattr(mitigation_kb, "_mitigation_kb", None)
+    assert mitigation_kb.get_mitigation_kb() is None
@@ -0,0 +1,26 @@
+from api.agents.tools import page_cache
+from api.agents.tools.page_cache import PageCache
+from api.agents.tools.web_scraper import WebScraperTool
+from api.config import config
+
+
+def test_lookups_count_hits_and_misses(tmp_path):
+    cache = PageCache(str(tmp_path / "pages.sqlite"), ttl=3600, max_bytes=10_000)
+    assert cache.get("https://owasp.org/a", True) is None
+    cache.put("https://owasp.org/a", True, "# A", {"title": "A", "domain": "owasp.org"})
+    assert cache.get("https://owasp.org/a#top", True).content == "# A"
+
+    cache.ttl = 0
+    assert cache.get("https://owasp.org/a", True) is not None
+    cache.mark_revalidated("https://owasp.org/a", True)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_unwritable_cache_dir_disables_the_cache(tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "file" / "cache"))
+    monkeypatch.setattr(page_cache, "_page_cache", None)
+    assert page_cache.get_page_cache() is None
+    assert WebScraperTool().cache is None
@@ -0,0 +1,61 @@
+from api.agents.tools.passages import Passage, rank_passages, split_passages, top_passages
+
+PAGE = """# Session tokens
+
+A session token is signed, and the token expires after an hour.
+
+# Token replay
+
+An attacker who captures a session token can replay it. Bind tokens to the client and rotate them to stop replay.
+
+# Logging
+
+Requests are logged with their status code.
+
+# Replay detection
+
+Nonces make a replayed request detectable.
+"""
+
+
+def test_split_passages_follows_headings_and_offsets():
+    passages = split_passages(PAGE)
+    assert [p.heading for p in passages] == ["Session tokens", "Token replay", "Logging", "Replay detection"]
+    for passage in passages:
+        assert PAGE[passage.start:passage.end] == passage.text
+
+
+def test_long_blocks_are_cut_at_line_breaks():
+    markdown = "\n".join(f"- item {i} of the list" for i in range(100))
+    passages = split_passages(markdown, target_chars=200, max_chars=300)
+    assert len(passages) > 1
+    assert all(len(p.text) <= 300 and p.text.startswith("- item") for p in passages)
+
+
+def test_rank_passages_orders_by_relevance():
+    ranked = rank_passages(split_passages(PAGE), "token replay")
+    assert [p.heading for p in ranked] == ["Token replay", "Session tokens", "Replay detection", "Logging"]
+    assert ranked[0].score > ranked[1].score > 0
+    assert ranked[-1].score == 0
+
+
+def test_ties_keep_page_order():
+    passages = [Passage(text="nothing relevant", start=10, end=26), Passage(text="nothing relevant", start=0, end=16)]
+    assert [p.start for p in rank_passages(passages, "replay")] == [0, 10]
+
+
+def test_top_passages_respects_the_budget_and_returns_page_order():
+    kept = top_passages(PAGE, "token replay", max_passages=2)
+    assert [p.heading for p in kept] == ["Session tokens", "Token replay"]
+    # The best passage alone is over the character budget, the next ones fit
+    kept = top_passages(PAGE, "token replay", max_chars=110)
+    assert [p.heading for p in kept] == ["Session tokens", "Replay detection"]
+    assert sum(len(p.text) for p in kept) <= 110
+    # Nothing fits: the beginning of the best passage is kept
+    [kept] = top_passages(PAGE, "token replay", max_chars=40)
+    assert kept.heading == "Token replay" and len(kept.text) == 40 and PAGE[kept.start:kept.end] == kept.text
+
+
+def test_top_passages_without_a_match_starts_at_the_top():
+    kept = top_passages(PAGE, "kubernetes", max_passages=2)
+    assert [p.heading for p in kept] == ["Session tokens", "Token replay"]
@@ -0,0 +1,9 @@
+from api.config import config
+from api.services import runs
+
+
+def test_unwritable_cache_dir_disables_the_run_store(tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "file" / "cache"))
+    monkeypatch.setattr(runs, "_run_store", None)
+    assert runs.get_run_store() is None
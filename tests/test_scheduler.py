@@ -0,0 +1,38 @@
+import asyncio
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+from api.agents import scheduler
+from api.agents.scheduler import RetryLater, ScheduledModel, Scheduler
+from api.config import config
+
+
+def test_every_model_request_is_scheduled_and_retried_alone(monkeypatch):
+    monkeypatch.setattr(config, "SCHEDULER_BASE_DELAY", 0.01)
+    monkeypatch.setattr(scheduler, "_scheduler", Scheduler({"openai": (1e9, 0)}))
+    requests, searches = [], []
+
+    def respond(messages, info):
+        requests.append(len(messages))
+        if len(messages) == 1:
+            return ModelResponse(parts=[ToolCallPart(tool_name="search", args={"query": "jwt"})])
+        if len(requests) == 2:
+            raise RetryLater("rate limited", retry_after=0)
+        return ModelResponse(parts=[TextPart("done")])
+
+    agent = Agent()
+
+    @agent.tool_plain
+    def search(query: str) -> str:
+        searches.append(query)
+        return "results"
+
+    model = ScheduledModel(FunctionModel(respond), "key")
+    result = asyncio.run(agent.run("research", model=model))
+
+    assert result.data == "done"
+    # The tool call made before the rate limited request isn't made again
+    assert searches == ["jwt"]
+    assert requests == [1, 3, 3]
+    assert scheduler.get_scheduler().stats()["providers"]["openai"]["granted"] == 3
+    assert scheduler.get_scheduler().retries == 1
@@ -0,0 +1,47 @@
+from api.agents.relationship import Relationship
+from api.agents.stride import Threat
+from api.config import config
+from api.services.similarity import ThreatClusters, shingles
+
+
+def threat(threat_id, source, target, name, attack_vectors, category="Tampering"):
+    return Threat(
+        id=threat_id, category=category, name=name, attack_vectors=attack_vectors,
+        scope=Relationship(source=source, target=target, direction="→"),
+        impacts="i", threat="t", prerequisites="p", severity="High", likelihood="Medium",
+    )
+
+
+def test_component_names_do_not_count_towards_similarity():
+    first = threat("1", "Web App", "API", "TLS downgrade between Web App and API", "Strip TLS on the API link")
+    second = threat("2", "Mobile Client", "Gateway", "TLS downgrade between Mobile Client and Gateway", "Strip TLS on the Gateway link")
+    assert shingles(first) == shingles(second)
+
+
+def test_near_duplicate_threats_share_a_cluster():
+    clusters = ThreatClusters(config.MITIGATION_CLUSTER_THRESHOLD)
+    downgrades = [
+        threat("1", "Web App", "API", "TLS downgrade / MITM on Web App to API", "Attacker on the network strips TLS and intercepts traffic"),
+        threat("2", "API", "Auth Service", "TLS downgrade / MITM on API to Auth Service", "Attacker on the network strips TLS and intercepts traffic"),
+        threat("3", "Worker", "Queue", "TLS downgrade / MITM on Worker to Queue", "Attacker on the network strips TLS and intercepts the traffic"),
+    ]
+    injection = threat("4", "API", "Database", "SQL injection", "Crafted query parameters alter the SQL statements")
+    # Same wording as the downgrades, but a different STRIDE category
+    disclosure = threat("5", "Web App", "CDN", "TLS downgrade / MITM on Web App to CDN", "Attacker on the network strips TLS and intercepts traffic", "Information Disclosure")
+
+    found = [clusters.add(t) for t in downgrades + [injection, disclosure]]
+
+    assert found[0] is found[1] is found[2]
+    assert [t.id for t in found[0].members] == ["1", "2", "3"]
+    assert found[0].representative.id == "1"
+    assert found[3] is not found[0] and found[3].members == [injection]
+    assert found[4] is not found[0] and found[4].members == [disclosure]
+    assert clusters.stats() == {"threats": 5, "clusters": 3}
+
+
+def test_discarded_clusters_stop_matching():
+    clusters = ThreatClusters(config.MITIGATION_CLUSTER_THRESHOLD)
+    first = clusters.add(threat("1", "A", "B", "Replay of session tokens", "Captured tokens are replayed"))
+    clusters.discard(first)
+    second = clusters.add(threat("2", "C", "D", "Replay of session tokens", "Captured tokens are replayed"))
+    assert second is not first and second.representative.id == "2"
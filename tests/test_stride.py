@@ -0,0 +1,33 @@
+import asyncio
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+from api.agents.relationship import Relationship
+from api.agents.stride import StrideAgent
+
+
+def answer(messages, info):
+    # Like the model, every batch numbers its threats from T1
+    prompt = messages[-1].parts[-1].content
+    indices = [i for i in range(4) if f"[{i}]" in prompt]
+    threat = {
+        "id": "T1", "category": "Spoofing", "name": "Token replay", "impacts": "i", "threat": "t",
+        "attack_vectors": "a", "prerequisites": "p", "severity": "High", "likelihood": "Low",
+        "scope": {"source": "x", "target": "y", "direction": "->"},
+    }
+    results = [{"index": i, "threats": [threat]} for i in indices]
+    return ModelResponse(parts=[ToolCallPart(tool_name=info.result_tools[0].name, args={"results": results})])
+
+
+def test_batch_threat_ids_are_unique_across_batches():
+    agent = StrideAgent(api_keys={"openai_api_key": "sk-test"})
+    relationships = [(i, Relationship(source=f"s{i}", target=f"t{i}", direction="->")) for i in range(4)]
+
+    async def run():
+        with agent.batch_agent.override(model=FunctionModel(answer)):
+            return await asyncio.gather(agent.run_batch(relationships[:2], ""), agent.run_batch(relationships[2:], ""))
+
+    found = {index: threats for batch in asyncio.run(run()) for index, threats in batch.items()}
+    assert sorted(found) == [0, 1, 2, 3]
+    ids = [threat.id for threats in found.values() for threat in threats.threats]
+    assert len(set(ids)) == 4
+    assert found[2].threats[0].scope.source == "s2"
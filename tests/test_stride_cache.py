@@ -0,0 +1,10 @@
+from api.config import config
+from api.services import stride_cache
+
+
+def test_unwritable_cache_dir_disables_the_cache(tmp_path, monkeypatch):
+    (tmp_path / "file").write_text("")
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "file" / "cache"))
+    monkeypatch.setattr(config, "STRIDE_CACHE_ENABLED", True)
+    monkeypatch.setattr(stride_cache, "_stride_cache", None)
+    assert stride_cache.get_stride_cache() is None
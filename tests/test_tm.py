@@ -0,0 +1,14 @@
+import asyncio
+from api.services import tm
+
+
+def test_stride_slots_follow_the_event_loop():
+    async def slots():
+        semaphore = tm._process_stride_slots()
+        assert tm._process_stride_slots() is semaphore
+        # Holding a slot must work on every loop, not only the first one that used it
+        async with semaphore:
+            await asyncio.sleep(0)
+        return semaphore
+
+    assert asyncio.run(slots()) is not asyncio.run(slots())
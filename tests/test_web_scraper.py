@@ -0,0 +1,52 @@
+import httpx
+from api.agents.tools.web_scraper import FetchedPage, _PageReader
+
+
+def read(reader, chunks):
+    for chunk in chunks:
+        if not reader.feed(chunk):
+            break
+    return reader.finish(FetchedPage(status_code=200, headers=httpx.Headers()))
+
+
+def test_page_of_exactly_the_cap_is_not_truncated():
+    page = read(_PageReader(max_bytes=8), [b"1234", b"5678"])
+    assert not page.truncated
+    assert page.text == "12345678"
+
+
+def test_bytes_past_the_cap_truncate_the_page():
+    reader = _PageReader(max_bytes=8)
+    assert reader.feed(b"12345678")
+    assert not reader.feed(b"9")
+    page = reader.finish(FetchedPage(status_code=200, headers=httpx.Headers()))
+    assert page.truncated
+    assert page.text == "12345678"
+
+
+def test_header_charset_decodes_each_chunk():
+    page = read(_PageReader(max_bytes=100, charset="windows-1252"), [b"<p>caf", b"\xe9 cr\xe8me</p>"])
+    assert page.text == "<p>café crème</p>"
+    assert page.size == 17
+
+
+def test_characters_split_across_chunks_are_decoded_whole():
+    page = read(_PageReader(max_bytes=100, charset="utf-8"), [b"caf\xc3", b"\xa9"])
+    assert page.text == "café"
+
+
+def test_meta_charset_is_sniffed_without_a_header_charset():
+    body = b'<html><head><meta charset="iso-8859-1"></head><body>' + b"x" * 2000 + b"<p>\xe9t\xe9</p></body></html>"
+    chunks = [body[i:i + 100] for i in range(0, len(body), 100)]
+    page = read(_PageReader(max_bytes=10_000), chunks)
+    assert page.charset == "iso-8859-1"
+    assert page.text.endswith("<p>été</p></body></html>")
+
+    short = read(_PageReader(max_bytes=10_000), [b"<meta charset='iso-8859-1'><p>", b"\xe9t\xe9</p>"])
+    assert short.text.endswith("<p>été</p>")
+
+
+def test_unknown_charset_falls_back_to_utf8():
+    page = read(_PageReader(max_bytes=100, charset="no-such-charset"), ["café".encode("utf-8")])
+    assert page.charset == "utf-8"
+    assert page.text == "café"
@@ -41,6 +41,7 @@ export interface RelationshipsStreamResponse extends BaseStreamResponse {
     direction: string;
     description: string;
   }>;
+  run_id?: string; // Id of the run, to resume it incrementally if the stream is cut
 }
 
 // Current relationship being analyzed
@@ -58,7 +59,9 @@ export interface AnalyzingRelationshipStreamResponse extends BaseStreamResponse
 // New threat identified
 export interface ThreatIdentifiedStreamResponse extends BaseStreamResponse {
   type: "threat_identified";
+  index: number; // index of the relationship this threat came from
   threat: Threat;
+  cached?: boolean; // served from the server's STRIDE cache without an LLM call
 }
 
 // Research started notification
@@ -83,6 +86,12 @@ export interface MitigationCompleteStreamResponse extends BaseStreamResponse {
     content: string;
     sources: string[];
   };
+  shared_from?: string; // Id of the near-duplicate threat this mitigation was researched for
+  reused?: {
+    // Mitigation of a similar threat researched in an earlier run
+    threat_name: string;
+    similarity: number;
+  };
 }
 
 // Process complete notification
@@ -90,6 +99,66 @@ export interface ProcessCompleteStreamResponse extends BaseStreamResponse {
   type: "process_complete";
   message: string;
   total_threats?: number; // Optional for compatibility with both endpoints
+  run_id?: string; // Id to pass as previous_run_id to the incremental endpoint
+  metrics?: RunMetrics; // Time, tokens, retries, cache hits and bytes per pipeline stage
+  context?: ContextMetrics; // Estimated tokens the context compaction saved
+}
+
+// Estimated context tokens of the STRIDE and mitigation prompts of a run
+export interface ContextMetrics {
+  compacted: boolean;
+  original_tokens: number;
+  summary_tokens: number;
+  prompts: number;
+  tokens_sent: number;
+  tokens_saved: number;
+}
+
+// Totals of one pipeline stage over a run
+export interface StageMetrics {
+  calls: number;
+  errors: number;
+  seconds: number;
+  max_seconds: number;
+  input_tokens?: number;
+  output_tokens?: number;
+  retries?: number;
+  queue_seconds?: number;
+  cache_hits?: number;
+  cache_misses?: number;
+  bytes?: number;
+}
+
+export interface RunMetrics {
+  elapsed_seconds: number;
+  stages: Record<string, StageMetrics>;
+}
+
+// How the relationships map onto the previous run (incremental endpoint)
+export interface RelationshipDiffStreamResponse extends BaseStreamResponse {
+  type: "relationship_diff";
+  added: number[]; // new relationship indices
+  removed: number[]; // previous relationship indices
+  changed: number[]; // new relationship indices
+  unchanged: number[]; // new relationship indices
+}
+
+// Threat of the previous run retracted because its relationship was removed or changed
+export interface ThreatRemovedStreamResponse extends BaseStreamResponse {
+  type: "threat_removed";
+  index: number; // index of the relationship in the previous run
+  threat_id: string;
+}
+
+// Threat of the previous run carried over for an unchanged relationship
+export interface ThreatUnchangedStreamResponse extends BaseStreamResponse {
+  type: "threat_unchanged";
+  index: number; // index of the relationship in the new run
+  threat: Threat;
+  mitigation: {
+    content: string;
+    sources: string[];
+  } | null;
 }
 
 // Union type of all possible stream responses
@@ -104,7 +173,17 @@ export type StreamResponse =
   | MitigationStartedStreamResponse
   | MitigationErrorStreamResponse
   | MitigationCompleteStreamResponse
-  | ProcessCompleteStreamResponse;
+  | ProcessCompleteStreamResponse
+  | RelationshipDiffStreamResponse
+  | ThreatRemovedStreamResponse
+  | ThreatUnchangedStreamResponse
+  | BatchStreamResponse;
+
+// Several events coalesced by the server into a single frame
+export interface BatchStreamResponse extends BaseStreamResponse {
+  type: "batch";
+  events: StreamResponse[];
+}
 
 // Type guard functions to help with type narrowing
 export const isDebugResponse = (response: StreamResponse): response is DebugStreamResponse => 
@@ -140,3 +219,5 @@ export const isMitigationCompleteResponse = (response: StreamResponse): response
 export const isProcessCompleteResponse = (response: StreamResponse): response is ProcessCompleteStreamResponse => 
   response.type === "process_complete"; 
 
+export const isBatchResponse = (response: StreamResponse): response is BatchStreamResponse => 
+  response.type === "batch";